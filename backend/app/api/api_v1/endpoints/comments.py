@@ -1,25 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
     crud,  # ユーザー作成のロジックを含む関数をインポート
     schemas,  # 作成したPydanticモデルをインポート
 )
 from app.api import deps  # 作成した依存性をインポート
+from app.db.query_budget import query_budget
 
 router = APIRouter()
 
 
 @router.patch("/{comment_id}", response_model=schemas.CommentResponse)
+@query_budget(1)
 async def update_comment_endpoint(
-    comment_id: str, comment: schemas.CommentUpdate, db: Session = Depends(deps.get_db)
+    comment_id: schemas.UUIDStr,
+    comment: schemas.CommentUpdate,
+    db: AsyncSession = Depends(deps.get_db),
 ) -> schemas.CommentResponse:
     """コメントを更新するエンドポイント
 
     Args:
         comment_id (str): 更新するコメントのID
         comment (schemas.CommentUpdate): 更新するコメントの情報
-        db (Session, optional): DBセッション. Defaults to Depends(get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: コメントが見つからない場合に発生
@@ -28,25 +32,24 @@ async def update_comment_endpoint(
         CommentResponse: 更新されたコメントの情報
     """
 
-    # コメントが存在するか確認
-    db_comment = crud.get_comment_by_id(db, comment_id=comment_id)
-    if not db_comment:
+    # 更新対象の行がなければNoneが返る
+    updated_comment = await crud.update_comment(db, comment_id, comment)
+    if updated_comment is None:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    updated_comment = crud.update_comment(db, comment_id, comment)
-
     return updated_comment
 
 
 @router.delete("/{comment_id}", response_model=schemas.CommentResponse)
+@query_budget(2)
 async def delete_comment_endpoint(
-    comment_id: str, db: Session = Depends(deps.get_db)
+    comment_id: schemas.UUIDStr, db: AsyncSession = Depends(deps.get_db)
 ) -> schemas.CommentResponse:
     """コメントを削除するエンドポイント
 
     Args:
         comment_id (str): 削除するコメントのID
-        db (Session, optional): DBセッション. Defaults to Depends(get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: コメントが見つからない場合に発生
@@ -55,11 +58,9 @@ async def delete_comment_endpoint(
         CommentResponse: 削除されたコメントの情報
     """
 
-    # コメントが存在するか確認
-    db_comment = crud.get_comment_by_id(db, comment_id=comment_id)
-    if not db_comment:
+    # 削除対象の行がなければNoneが返る
+    deleted_comment = await crud.delete_comment(db, comment_id)
+    if deleted_comment is None:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    deleted_comment = crud.delete_comment(db, comment_id)
-
     return deleted_comment
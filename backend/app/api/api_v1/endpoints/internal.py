@@ -0,0 +1,27 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from app import crud
+from app.db.pool import pool_status
+from app.db.query_budget import query_budget
+from app.db.session import get_async_engine, get_read_replicas
+
+router = APIRouter()
+
+
+@router.get("/pool")
+@query_budget(0)
+async def read_pool_status() -> dict[str, Any]:
+    """コネクションプール、レプリカ、プロセス内キャッシュの状態を取得するエンドポイント
+
+    プールのサイズ調整に使うため、ワーカープロセスごとの値を返す。
+
+    Returns:
+        dict[str, Any]: プールとレプリカの状態、キャッシュの統計情報
+    """
+    return {
+        "pool": pool_status(get_async_engine().pool),
+        "replicas": get_read_replicas().status(),
+        "caches": [crud.get_user_cache().snapshot(), crud.get_post_cache().snapshot()],
+    }
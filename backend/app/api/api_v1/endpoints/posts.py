@@ -1,26 +1,40 @@
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple
+
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from app import (
     crud,  # ユーザー作成のロジックを含む関数をインポート
     schemas,  # 作成したPydanticモデルをインポート
 )
-from app.api import deps  # 作成した依存性をインポート
+from app.api import conditional, deps, serialization  # 作成した依存性をインポート
+from app.api.export import ExportFormat, stream_export
+from app.api.serialization import JSONBytesResponse
+from app.db.query_budget import query_budget
+from app.middleware.read_your_writes import reads_from_primary
 
 router = APIRouter()
 
 
 @router.post("/", response_model=schemas.PostResponse, status_code=201)
+@query_budget(3)
 async def create_post_endpoint(
-    post: schemas.PostCreate, db: Session = Depends(deps.get_db)
+    post: schemas.PostCreate, db: AsyncSession = Depends(deps.get_db)
 ) -> schemas.PostResponse:
     """投稿を作成するエンドポイント
 
     Args:
         post (schemas.PostCreate): 作成する投稿の情報
-        db (Session, optional): DBセッション. Defaults to Depends(get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: ユーザーが存在しない場合に発生
@@ -30,40 +44,199 @@ async def create_post_endpoint(
     """
 
     # ユーザーが存在するか確認
-    user = crud.get_user_by_uid(db, user_id=post.user_id)
+    user = await crud.get_user_by_uid(db, user_id=post.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    created_post = crud.create_post(db, post)
+    created_post = await crud.create_post(db, post)
     if created_post:
         return created_post
     else:
         raise HTTPException(status_code=400, detail="Post could not be created")
 
 
-@router.get("/", response_model=List[schemas.PostResponse])
-async def read_posts(db: Session = Depends(deps.get_db)) -> List[schemas.PostResponse]:
+@router.post(
+    "/bulk",
+    response_model=schemas.BulkCreateResponse[schemas.PostResponse],
+    status_code=201,
+)
+@query_budget(2)
+async def create_posts_bulk_endpoint(
+    posts: List[schemas.PostCreate] = Body(
+        ..., min_length=1, max_length=schemas.BULK_MAX_ITEMS
+    ),
+    db: AsyncSession = Depends(deps.get_db),
+) -> schemas.BulkCreateResponse[schemas.PostResponse]:
+    """複数の投稿を一括で作成するエンドポイント
+
+    存在しないユーザーを参照する要素は作成せず、errorsにその位置と理由を返す。
+
+    Args:
+        posts (List[schemas.PostCreate]): 作成する投稿の情報の一覧
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
+
+    Returns:
+        schemas.BulkCreateResponse[schemas.PostResponse]: 作成された投稿の一覧と作成できなかった要素のエラー
+    """
+    created_posts, errors = await crud.create_posts_bulk(db, posts)
+    return schemas.BulkCreateResponse[schemas.PostResponse](
+        created=created_posts, errors=errors
+    )
+
+
+@router.get(
+    "/",
+    response_model=schemas.Page[schemas.PostResponse],
+    responses={
+        200: serialization.ALTERNATE_CONTENT,
+        304: {"description": "Not Modified"},
+    },
+)
+@query_budget(2)
+async def read_posts(
+    request: Request,
+    page: deps.PageParams = Depends(deps.get_page_params),
+    fields: Optional[Tuple[str, ...]] = Depends(deps.get_post_fields),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Response:
     """投稿の一覧を取得するエンドポイント
 
+    If-None-Matchが指定された場合は (id, updated_at) だけを取得してETagを比較し、
+    変更がなければcontentを含む一覧本体を取得せずに304を返す。
+    取得した行はレスポンスモデルで再検証せずにJSONへ変換する。
+    Acceptヘッダーに応じてMessagePackまたはArrow IPCストリームでも返す。
+    fieldsを指定した場合は、指定したフィールドの列だけを取得して返す。
+
     Args:
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        page (deps.PageParams, optional): ページネーション条件. Defaults to Depends(deps.get_page_params).
+        fields (Optional[Tuple[str, ...]], optional): 返すフィールド. Defaults to Depends(deps.get_post_fields).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Returns:
-        List[schemas.PostResponse]: 取得された投稿の一覧
+        Response: 取得された投稿の一覧と次ページのカーソル（schemas.Page[schemas.PostResponse]）
     """
-    posts = crud.get_posts(db)
-    return posts
+    media_type = serialization.negotiate_media_type(request)
+    variant = serialization.etag_variant(media_type, fields)
+
+    if "if-none-match" in request.headers:
+        versions, next_cursor = await crud.get_post_versions(db, page.limit, page.after)
+        etag = conditional.window_etag(versions, next_cursor, variant)
+        if conditional.is_not_modified(request, etag):
+            response = conditional.not_modified(etag)
+            response.headers["Vary"] = "Accept"
+            return response
+
+    posts, next_cursor = await crud.get_posts(db, page.limit, page.after, fields)
+    response = serialization.posts.project(fields).render_page(
+        posts, next_cursor, media_type
+    )
+    conditional.set_validators(
+        response, conditional.window_etag(posts, next_cursor, variant)
+    )
+    return response
+
+
+@router.get("/search", response_model=schemas.Page[schemas.PostSearchResult])
+@query_budget(1)
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=200, description="検索語"),
+    user_id: Optional[schemas.UUIDStr] = Query(
+        None, description="指定した場合はこのユーザーの投稿だけを検索する"
+    ),
+    page: deps.SearchPageParams = Depends(deps.get_search_page_params),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Response:
+    """投稿のタイトルと本文を全文検索するエンドポイント
+
+    関連度の高い順に返す。タイトルの一致は本文の一致より高く評価する。
 
+    Args:
+        q (str): 検索語（"語句"、or、-除外 の構文を使える）
+        user_id (Optional[str], optional): 投稿者で絞り込む場合のユーザーID. Defaults to None.
+        page (deps.SearchPageParams, optional): ページネーション条件. Defaults to Depends(deps.get_search_page_params).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
-@router.get("/{post_id}", response_model=schemas.PostResponse)
+    Returns:
+        Response: 関連度付きの投稿の一覧と次ページのカーソル（schemas.Page[schemas.PostSearchResult]）
+    """
+    posts, next_cursor = await crud.search_posts(
+        db, q, page.limit, page.after, user_id=user_id
+    )
+    return JSONBytesResponse(
+        serialization.post_search_results.dump_page(posts, next_cursor)
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+@query_budget(1)
+async def export_posts(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        deps.get_read_session_factory
+    ),
+) -> StreamingResponse:
+    """投稿の全件をNDJSONまたはCSVでストリーミング出力するエンドポイント
+
+    Args:
+        export_format (ExportFormat, optional): 出力形式. Defaults to Query(ExportFormat.NDJSON, alias="format").
+        session_factory (async_sessionmaker[AsyncSession], optional): 読み取りに使うセッションファクトリ. Defaults to Depends(deps.get_read_session_factory).
+
+    Returns:
+        StreamingResponse: 投稿を1行ずつ出力するレスポンス
+    """
+    return stream_export(
+        crud.stream_posts,
+        crud.POST_EXPORT_COLUMNS,
+        export_format,
+        "posts",
+        session_factory,
+    )
+
+
+@router.post(":batchGet", response_model=schemas.BatchGetResponse[schemas.PostResponse])
+@query_budget(1)
+async def batch_get_posts(
+    batch: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> schemas.BatchGetResponse[schemas.PostResponse]:
+    """IDを指定して複数の投稿をまとめて取得するエンドポイント
+
+    GET /posts/{post_id} を繰り返す代わりに、1回のクエリで取得する。
+    IDの一覧がURLの長さの上限を超えないよう、本文で受け取る。
+
+    Args:
+        batch (schemas.BatchGetRequest): 取得する投稿のIDの一覧
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
+
+    Returns:
+        schemas.BatchGetResponse[schemas.PostResponse]: 指定した順序の投稿の一覧と存在しなかったID
+    """
+    posts, missing = await crud.get_posts_by_ids(db, batch.ids)
+    return schemas.BatchGetResponse[schemas.PostResponse](items=posts, missing=missing)
+
+
+@router.get(
+    "/{post_id}",
+    response_model=schemas.PostResponse,
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(1)
 async def read_post(
-    post_id: str, db: Session = Depends(deps.get_db)
+    post_id: schemas.UUIDStr,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_read_db),
 ) -> schemas.PostResponse:
     """投稿の詳細を取得するエンドポイント
 
+    ETagとLast-Modifiedを返し、クライアントのキャッシュが最新であれば304を返す。
+
     Args:
         post_id (str): 取得する投稿のID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        response (Response): レスポンス
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Raises:
         HTTPException: 投稿が存在しない場合に発生
@@ -71,118 +244,252 @@ async def read_post(
     Returns:
         schemas.PostResponse: 取得された投稿の情報
     """
-    post = crud.get_post_by_id(db, post_id)
+    # 書き込み直後のクライアントには、他のワーカーのキャッシュに残る古い値を返さない
+    post = await crud.get_post_by_id(
+        db, post_id, use_cache=not reads_from_primary(request)
+    )
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
+
+    etag = conditional.entity_etag(post.id, post.updated_at)
+    if conditional.is_not_modified(request, etag, post.updated_at):
+        return conditional.not_modified(etag, post.updated_at)
+    conditional.set_validators(response, etag, post.updated_at)
     return post
 
 
 @router.patch("/{post_id}", response_model=schemas.PostResponse)
+@query_budget(1)
 async def update_post(
-    post_id: str, post: schemas.PostUpdate, db: Session = Depends(deps.get_db)
+    post_id: schemas.UUIDStr,
+    post: schemas.PostUpdate,
+    db: AsyncSession = Depends(deps.get_db),
 ) -> schemas.PostResponse:
     """投稿を更新するエンドポイント
 
     Args:
         post_id (str): 更新する投稿のID
         post (schemas.PostUpdate): 更新する投稿の情報
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
 
     Returns:
         schemas.PostResponse: 更新された投稿の情報
     """
-    # 投稿が存在するか確認
-    existing_post = crud.get_post_by_id(db, post_id)
-    if not existing_post:
+    # 更新対象の行がなければNoneが返る
+    updated_post = await crud.update_post(db, post_id, post)
+    if updated_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-
-    updated_post = crud.update_post(db, post_id, post)
     return updated_post
 
 
 @router.delete("/{post_id}", response_model=schemas.PostResponse)
+@query_budget(1)
 async def delete_post(
-    post_id: str, db: Session = Depends(deps.get_db)
+    post_id: schemas.UUIDStr, db: AsyncSession = Depends(deps.get_db)
 ) -> schemas.PostResponse:
     """投稿を削除するエンドポイント
 
     Args:
         post_id (str): 削除する投稿のID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
 
     Returns:
         schemas.PostResponse: 削除された投稿の情報
     """
-    # 投稿が存在するか確認
-    existing_post = crud.get_post_by_id(db, post_id)
-    if not existing_post:
+    # 削除対象の行がなければNoneが返る
+    deleted_post = await crud.delete_post(db, post_id)
+    if deleted_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-
-    deleted_post = crud.delete_post(db, post_id)
     return deleted_post
 
 
 @router.post(
-    "/{post_id}/comments/", response_model=schemas.CommentResponse, status_code=201
+    "/{post_id}/comments/",
+    response_model=schemas.CommentResponse,
+    status_code=201,
+    responses={
+        202: {
+            "model": schemas.CommentResponse,
+            "description": "Prefer: respond-async の場合。コメントは後でまとめて書き込まれる",
+        },
+        503: {"description": "書き込み待ちのコメントが上限に達している"},
+    },
 )
+@query_budget(4)
 async def create_comment_for_post(
-    post_id: str, comment: schemas.CommentCreate, db: Session = Depends(deps.get_db)
+    post_id: schemas.UUIDStr,
+    comment: schemas.CommentCreate,
+    respond_async: bool = Depends(deps.get_respond_async),
+    db: AsyncSession = Depends(deps.get_db),
 ) -> schemas.CommentResponse:
     """投稿にコメントを作成するエンドポイント
 
+    Prefer: respond-async が指定され、非同期の受け付けが有効な場合は、IDを割り当てて
+    書き込みバッファに入れ、書き込みを待たずに202を返す。
+    受け付けた後に破棄されないよう、投稿者の存在はバッファに入れる前に確認する。
+
     Args:
         post_id (str): コメントを作成する投稿のID
         comment (schemas.CommentCreate): 作成するコメントの情報
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        respond_async (bool, optional): 非同期の処理が求められているか. Defaults to Depends(deps.get_respond_async).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
 
     Raises:
-        HTTPException: 投稿が存在しない場合に発生
+        HTTPException: 投稿・投稿者が存在しない場合、書き込みバッファが満杯の場合に発生
 
     Returns:
-        CommentResponse: 作成されたコメントの情報
+        CommentResponse: 作成された（非同期の場合は受け付けた）コメントの情報
     """
     # 投稿が存在するか確認
-    existing_post = crud.get_post_by_id(db, post_id)
+    existing_post = await crud.get_post_by_id(db, post_id)
     if not existing_post:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    created_comment = crud.create_comment_for_post(db, comment, post_id)
+    if respond_async and crud.get_comment_writer().running:
+        # 同期の場合は外部キーで確認されるが、非同期では書き込み時まで確認されないため、
+        # キャッシュを経由して先に確認する
+        user = await crud.get_user_by_uid(db, comment.user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        accepted = await crud.enqueue_comment_for_post(comment, post_id)
+        if accepted is None:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many pending comments",
+                headers={"Retry-After": "1"},
+            )
+        return JSONBytesResponse(
+            schemas.CommentResponse.model_validate(accepted).model_dump(),
+            status_code=202,
+            headers={"Preference-Applied": "respond-async"},
+        )
+
+    created_comment = await crud.create_comment_for_post(db, comment, post_id)
 
     return created_comment
 
 
+@router.post(
+    "/{post_id}/comments/bulk",
+    response_model=schemas.BulkCreateResponse[schemas.CommentResponse],
+    status_code=201,
+)
+@query_budget(3)
+async def create_comments_bulk_for_post(
+    post_id: schemas.UUIDStr,
+    comments: List[schemas.CommentCreate] = Body(
+        ..., min_length=1, max_length=schemas.BULK_MAX_ITEMS
+    ),
+    db: AsyncSession = Depends(deps.get_db),
+) -> schemas.BulkCreateResponse[schemas.CommentResponse]:
+    """投稿に複数のコメントを一括で作成するエンドポイント
+
+    存在しないユーザーを参照する要素は作成せず、errorsにその位置と理由を返す。
+
+    Args:
+        post_id (str): コメントを作成する投稿のID
+        comments (List[schemas.CommentCreate]): 作成するコメントの情報の一覧
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
+
+    Raises:
+        HTTPException: 投稿が存在しない場合に発生
+
+    Returns:
+        schemas.BulkCreateResponse[schemas.CommentResponse]: 作成されたコメントの一覧と作成できなかった要素のエラー
+    """
+    result = await crud.create_comments_bulk(db, comments, post_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    created_comments, errors = result
+    return schemas.BulkCreateResponse[schemas.CommentResponse](
+        created=created_comments, errors=errors
+    )
+
+
+@router.get("/{post_id}/comments/export", response_class=StreamingResponse)
+@query_budget(2)
+async def export_comments_for_post(
+    post_id: schemas.UUIDStr,
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        deps.get_read_session_factory
+    ),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> StreamingResponse:
+    """投稿に紐づくコメントの全件をNDJSONまたはCSVでストリーミング出力するエンドポイント
+
+    投稿の存在確認と出力は、同じ接続先（書き込み直後のクライアントはプライマリ）から読む。
+
+    Args:
+        post_id (str): 出力するコメントの投稿のID
+        export_format (ExportFormat, optional): 出力形式. Defaults to Query(ExportFormat.NDJSON, alias="format").
+        session_factory (async_sessionmaker[AsyncSession], optional): 読み取りに使うセッションファクトリ. Defaults to Depends(deps.get_read_session_factory).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
+
+    Raises:
+        HTTPException: 投稿が存在しない場合に発生
+
+    Returns:
+        StreamingResponse: コメントを1行ずつ出力するレスポンス
+    """
+    # ストリーミングを始めると404を返せないため、先に投稿の存在を確認する
+    existing_post = await crud.get_post_by_id(db, post_id)
+    if not existing_post:
+        raise HTTPException(status_code=404, detail="Post not found")
+
+    return stream_export(
+        lambda export_db: crud.stream_comments_for_post(export_db, post_id),
+        crud.COMMENT_EXPORT_COLUMNS,
+        export_format,
+        f"post_{post_id}_comments",
+        session_factory,
+    )
+
+
 @router.get(
-    "/{post_id}/comments/", response_model=List[schemas.CommentWithUserResponse]
+    "/{post_id}/comments/",
+    response_model=schemas.Page[schemas.CommentWithUserResponse],
+    responses={200: serialization.ALTERNATE_CONTENT},
 )
+@query_budget(1)
 async def read_comments_for_post(
-    post_id: str, db: Session = Depends(deps.get_db)
-) -> List[schemas.CommentWithUserResponse]:
+    post_id: schemas.UUIDStr,
+    request: Request,
+    page: deps.PageParams = Depends(deps.get_page_params),
+    fields: Optional[Tuple[str, ...]] = Depends(deps.get_comment_fields),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Response:
     """投稿に紐づくコメントの一覧を取得するエンドポイント
 
+    取得した行はレスポンスモデルで再検証せずにJSONへ変換する。
+    Acceptヘッダーに応じてMessagePackまたはArrow IPCストリームでも返す。
+    fieldsを指定した場合は、指定したフィールドの列だけを取得して返す。
+
     Args:
         post_id (str): 取得するコメントの投稿のID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        page (deps.PageParams, optional): ページネーション条件. Defaults to Depends(deps.get_page_params).
+        fields (Optional[Tuple[str, ...]], optional): 返すフィールド. Defaults to Depends(deps.get_comment_fields).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Raises:
         HTTPException: 投稿が存在しない場合に発生
 
     Returns:
-        List[schemas.CommentWithUserResponse]: 取得されたコメントの一覧
+        Response: 取得されたコメントの一覧と次ページのカーソル（schemas.Page[schemas.CommentWithUserResponse]）
     """
-    # 投稿が存在するか確認
-    existing_post = crud.get_post_by_id(db, post_id)
-    if not existing_post:
+    media_type = serialization.negotiate_media_type(request)
+
+    # 投稿が存在しない場合はNoneが返る
+    result = await crud.get_comments_for_post(
+        db, post_id, page.limit, page.after, fields
+    )
+    if result is None:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    comments = crud.get_comments_for_post(db, post_id)
-    comments_with_user = [
-        schemas.CommentWithUserResponse(
-            id=comment.id,
-            user_id=comment.user_id,
-            post_id=comment.post_id,
-            content=comment.content,
-            user_name=comment.user.name,  # ここでリレーションシップ関係であるUserの情報を取得
-        )
-        for comment in comments
-    ]
-    return comments_with_user
+    comments, next_cursor = result
+    return serialization.comments_with_user.project(fields).render_page(
+        comments, next_cursor, media_type
+    )
@@ -1,26 +1,31 @@
-from typing import List
+from typing import List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
     crud,  # ユーザー作成のロジックを含む関数をインポート
     schemas,  # 作成したPydanticモデルをインポート
 )
-from app.api import deps  # 作成した依存性をインポート
+from app.api import conditional, deps, serialization  # 作成した依存性をインポート
+from app.api.serialization import JSONBytesResponse
+from app.db.query_budget import query_budget
+from app.middleware.read_your_writes import reads_from_primary
 
 router = APIRouter()
 
 
 @router.post("/", response_model=schemas.UserResponse, status_code=201)
+@query_budget(2)
 async def create_user_endpoint(
-    user: schemas.UserCreate, db: Session = Depends(deps.get_db)
+    user: schemas.UserCreate, db: AsyncSession = Depends(deps.get_db)
 ) -> schemas.UserResponse:
     """ユーザーを作成するエンドポイント
 
     Args:
         user (schemas.UserCreate): 作成するユーザーの情報
-        db (Session, optional): DBセッション. Defaults to Depends(get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: ユーザーが作成できなかった場合に発生
@@ -28,58 +33,169 @@ async def create_user_endpoint(
     Returns:
         UserResponse: 作成されたユーザーの情報
     """
-    created_user = crud.create_user(db, user)
+    created_user = await crud.create_user(db, user)
     if created_user:
         return created_user
     else:
         raise HTTPException(status_code=400, detail="User could not be created")
 
 
-@router.get("/", response_model=List[schemas.UserResponse])
-async def read_users(db: Session = Depends(deps.get_db)) -> List[schemas.UserResponse]:
+@router.post(
+    "/bulk",
+    response_model=schemas.BulkCreateResponse[schemas.UserResponse],
+    status_code=201,
+)
+@query_budget(1)
+async def create_users_bulk_endpoint(
+    users: List[schemas.UserCreate] = Body(
+        ..., min_length=1, max_length=schemas.BULK_MAX_ITEMS
+    ),
+    db: AsyncSession = Depends(deps.get_db),
+) -> schemas.BulkCreateResponse[schemas.UserResponse]:
+    """複数のユーザーを一括で作成するエンドポイント
+
+    Args:
+        users (List[schemas.UserCreate]): 作成するユーザーの情報の一覧
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(get_db).
+
+    Returns:
+        schemas.BulkCreateResponse[schemas.UserResponse]: 作成されたユーザーの一覧
+    """
+    created_users = await crud.create_users_bulk(db, users)
+    return schemas.BulkCreateResponse[schemas.UserResponse](created=created_users)
+
+
+@router.get(
+    "/",
+    response_model=schemas.Page[schemas.UserResponse],
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(2)
+async def read_users(
+    request: Request,
+    page: deps.PageParams = Depends(deps.get_page_params),
+    fields: Optional[Tuple[str, ...]] = Depends(deps.get_user_fields),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Response:
     """ユーザーの一覧を取得するエンドポイント
 
+    If-None-Matchが指定された場合は (id, updated_at) だけを取得してETagを比較し、
+    変更がなければ一覧本体を取得せずに304を返す。
+    取得した行はレスポンスモデルで再検証せずにJSONへ変換する。
+    fieldsを指定した場合は、指定したフィールドの列だけを取得して返す。
+
     Args:
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        page (deps.PageParams, optional): ページネーション条件. Defaults to Depends(deps.get_page_params).
+        fields (Optional[Tuple[str, ...]], optional): 返すフィールド. Defaults to Depends(deps.get_user_fields).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Returns:
-        List[schemas.UserResponse]: 取得されたユーザーの一覧
+        Response: 取得されたユーザーの一覧と次ページのカーソル（schemas.Page[schemas.UserResponse]）
     """
-    users = crud.get_users(db)
-    return users
+    variant = serialization.etag_variant(serialization.JSON_MEDIA_TYPE, fields)
+
+    if "if-none-match" in request.headers:
+        versions, next_cursor = await crud.get_user_versions(db, page.limit, page.after)
+        etag = conditional.window_etag(versions, next_cursor, variant)
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+    users, next_cursor = await crud.get_users(db, page.limit, page.after, fields)
+    response = JSONBytesResponse(
+        serialization.users.project(fields).dump_page(users, next_cursor)
+    )
+    conditional.set_validators(
+        response, conditional.window_etag(users, next_cursor, variant)
+    )
+    return response
+
+
+@router.get("", response_model=schemas.BatchGetResponse[schemas.UserResponse])
+@query_budget(1)
+async def read_users_by_ids(
+    request: Request,
+    ids: Optional[List[str]] = Depends(deps.get_id_list),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Union[schemas.BatchGetResponse[schemas.UserResponse], RedirectResponse]:
+    """IDを指定して複数のユーザーをまとめて取得するエンドポイント
+
+    GET /users/{user_id} を繰り返す代わりに、1回のクエリで取得する。
+    ids を指定しない場合は、このエンドポイントの追加前と同じく一覧 (/users/) へ
+    307でリダイレクトする。
 
+    Args:
+        request (Request): リクエスト
+        ids (Optional[List[str]], optional): カンマ区切りのユーザーID. Defaults to Depends(deps.get_id_list).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
+
+    Returns:
+        Union[schemas.BatchGetResponse[schemas.UserResponse], RedirectResponse]: 指定した順序のユーザーの一覧と存在しなかったID、
+            または一覧へのリダイレクト
+    """
+    if ids is None:
+        return RedirectResponse(
+            request.url.replace(path=request.url.path + "/"), status_code=307
+        )
+
+    users, missing = await crud.get_users_by_ids(db, ids)
+    return schemas.BatchGetResponse[schemas.UserResponse](items=users, missing=missing)
 
-@router.get("/{user_id}", response_model=schemas.UserResponse)
+
+@router.get(
+    "/{user_id}",
+    response_model=schemas.UserResponse,
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(1)
 async def read_user(
-    user_id: str, db: Session = Depends(deps.get_db)
+    user_id: schemas.UUIDStr,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_read_db),
 ) -> schemas.UserResponse:
     """ユーザーの詳細を取得するエンドポイント
 
+    ETagとLast-Modifiedを返し、クライアントのキャッシュが最新であれば304を返す。
+
     Args:
         user_id (str): 取得するユーザーのID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        response (Response): レスポンス
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Exceptions:
         HTTPException: ユーザーが見つからない場合に発生
     Returns:
         schemas.UserResponse: 取得されたユーザーの情報
     """
-    user = crud.get_user_by_uid(db, user_id)
+    # 書き込み直後のクライアントには、他のワーカーのキャッシュに残る古い値を返さない
+    user = await crud.get_user_by_uid(
+        db, user_id, use_cache=not reads_from_primary(request)
+    )
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
+
+    etag = conditional.entity_etag(user.id, user.updated_at)
+    if conditional.is_not_modified(request, etag, user.updated_at):
+        return conditional.not_modified(etag, user.updated_at)
+    conditional.set_validators(response, etag, user.updated_at)
     return user
 
 
 @router.patch("/{user_id}", response_model=schemas.UserResponse)
+@query_budget(1)
 async def update_user(
-    user_id: str, user: schemas.UserCreate, db: Session = Depends(deps.get_db)
+    user_id: schemas.UUIDStr,
+    user: schemas.UserCreate,
+    db: AsyncSession = Depends(deps.get_db),
 ) -> schemas.UserResponse:
     """ユーザーを更新するエンドポイント
 
     Args:
         user_id (str): 更新するユーザーのID
         user (schemas.UserCreate): 更新するユーザーの情報
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
 
     Exceptions:
         HTTPException: ユーザーが見つからない場合に発生
@@ -87,25 +203,24 @@ async def update_user(
     Returns:
         schemas.UserResponse: 更新されたユーザーの情報
     """
-    # ユーザーが見つからない場合は404エラーを返す
-    existing_user = crud.get_user_by_uid(db, user_id)
-    if existing_user is None:
+    # 更新対象の行がなければNoneが返るため、404エラーを返す
+    updated_user = await crud.update_user(db, user_id, user)
+    if updated_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    updated_user = crud.update_user(db, user_id, user)
-
     return updated_user
 
 
 @router.delete("/{user_id}", response_model=schemas.UserResponse)
+@query_budget(1)
 async def delete_user(
-    user_id: str, db: Session = Depends(deps.get_db)
+    user_id: schemas.UUIDStr, db: AsyncSession = Depends(deps.get_db)
 ) -> schemas.UserResponse:
     """ユーザーを削除するエンドポイント
 
     Args:
         user_id (str): 削除するユーザーのID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        db (AsyncSession, optional): DBセッション. Defaults to Depends(deps.get_db).
 
     Exceptions:
         HTTPException: ユーザーが見つからない場合に発生
@@ -113,36 +228,107 @@ async def delete_user(
     Returns:
         schemas.UserResponse: 削除されたユーザーの情報
     """
-    # ユーザーが見つからない場合は404エラーを返す
-    existing_user = crud.get_user_by_uid(db, user_id)
-    if existing_user is None:
+    # 削除対象の行がなければNoneが返るため、404エラーを返す
+    deleted_user = await crud.delete_user(db, user_id)
+    if deleted_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    deleted_user = crud.delete_user(db, user_id)
-
     return deleted_user
 
 
-@router.get("/{user_id}/posts", response_model=List[schemas.PostResponse])
+@router.get(
+    "/{user_id}/posts",
+    response_model=schemas.Page[schemas.PostResponse],
+    responses={304: {"description": "Not Modified"}},
+)
+@query_budget(3)
 async def read_user_posts(
-    user_id: str, db: Session = Depends(deps.get_db)
-) -> List[schemas.PostResponse]:
+    user_id: schemas.UUIDStr,
+    request: Request,
+    page: deps.PageParams = Depends(deps.get_page_params),
+    fields: Optional[Tuple[str, ...]] = Depends(deps.get_post_fields),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> Response:
     """ユーザーの投稿の一覧を取得するエンドポイント
 
+    If-None-Matchが指定された場合は (id, updated_at) だけを取得してETagを比較し、
+    変更がなければ一覧本体を取得せずに304を返す。
+    取得した行はレスポンスモデルで再検証せずにJSONへ変換する。
+    fieldsを指定した場合は、指定したフィールドの列だけを取得して返す。
+
     Args:
         user_id (str): 取得するユーザーのID
-        db (Session, optional): DBセッション. Defaults to Depends(deps.get_db).
+        request (Request): リクエスト
+        page (deps.PageParams, optional): ページネーション条件. Defaults to Depends(deps.get_page_params).
+        fields (Optional[Tuple[str, ...]], optional): 返すフィールド. Defaults to Depends(deps.get_post_fields).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
 
     Exceptions:
         HTTPException: ユーザーが見つからない場合に発生
 
     Returns:
-        List[schemas.PostResponse]: 取得された投稿の一覧
+        Response: 取得された投稿の一覧と次ページのカーソル（schemas.Page[schemas.PostResponse]）
     """
     # ユーザーが見つからない場合は404エラーを返す
-    existing_user = crud.get_user_by_uid(db, user_id)
+    existing_user = await crud.get_user_by_uid(db, user_id)
     if existing_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    posts = crud.get_posts_by_user_id(db, user_id)
-    return posts
+    variant = serialization.etag_variant(serialization.JSON_MEDIA_TYPE, fields)
+
+    if "if-none-match" in request.headers:
+        versions, next_cursor = await crud.get_post_versions(
+            db, page.limit, page.after, user_id=user_id
+        )
+        etag = conditional.window_etag(versions, next_cursor, variant)
+        if conditional.is_not_modified(request, etag):
+            return conditional.not_modified(etag)
+
+    posts, next_cursor = await crud.get_posts_by_user_id(
+        db, user_id, page.limit, page.after, fields
+    )
+    response = JSONBytesResponse(
+        serialization.posts.project(fields).dump_page(posts, next_cursor)
+    )
+    conditional.set_validators(
+        response, conditional.window_etag(posts, next_cursor, variant)
+    )
+    return response
+
+
+@router.get("/{user_id}/feed", response_model=schemas.Page[schemas.FeedPostResponse])
+@query_budget(1)
+async def read_user_feed(
+    user_id: schemas.UUIDStr,
+    page: deps.PageParams = Depends(deps.get_page_params),
+    comments_per_post: int = Query(
+        3, ge=0, le=20, description="投稿ごとに返す新しい順のコメントの件数"
+    ),
+    db: AsyncSession = Depends(deps.get_read_db),
+) -> schemas.Page[schemas.FeedPostResponse]:
+    """ユーザーの投稿の一覧を、各投稿の最新のコメント付きで取得するエンドポイント
+
+    投稿ごとに GET /posts/{post_id}/comments/ を呼ぶ代わりに、
+    ユーザーの存在確認を含めて1回のクエリで取得する。
+
+    Args:
+        user_id (str): 取得するユーザーのID
+        page (deps.PageParams, optional): ページネーション条件. Defaults to Depends(deps.get_page_params).
+        comments_per_post (int, optional): 投稿ごとに返すコメントの件数. Defaults to Query(3, ge=0, le=20).
+        db (AsyncSession, optional): 読み取り用DBセッション. Defaults to Depends(deps.get_read_db).
+
+    Raises:
+        HTTPException: ユーザーが見つからない場合に発生
+
+    Returns:
+        schemas.Page[schemas.FeedPostResponse]: 投稿の一覧と次ページのカーソル
+    """
+    # ユーザーが存在しない場合はNoneが返る
+    result = await crud.get_user_feed(
+        db, user_id, page.limit, page.after, comments_per_post
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    posts, next_cursor = result
+    return schemas.Page[schemas.FeedPostResponse](items=posts, next_cursor=next_cursor)
@@ -0,0 +1,123 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, Optional
+
+from fastapi import Request, Response
+
+
+def entity_etag(entity_id: str, updated_at: Optional[datetime]) -> str:
+    """単一のエンティティの強いETagを作成する
+
+    Args:
+        entity_id (str): エンティティのID
+        updated_at (Optional[datetime]): エンティティの更新日時
+
+    Returns:
+        str: ダブルクォートで囲まれたETag
+    """
+    version = updated_at.isoformat() if updated_at else ""
+    digest = hashlib.blake2b(f"{entity_id}:{version}".encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def window_etag(
+    rows: Iterable[Any], next_cursor: Optional[str], variant: str = ""
+) -> str:
+    """一覧の1ページ分の強いETagを作成する
+
+    ページに含まれる行の (id, updated_at) と次ページのカーソルから作成するため、
+    行の追加・削除・更新のいずれかがあれば値が変わる。
+
+    Args:
+        rows (Iterable[Any]): id と updated_at を持つ行の一覧
+        next_cursor (Optional[str]): 次ページのカーソル
+        variant (str, optional): 表現の種類（JSON以外の形式で返す場合のメディアタイプ）. Defaults to "".
+
+    Returns:
+        str: ダブルクォートで囲まれたETag
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        version = row.updated_at.isoformat() if row.updated_at else ""
+        digest.update(f"{row.id}:{version};".encode())
+    digest.update((next_cursor or "").encode())
+    # 形式ごとに本文が異なるため、強いETagも形式ごとに変える
+    if variant:
+        digest.update(f";{variant}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _http_datetime(value: datetime) -> datetime:
+    # DBの日時はタイムゾーンなしのUTCで保存されている。HTTP日付は秒精度のため切り捨てる
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime] = None
+) -> bool:
+    """クライアントのキャッシュが最新かどうかを判定する
+
+    If-None-Match があればそれだけで判定し、なければ If-Modified-Since で判定する。
+
+    Args:
+        request (Request): リクエスト
+        etag (str): 現在のETag
+        last_modified (Optional[datetime]): 現在の更新日時
+
+    Returns:
+        bool: 304 Not Modifiedを返してよい場合はTrue
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # GETでは弱い比較を行うため、W/ 接頭辞は無視する
+        return "*" in candidates or etag in [
+            tag.removeprefix("W/") for tag in candidates
+        ]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return _http_datetime(last_modified) <= since
+
+    return False
+
+
+def set_validators(
+    response: Response, etag: str, last_modified: Optional[datetime] = None
+) -> None:
+    """レスポンスにETagとLast-Modifiedヘッダーを設定する
+
+    Args:
+        response (Response): レスポンス
+        etag (str): ETag
+        last_modified (Optional[datetime]): 更新日時
+    """
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(
+            _http_datetime(last_modified), usegmt=True
+        )
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """本文を持たない304 Not Modifiedのレスポンスを作成する
+
+    Args:
+        etag (str): ETag
+        last_modified (Optional[datetime]): 更新日時
+
+    Returns:
+        Response: 304レスポンス
+    """
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified)
+    return response
@@ -1,16 +1,244 @@
-from typing import Generator
+import secrets
+from dataclasses import dataclass
+from typing import AsyncGenerator, Callable, List, Optional, Tuple, Type
 
-from app.db.session import SessionLocal
+from fastapi import Depends, Header, HTTPException, Query, Request
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.core.config import settings
+from app.db.pagination import (
+    Cursor,
+    SearchCursor,
+    decode_cursor,
+    decode_search_cursor,
+)
+from app.db.session import get_async_session_local, get_read_replicas
+from app.schemas.batch import BATCH_GET_MAX_IDS
+from app.schemas.comment import CommentWithUserResponse
+from app.schemas.common import UUIDStr
+from app.schemas.post import PostResponse
+from app.schemas.user import UserResponse
+from app.middleware.read_your_writes import reads_from_primary
 
-def get_db() -> Generator:
-    """DB接続を行うジェネレータ関数
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """DB接続を行う非同期ジェネレータ関数
 
     Yields:
-        Generator: DBセッション
+        AsyncSession: DBセッション
     """
-    try:
-        db = SessionLocal()
+    async with get_async_session_local()() as db:
+        yield db
+
+
+def get_read_session_factory(request: Request) -> async_sessionmaker[AsyncSession]:
+    """読み取りに使うセッションファクトリを選ぶ依存性
+
+    レプリカが設定されていればレプリカを選ぶ。直前に書き込みを行った
+    クライアントや、使えるレプリカがない場合はプライマリを選ぶ。
+    依存性の結果はリクエスト内で共有されるため、get_read_db と同じ接続先になる。
+
+    Args:
+        request (Request): リクエスト
+
+    Returns:
+        async_sessionmaker[AsyncSession]: 読み取りに使うセッションファクトリ
+    """
+    if reads_from_primary(request):
+        return get_async_session_local()
+    return get_read_replicas().choose()
+
+
+async def get_read_db(
+    session_factory: async_sessionmaker[AsyncSession] = Depends(
+        get_read_session_factory
+    ),
+) -> AsyncGenerator[AsyncSession, None]:
+    """読み取り専用のDB接続を行う非同期ジェネレータ関数
+
+    Args:
+        session_factory (async_sessionmaker[AsyncSession], optional): 読み取りに使うセッションファクトリ. Defaults to Depends(get_read_session_factory).
+
+    Yields:
+        AsyncSession: DBセッション
+    """
+    async with session_factory() as db:
         yield db
-    finally:
-        db.close()
+
+
+def verify_internal_token(authorization: Optional[str] = Header(None)) -> None:
+    """運用向けエンドポイントへのアクセスをトークンで確認する依存性
+
+    INTERNAL_ENDPOINTS_TOKEN が未設定の場合は確認しない。
+
+    Args:
+        authorization (Optional[str], optional): Authorizationヘッダー. Defaults to Header(None).
+
+    Raises:
+        HTTPException: トークンが一致しない場合に発生
+    """
+    token = settings.INTERNAL_ENDPOINTS_TOKEN
+    if token is None:
+        return
+    # 比較にかかる時間からトークンを推測されないよう、一定時間で比較する
+    if authorization is None or not secrets.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid internal token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def get_respond_async(request: Request) -> bool:
+    """Preferヘッダーで非同期の処理 (respond-async) が求められているかを判定する依存性
+
+    Args:
+        request (Request): リクエスト
+
+    Returns:
+        bool: Prefer: respond-async が指定されている場合はTrue
+    """
+    preferences = request.headers.get("prefer", "")
+    return any(
+        preference.split(";")[0].split("=")[0].strip().lower() == "respond-async"
+        for preference in preferences.split(",")
+    )
+
+
+@dataclass
+class PageParams:
+    """一覧取得エンドポイントのページネーション条件"""
+
+    limit: int
+    after: Optional[Cursor]
+
+
+def get_page_params(
+    limit: int = Query(50, ge=1, le=200, description="1ページの件数"),
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+) -> PageParams:
+    """limit と cursor クエリパラメータを解釈する依存性
+
+    Args:
+        limit (int): 1ページの件数
+        cursor (Optional[str]): 前ページのレスポンスに含まれるnext_cursor
+
+    Raises:
+        HTTPException: カーソルの形式が不正な場合に発生
+
+    Returns:
+        PageParams: ページネーション条件
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return PageParams(limit=limit, after=after)
+
+
+@dataclass
+class SearchPageParams:
+    """検索エンドポイントのページネーション条件"""
+
+    limit: int
+    after: Optional[SearchCursor]
+
+
+def get_search_page_params(
+    limit: int = Query(20, ge=1, le=100, description="1ページの件数"),
+    cursor: Optional[str] = Query(None, description="前ページのnext_cursor"),
+) -> SearchPageParams:
+    """検索結果の limit と cursor クエリパラメータを解釈する依存性
+
+    Args:
+        limit (int): 1ページの件数
+        cursor (Optional[str]): 前ページのレスポンスに含まれるnext_cursor
+
+    Raises:
+        HTTPException: カーソルの形式が不正な場合に発生
+
+    Returns:
+        SearchPageParams: ページネーション条件
+    """
+    try:
+        after = decode_search_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return SearchPageParams(limit=limit, after=after)
+
+
+_id_list_adapter: TypeAdapter[List[UUIDStr]] = TypeAdapter(List[UUIDStr])
+
+
+def get_id_list(
+    ids: Optional[str] = Query(None, description="カンマ区切りのIDの一覧"),
+) -> Optional[List[str]]:
+    """カンマ区切りの ids クエリパラメータを解釈する依存性
+
+    Args:
+        ids (Optional[str]): カンマ区切りのIDの一覧
+
+    Raises:
+        HTTPException: IDの形式が不正な場合、件数が上限を超える場合に発生
+
+    Returns:
+        Optional[List[str]]: 正規化されたIDの一覧。ids が指定されていない場合はNone
+    """
+    if ids is None:
+        return None
+    values = [value.strip() for value in ids.split(",") if value.strip()]
+    if not values or len(values) > BATCH_GET_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"ids must contain between 1 and {BATCH_GET_MAX_IDS} ids",
+        )
+    try:
+        return _id_list_adapter.validate_python(values)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+
+
+def get_fields_param(
+    model: Type[BaseModel],
+) -> Callable[[Optional[str]], Optional[Tuple[str, ...]]]:
+    """レスポンスモデルのフィールドで fields クエリパラメータを検証する依存性を作成する
+
+    Args:
+        model (Type[BaseModel]): 一覧の要素のレスポンスモデル
+
+    Returns:
+        Callable[[Optional[str]], Optional[Tuple[str, ...]]]: 返すフィールドを解釈する依存性
+    """
+    allowed = tuple(model.model_fields)
+
+    def get_fields(
+        fields: Optional[str] = Query(
+            None,
+            description=f"返すフィールド（カンマ区切り）: {', '.join(allowed)}",
+        ),
+    ) -> Optional[Tuple[str, ...]]:
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(allowed)
+        if not requested or unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Unknown fields: {', '.join(sorted(unknown))}"
+                    if unknown
+                    else "fields must not be empty"
+                ),
+            )
+        # 指定の順序や重複に関わらず、同じ組み合わせは同じ表現（ETag）にする
+        return tuple(name for name in allowed if name in requested)
+
+    return get_fields
+
+
+get_user_fields = get_fields_param(UserResponse)
+get_post_fields = get_fields_param(PostResponse)
+get_comment_fields = get_fields_param(CommentWithUserResponse)
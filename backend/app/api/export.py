@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _ndjson_chunk(rows: Sequence[Row]) -> str:
+    return "".join(
+        json.dumps(row._asdict(), default=_json_default, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_chunk(rows: Sequence[Row]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def stream_export(
+    fetch: Callable[[AsyncSession], AsyncIterator[Sequence[Row]]],
+    columns: Sequence[str],
+    export_format: ExportFormat,
+    filename: str,
+    session_factory: async_sessionmaker[AsyncSession],
+) -> StreamingResponse:
+    """サーバーサイドカーソルで取得した行をNDJSONまたはCSVとして逐次送信する
+
+    結果全体をメモリに載せず、fetchが返すバッチ単位でエンコードして送信するため、
+    件数に関わらずメモリ使用量は一定になる。
+    依存性のセッションはレスポンス送信前に閉じられるため、送信中に使うセッションは
+    ジェネレータ内で開く。接続先はエンドポイントで deps.get_read_session_factory により
+    選んだものを受け取り、存在確認などの読み取りと同じ接続先から送信する。
+
+    Args:
+        fetch (Callable[[AsyncSession], AsyncIterator[Sequence[Row]]]): 行をバッチ単位で返すcrudの関数
+        columns (Sequence[str]): CSVのヘッダーに使うカラム名
+        export_format (ExportFormat): 出力形式
+        filename (str): ダウンロード時のファイル名（拡張子なし）
+        session_factory (async_sessionmaker[AsyncSession]): 送信中の読み取りに使うセッションファクトリ
+
+    Returns:
+        StreamingResponse: ストリーミングレスポンス
+    """
+
+    async def body() -> AsyncIterator[str]:
+        if export_format == ExportFormat.CSV:
+            yield _csv_chunk([columns])
+        encode = _csv_chunk if export_format == ExportFormat.CSV else _ndjson_chunk
+
+        async with session_factory() as db:
+            async for rows in fetch(db):
+                yield encode(rows)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{filename}.{export_format.value}"'
+            )
+        },
+    )
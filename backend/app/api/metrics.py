@@ -0,0 +1,120 @@
+from typing import Iterable
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app import crud
+from app.core.metrics import Counter, Gauge, Histogram, Metric, registry
+from app.db.pool import WAIT_BUCKETS, PoolStats
+from app.db.session import get_async_engine
+from app.middleware import load_shedding
+
+router = APIRouter()
+
+
+def _collect_pool() -> Iterable[Metric]:
+    pool = get_async_engine().pool
+    checked_out = Gauge("db_pool_checked_out", "貸し出し中のコネクション数")
+    checked_out.set(value=pool.checkedout())
+    yield checked_out
+    stats = getattr(pool, "stats", None)
+    if not isinstance(stats, PoolStats):
+        return
+    timeouts = Counter(
+        "db_pool_checkout_timeouts_total", "チェックアウトがタイムアウトした回数"
+    )
+    timeouts.inc(amount=stats.timeouts)
+    yield timeouts
+    wait = Histogram(
+        "db_pool_checkout_wait_seconds",
+        "コネクションのチェックアウトにかかった時間",
+        buckets=WAIT_BUCKETS,
+    )
+    wait.load(
+        bucket_counts=stats.wait_buckets, total=stats.wait_sum, count=stats.wait_count
+    )
+    yield wait
+
+
+def _collect_caches() -> Iterable[Metric]:
+    caches = (crud.get_user_cache(), crud.get_post_cache())
+    size = Gauge("entity_cache_size", "キャッシュの件数", ("cache",))
+    hits = Counter("entity_cache_hits_total", "キャッシュのヒット数", ("cache",))
+    misses = Counter("entity_cache_misses_total", "キャッシュのミス数", ("cache",))
+    for cache in caches:
+        snapshot = cache.snapshot()
+        size.set(cache.name, value=snapshot["size"])
+        hits.inc(cache.name, amount=snapshot["hits"])
+        misses.inc(cache.name, amount=snapshot["misses"])
+    return (size, hits, misses)
+
+
+def _collect_write_behind() -> Iterable[Metric]:
+    writer = crud.get_comment_writer()
+    snapshot = writer.snapshot()
+    depth = Gauge(
+        "write_behind_queue_depth", "書き込み待ちでキューにある行数", ("buffer",)
+    )
+    depth.set(writer.name, value=snapshot["depth"])
+    rows = Counter(
+        "write_behind_rows_total",
+        "書き込みバッファの行数（enqueued, rejected, flushed, spilled, failed）",
+        ("buffer", "outcome"),
+    )
+    for outcome in ("enqueued", "rejected", "flushed", "spilled", "failed"):
+        rows.inc(writer.name, outcome, amount=snapshot[outcome])
+    batches = Counter(
+        "write_behind_batches_total", "書き込みバッファのflush回数", ("buffer",)
+    )
+    batches.inc(writer.name, amount=snapshot["batches"])
+    retries = Counter(
+        "write_behind_retries_total",
+        "失敗したバッチを書き込み直した回数",
+        ("buffer",),
+    )
+    retries.inc(writer.name, amount=snapshot["retried"])
+    return (depth, rows, batches, retries)
+
+
+def _collect_load_shedding() -> Iterable[Metric]:
+    limit = Gauge(
+        "load_shedding_concurrency_limit", "同時実行数の現在の上限", ("kind",)
+    )
+    in_flight = Gauge(
+        "load_shedding_in_flight", "上限の対象として処理中のリクエスト数", ("kind",)
+    )
+    rejected = Counter(
+        "load_shedding_rejected_total",
+        "上限を超えて503で返したリクエスト数",
+        ("kind",),
+    )
+    for limiter in (
+        load_shedding.get_read_limiter(),
+        load_shedding.get_write_limiter(),
+    ):
+        snapshot = limiter.snapshot()
+        limit.set(limiter.name, value=snapshot["limit"])
+        in_flight.set(limiter.name, value=snapshot["in_flight"])
+        rejected.inc(limiter.name, amount=snapshot["rejected"])
+    return (limit, in_flight, rejected)
+
+
+registry.register_collector(_collect_pool)
+registry.register_collector(_collect_write_behind)
+registry.register_collector(_collect_load_shedding)
+registry.register_collector(_collect_caches)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics() -> PlainTextResponse:
+    """Prometheusのテキスト形式でメトリクスを出力するエンドポイント
+
+    値はワーカープロセスごとに集計されるため、複数ワーカーで動かす場合は
+    プロセスごとにスクレイプされる前提とする。
+
+    Returns:
+        PlainTextResponse: Prometheusのテキスト形式（version 0.0.4）
+    """
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,323 @@
+import typing
+from datetime import date, datetime
+from operator import attrgetter
+from typing import Any, Generic, Iterable, Optional, Sequence, Type, TypeVar
+
+from fastapi import Request, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from typing_extensions import TypedDict
+
+from app import schemas
+
+try:
+    import msgpack
+except ImportError:  # オプションの依存関係
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # オプションの依存関係
+    pyarrow = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Acceptヘッダーの値と応答するメディアタイプの対応（ライブラリがないものは応答しない）
+_ACCEPTED_MEDIA_TYPES = {JSON_MEDIA_TYPE: JSON_MEDIA_TYPE}
+if msgpack is not None:
+    _ACCEPTED_MEDIA_TYPES[MSGPACK_MEDIA_TYPE] = MSGPACK_MEDIA_TYPE
+    _ACCEPTED_MEDIA_TYPES["application/x-msgpack"] = MSGPACK_MEDIA_TYPE
+if pyarrow is not None:
+    _ACCEPTED_MEDIA_TYPES[ARROW_MEDIA_TYPE] = ARROW_MEDIA_TYPE
+
+# Arrowのストリームでは本文にカーソルを含められないため、ヘッダーとスキーマのメタデータで返す
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# 一覧のエンドポイントのOpenAPIに載せる、JSON以外のレスポンスの形式
+ALTERNATE_CONTENT = {
+    "content": {MSGPACK_MEDIA_TYPE: {}, ARROW_MEDIA_TYPE: {}},
+    "headers": {
+        NEXT_CURSOR_HEADER: {
+            "description": "JSON以外の形式で返す場合の次ページのカーソル",
+            "schema": {"type": "string"},
+        }
+    },
+}
+
+_any_adapter: TypeAdapter[Any] = TypeAdapter(Any)
+
+
+def negotiate_media_type(request: Request) -> str:
+    """Acceptヘッダーから一覧のレスポンスの形式を選ぶ
+
+    qの値が大きい順に、応答できる最初のメディアタイプを選ぶ。
+    Acceptがない場合やワイルドカードの場合、応答できる形式が含まれていない場合
+    （ブラウザの text/html など）はJSONを選ぶ。
+
+    Args:
+        request (Request): リクエスト
+
+    Returns:
+        str: レスポンスのメディアタイプ
+    """
+    accept = request.headers.get("accept")
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    candidates: list[tuple[float, int, str]] = []
+    for index, part in enumerate(accept.split(",")):
+        media_range, *params = (item.strip() for item in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, index, media_range.lower()))
+
+    for _, _, media_range in sorted(candidates):
+        if media_range in ("*/*", "application/*"):
+            return JSON_MEDIA_TYPE
+        if media_range in _ACCEPTED_MEDIA_TYPES:
+            return _ACCEPTED_MEDIA_TYPES[media_range]
+    # 他のエンドポイントと同じく、406ではなくJSONで返す
+    return JSON_MEDIA_TYPE
+
+
+def etag_variant(media_type: str, fields: Optional[Sequence[str]] = None) -> str:
+    """ETagに含める表現の種類を返す
+
+    全てのフィールドをJSONで返す場合は、従来のETagと同じになるよう空文字を返す。
+
+    Args:
+        media_type (str): レスポンスのメディアタイプ
+        fields (Optional[Sequence[str]]): 返すフィールド。Noneの場合は全てのフィールド
+
+    Returns:
+        str: 表現の種類
+    """
+    parts = [] if media_type == JSON_MEDIA_TYPE else [media_type]
+    if fields is not None:
+        parts.append(f"fields={','.join(fields)}")
+    return ";".join(parts)
+
+
+def _msgpack_default(value: Any) -> Any:
+    # msgpackで表現できない型は、JSONと同じ文字列表現にする
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _arrow_type(annotation: Any) -> Any:
+    # Optional[X] はnull許容のXとして扱う（Annotatedのメタデータはpydanticが取り除く）
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else str
+    if annotation is bool:
+        return pyarrow.bool_()
+    if annotation is int:
+        return pyarrow.int64()
+    if annotation is float:
+        return pyarrow.float64()
+    if annotation is datetime:
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+class JSONBytesResponse(Response):
+    """シリアライズ済みのJSONのバイト列をそのまま返すレスポンス
+
+    bytes以外を渡した場合はpydantic-coreでJSONに変換する。
+    標準のJSONResponseのように json.dumps を経由しない。
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return _any_adapter.dump_json(content)
+
+
+class RowSerializer(Generic[ModelT]):
+    """DBから取得した行をレスポンスモデルの形のJSONに直接変換するシリアライザー
+
+    ORMオブジェクトやRowから、レスポンスモデルのフィールドだけを取り出した辞書を作り、
+    同じフィールドを持つTypedDictのTypeAdapterでJSONのバイト列にする。
+    DBの値は型が保証されているため、レスポンスモデルでの再検証を行わない。
+    TypeAdapterの構築は重いため、モジュールの読み込み時に1度だけ行う。
+    """
+
+    def __init__(self, model: Type[ModelT]) -> None:
+        self.model = model
+        self.fields = tuple(model.model_fields)
+        self._get_values = attrgetter(*self.fields)
+        row_type = TypedDict(
+            f"{model.__name__}Row",
+            {name: field.annotation for name, field in model.model_fields.items()},
+        )
+        page_type = TypedDict(
+            f"{model.__name__}Page",
+            {"items": list[row_type], "next_cursor": Optional[str]},
+        )
+        self._item_adapter = TypeAdapter(row_type)
+        self._page_adapter = TypeAdapter(page_type)
+        self._arrow_schema_cache: Optional[Any] = None
+        self._projections: dict[tuple[str, ...], "RowSerializer"] = {}
+
+    def project(self, fields: Optional[Sequence[str]]) -> "RowSerializer":
+        """指定したフィールドだけを返すシリアライザーを返す
+
+        フィールドの組み合わせごとにレスポンスモデルを動的に作成し、作成したものは使い回す。
+
+        Args:
+            fields (Optional[Sequence[str]]): 返すフィールド。Noneの場合は全てのフィールド
+
+        Returns:
+            RowSerializer: 指定したフィールドだけを返すシリアライザー
+        """
+        if fields is None or tuple(fields) == self.fields:
+            return self
+        key = tuple(fields)
+        if key not in self._projections:
+            model = create_model(
+                f"{self.model.__name__}_{'_'.join(key)}",
+                __config__=ConfigDict(from_attributes=True),
+                **{
+                    name: (self.model.model_fields[name].annotation, ...)
+                    for name in key
+                },
+            )
+            self._projections[key] = RowSerializer(model)
+        return self._projections[key]
+
+    def _arrow_schema(self) -> Any:
+        if self._arrow_schema_cache is None:
+            self._arrow_schema_cache = pyarrow.schema(
+                [
+                    (name, _arrow_type(field.annotation))
+                    for name, field in self.model.model_fields.items()
+                ]
+            )
+        return self._arrow_schema_cache
+
+    def to_dict(self, row: Any) -> dict[str, Any]:
+        """行からレスポンスモデルのフィールドの値を取り出す"""
+        values = self._get_values(row)
+        if len(self.fields) == 1:
+            values = (values,)
+        return dict(zip(self.fields, values))
+
+    def dump(self, row: Any) -> bytes:
+        """1行をJSONのバイト列に変換する
+
+        Args:
+            row (Any): レスポンスモデルのフィールドを属性に持つ行
+
+        Returns:
+            bytes: JSONのバイト列
+        """
+        return self._item_adapter.dump_json(self.to_dict(row))
+
+    def dump_page(self, rows: Iterable[Any], next_cursor: Optional[str]) -> bytes:
+        """1ページ分の行を schemas.Page と同じ形のJSONのバイト列に変換する
+
+        Args:
+            rows (Iterable[Any]): レスポンスモデルのフィールドを属性に持つ行
+            next_cursor (Optional[str]): 次ページのカーソル
+
+        Returns:
+            bytes: JSONのバイト列
+        """
+        return self._page_adapter.dump_json(
+            {"items": [self.to_dict(row) for row in rows], "next_cursor": next_cursor}
+        )
+
+    def dump_page_msgpack(
+        self, rows: Iterable[Any], next_cursor: Optional[str]
+    ) -> bytes:
+        """1ページ分の行を schemas.Page と同じ形のMessagePackに変換する
+
+        Args:
+            rows (Iterable[Any]): レスポンスモデルのフィールドを属性に持つ行
+            next_cursor (Optional[str]): 次ページのカーソル
+
+        Returns:
+            bytes: MessagePackのバイト列
+        """
+        return msgpack.packb(
+            {"items": [self.to_dict(row) for row in rows], "next_cursor": next_cursor},
+            default=_msgpack_default,
+        )
+
+    def dump_page_arrow(self, rows: Sequence[Any], next_cursor: Optional[str]) -> bytes:
+        """1ページ分の行をArrowのIPCストリーム（1つのレコードバッチ）に変換する
+
+        行を経由せず、フィールドごとの列として組み立てる。
+        次ページのカーソルはスキーマのメタデータに含める。
+
+        Args:
+            rows (Sequence[Any]): レスポンスモデルのフィールドを属性に持つ行
+            next_cursor (Optional[str]): 次ページのカーソル
+
+        Returns:
+            bytes: Arrow IPCストリームのバイト列
+        """
+        schema = self._arrow_schema().with_metadata({"next_cursor": next_cursor or ""})
+        values = [self._get_values(row) for row in rows]
+        if len(self.fields) == 1:
+            values = [(value,) for value in values]
+        columns = list(zip(*values)) if values else [()] * len(self.fields)
+        batch = pyarrow.record_batch(
+            [
+                pyarrow.array(column, type=field.type)
+                for column, field in zip(columns, schema)
+            ],
+            schema=schema,
+        )
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+    def render_page(
+        self, rows: Sequence[Any], next_cursor: Optional[str], media_type: str
+    ) -> Response:
+        """1ページ分の行を指定したメディアタイプのレスポンスにする
+
+        Args:
+            rows (Sequence[Any]): レスポンスモデルのフィールドを属性に持つ行
+            next_cursor (Optional[str]): 次ページのカーソル
+            media_type (str): negotiate_media_type で選んだメディアタイプ
+
+        Returns:
+            Response: レスポンス
+        """
+        if media_type == MSGPACK_MEDIA_TYPE:
+            response = Response(
+                self.dump_page_msgpack(rows, next_cursor), media_type=media_type
+            )
+        elif media_type == ARROW_MEDIA_TYPE:
+            response = Response(
+                self.dump_page_arrow(rows, next_cursor), media_type=media_type
+            )
+        else:
+            response = JSONBytesResponse(self.dump_page(rows, next_cursor))
+        if next_cursor and media_type != JSON_MEDIA_TYPE:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        response.headers["Vary"] = "Accept"
+        return response
+
+
+users = RowSerializer(schemas.UserResponse)
+posts = RowSerializer(schemas.PostResponse)
+post_search_results = RowSerializer(schemas.PostSearchResult)
+comments_with_user = RowSerializer(schemas.CommentWithUserResponse)
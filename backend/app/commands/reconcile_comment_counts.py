@@ -0,0 +1,32 @@
+"""投稿のコメント数を実際のコメントの件数に合わせて修正するコマンド
+
+コメント数はコメントの作成・削除と同じトランザクションで増減させているが、
+アプリを経由しない書き込みなどでずれた場合に実行する。
+
+使い方:
+    pipenv run python -m app.commands.reconcile_comment_counts --batch-size 1000
+"""
+
+import argparse
+import asyncio
+
+from app import crud
+from app.db.session import get_async_session_local
+
+
+async def reconcile(batch_size: int) -> int:
+    async with get_async_session_local()() as db:
+        return await crud.reconcile_comment_counts(db, batch_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    fixed = asyncio.run(reconcile(args.batch_size))
+    print(f"reconciled comment_count of {fixed} posts")
+
+
+if __name__ == "__main__":
+    main()
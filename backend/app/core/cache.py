@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """キャッシュのヒット・ミス・追い出しの回数"""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class EntityCache(Generic[V]):
+    """件数上限とTTLを持つプロセス内のLRUキャッシュ
+
+    ワーカープロセスごとに独立しているため、他のワーカーでの更新は
+    TTLが切れるまで反映されない。更新・削除を行ったプロセスでは
+    invalidate を呼ぶことで即座に反映される。
+    イベントループ上で await を挟まずに操作するため、ロックは不要。
+
+    DBから読んでいる間に invalidate された値を保存しないよう、読み込みの前に
+    generation を取得して set に渡す。invalidate はキーごとに世代を進め、
+    渡された世代より後に invalidate されたキーには保存しない。
+    """
+
+    def __init__(
+        self, name: str, max_size: int, ttl_seconds: float, enabled: bool = True
+    ) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+        # キーごとの最後に invalidate されたときの世代（件数は max_size までに抑える）
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._generation = 0
+        # _invalidated から追い出した世代のうち最も新しいもの。これ以前に読み始めた値は保存しない
+        self._forgotten_generation = 0
+
+    def generation(self) -> int:
+        """DBから読み込む前に、現在の世代を取得する
+
+        Returns:
+            int: set に渡す世代
+        """
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """キャッシュから値を取得する
+
+        Args:
+            key (Hashable): キー
+
+        Returns:
+            Optional[V]: キャッシュされた値。存在しないか期限切れの場合はNone
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, generation: Optional[int] = None) -> None:
+        """値をキャッシュに保存する
+
+        件数が上限を超えた場合は、最も長く使われていない値を追い出す。
+
+        Args:
+            key (Hashable): キー
+            value (V): 保存する値
+            generation (Optional[int]): 値を読み込む前に generation で取得した世代。
+                その後にキーが invalidate されていた場合は保存しない
+        """
+        if not self.enabled:
+            return
+        if generation is not None and (
+            generation < self._forgotten_generation
+            or self._invalidated.get(key, 0) > generation
+        ):
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """キーに対応する値をキャッシュから取り除く
+
+        Args:
+            key (Hashable): キー
+        """
+        self._entries.pop(key, None)
+        self._generation += 1
+        self._invalidated[key] = self._generation
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > self.max_size:
+            _, generation = self._invalidated.popitem(last=False)
+            self._forgotten_generation = generation
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        self._entries.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        """現在の件数と統計情報を返す
+
+        Returns:
+            dict[str, Any]: キャッシュ名、件数、ヒット・ミス・追い出しの回数
+        """
+        return {"name": self.name, "size": len(self._entries), **asdict(self.stats)}
@@ -0,0 +1,69 @@
+import time
+
+
+class AIMDLimiter:
+    """AIMD (加算増加・乗算減少) で上限を調整する同時実行数のリミッター
+
+    過負荷の兆候がない応答ごとに上限を 1/上限 ずつ増やし（上限の件数分の応答でおよそ+1）、
+    過負荷の兆候があれば上限に backoff_ratio を掛けて減らす。
+    同じ過負荷の間に処理中だった複数の応答で何度も減らさないよう、減少は
+    cooldown_seconds 以上の間隔を空ける。
+    イベントループ上で await を挟まずに操作するため、ロックは不要。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        backoff_ratio: float,
+        cooldown_seconds: float,
+    ) -> None:
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.cooldown_seconds = cooldown_seconds
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.rejected = 0
+        self._last_decrease = 0.0
+
+    def try_acquire(self) -> bool:
+        """上限に空きがあれば処理中の件数を1つ増やす
+
+        Returns:
+            bool: 処理してよい場合はTrue。上限に達している場合はFalse
+        """
+        if self.in_flight >= int(self.limit):
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, overloaded: bool) -> None:
+        """処理の終了を記録し、過負荷の兆候に応じて上限を調整する
+
+        Args:
+            overloaded (bool): レイテンシやコネクションの待ち時間が目標を超えた場合はTrue
+        """
+        # 上限の判定に使われていたのは終了前の処理中の件数
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if overloaded:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown_seconds:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._last_decrease = now
+        elif in_flight >= self.limit / 2:
+            # 上限の半分も使っていない間は、上限が妥当か分からないため増やさない
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def snapshot(self) -> dict:
+        """メトリクス用に現在の状態を返す"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
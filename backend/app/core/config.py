@@ -1,8 +1,10 @@
 import enum
-from typing import Any, Optional
+from functools import lru_cache
+from typing import Any, List, Optional
 
 from pydantic import PostgresDsn, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings
+from sqlalchemy.engine import make_url
 
 
 class AppEnvironment(str, enum.Enum):
@@ -10,6 +12,11 @@ class AppEnvironment(str, enum.Enum):
     PRODUCTION = "production"
 
 
+class ReplicaRouting(str, enum.Enum):
+    ROUND_ROBIN = "round_robin"
+    LEAST_CONNECTIONS = "least_connections"
+
+
 class Settings(BaseSettings):
     ENVIRONMENT: AppEnvironment
 
@@ -22,6 +29,77 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_PORT: str
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    SQLALCHEMY_ASYNC_DATABASE_URI: Optional[str] = None
+
+    # 読み取り専用レプリカ（JSON配列で指定する。空の場合は全てプライマリに接続する）
+    SQLALCHEMY_REPLICA_URIS: List[str] = []
+    REPLICA_ROUTING: ReplicaRouting = ReplicaRouting.ROUND_ROBIN
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_HEALTH_CHECK_INTERVAL_SECONDS: float = 5.0
+    # 書き込みを行ったクライアントの読み取りをプライマリに固定する秒数
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # コネクションプール関連
+    # DB_POOL_SIZE / DB_MAX_OVERFLOW を指定しない場合は、全ワーカーで使ってよい
+    # 接続数 (DB_MAX_CONNECTIONS) をワーカー数 (WEB_CONCURRENCY) で割った値から決める。
+    # DB_MAX_CONNECTIONS はPostgreSQLのmax_connectionsのうちこのアプリに割り当てる分にする
+    WEB_CONCURRENCY: int = 1
+    DB_MAX_CONNECTIONS: int = 20
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_SIZE: Optional[int] = None
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    # 0の場合はPostgreSQL側の設定をそのまま使う
+    DB_STATEMENT_TIMEOUT_MS: int = 0
+    DB_IDLE_IN_TRANSACTION_SESSION_TIMEOUT_MS: int = 0
+    # 起動時に作成・検証しておくコネクション数（Noneの場合はDB_POOL_SIZE、0の場合は行わない）
+    DB_POOL_WARMUP_CONNECTIONS: Optional[int] = None
+    DB_POOL_WARMUP_TIMEOUT_SECONDS: float = 10.0
+
+    # ユーザー・投稿の主キー検索に使うプロセス内キャッシュ
+    ENTITY_CACHE_ENABLED: bool = True
+    ENTITY_CACHE_MAX_SIZE: int = 10000
+    ENTITY_CACHE_TTL_SECONDS: float = 30.0
+
+    # コメント作成の非同期受け付け（Prefer: respond-async を指定したリクエストだけが対象）
+    COMMENT_WRITE_BEHIND_ENABLED: bool = False
+    # 最初のコメントを受け付けてから書き込むまでの最大の待ち時間
+    COMMENT_WRITE_BEHIND_FLUSH_INTERVAL_MS: int = 50
+    # 1回の複数行INSERTで書き込む最大件数（バインドパラメータの上限 32767 / 6列 未満にする）
+    COMMENT_WRITE_BEHIND_BATCH_SIZE: int = 500
+    COMMENT_WRITE_BEHIND_QUEUE_SIZE: int = 10000
+    # キューが満杯のときに空きを待つ時間。超えた場合は503を返す
+    COMMENT_WRITE_BEHIND_ENQUEUE_TIMEOUT_MS: int = 100
+    # 書き込みに失敗したバッチを書き込み直す回数（最初の1回を含む）と、最初の間隔（倍々に延ばす）
+    COMMENT_WRITE_BEHIND_MAX_ATTEMPTS: int = 5
+    COMMENT_WRITE_BEHIND_RETRY_BACKOFF_MS: int = 100
+    # 書き込み直しても失敗したコメントを退避するファイル（JSON Lines）。次の起動時に書き込む。
+    # 未設定の場合は稼働中は書き込み直し続け、終了時に書き込めなかったコメントは破棄する
+    COMMENT_WRITE_BEHIND_SPILL_PATH: Optional[str] = None
+
+    # 運用向けのエンドポイント（/metrics と /api/v1/internal/*）。プロセスの内部状態を
+    # 返すため既定では公開せず、有効にする場合はトークンか、ネットワークで制限する
+    INTERNAL_ENDPOINTS_ENABLED: bool = False
+    # 設定した場合は Authorization: Bearer <トークン> を要求する
+    INTERNAL_ENDPOINTS_TOKEN: Optional[str] = None
+
+    # 同時実行数の適応的な上限（読み取りと書き込みで別々に調整する）。
+    # 上限を超えたリクエストは503になるため既定では無効にし、目標値を
+    # 実際のレイテンシに合わせてから有効にする
+    LOAD_SHEDDING_ENABLED: bool = False
+    # 応答の開始までの時間がこれを超えたら上限を下げる。通常時のp99より少し上に設定する
+    # （低すぎると通常の負荷でも上限が下がり続け、503を返してしまう）。
+    # 上限を下げた後、同じ時間が経つまでは再び下げない
+    LOAD_SHEDDING_READ_LATENCY_TARGET_MS: int = 250
+    LOAD_SHEDDING_WRITE_LATENCY_TARGET_MS: int = 500
+    # コネクションのチェックアウト待ちの平均がこれを超えたら上限を下げる。
+    # プールが足りずに待ち始めたことを、レイテンシの目標を超える前に検知するための値
+    LOAD_SHEDDING_POOL_WAIT_TARGET_MS: int = 20
+    # 上限を下げても下回らない値と、上げても超えない値
+    LOAD_SHEDDING_MIN_LIMIT: int = 2
+    LOAD_SHEDDING_MAX_LIMIT: int = 500
+    # 過負荷の兆候があったときに上限に掛ける比率
+    LOAD_SHEDDING_BACKOFF_RATIO: float = 0.9
 
     @field_validator("SQLALCHEMY_DATABASE_URI", mode="after")
     def assemble_db_connection(cls, v: Optional[str], values: ValidationInfo) -> Any:
@@ -39,5 +117,71 @@ class Settings(BaseSettings):
             )
         )
 
+    @field_validator("SQLALCHEMY_ASYNC_DATABASE_URI", mode="after")
+    def assemble_async_db_connection(
+        cls, v: Optional[str], values: ValidationInfo
+    ) -> Any:
+        if isinstance(v, str):
+            return v
+
+        sync_uri = values.data.get("SQLALCHEMY_DATABASE_URI")
+        if not sync_uri:
+            return None
+        return to_async_uri(sync_uri)
+
+    @field_validator("SQLALCHEMY_REPLICA_URIS", mode="after")
+    def assemble_replica_connections(cls, v: List[str]) -> Any:
+        return [to_async_uri(uri) for uri in v]
+
+    @field_validator("DB_MAX_OVERFLOW", mode="after")
+    def assemble_max_overflow(cls, v: Optional[int], values: ValidationInfo) -> Any:
+        if isinstance(v, int):
+            return v
+
+        # 1ワーカーあたりの接続数の1/4をピーク時の一時的な接続に充てる
+        return _connections_per_worker(values) // 4
+
+    @field_validator("DB_POOL_SIZE", mode="after")
+    def assemble_pool_size(cls, v: Optional[int], values: ValidationInfo) -> Any:
+        if isinstance(v, int):
+            return v
+
+        per_worker = _connections_per_worker(values)
+        return max(1, per_worker - (values.data.get("DB_MAX_OVERFLOW") or 0))
+
+
+def to_async_uri(uri: str) -> str:
+    """接続URIのドライバ部分だけをasyncpgに差し替える"""
+    return (
+        make_url(uri)
+        .set(drivername="postgresql+asyncpg")
+        .render_as_string(hide_password=False)
+    )
+
+
+def _connections_per_worker(values: ValidationInfo) -> int:
+    workers = max(1, values.data.get("WEB_CONCURRENCY") or 1)
+    return max(1, (values.data.get("DB_MAX_CONNECTIONS") or 0) // workers)
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """環境変数から設定を読み込む（最初の呼び出しで1度だけ作成する）
+
+    Returns:
+        Settings: 設定
+    """
+    return Settings()
+
+
+class _LazySettings:
+    """属性を最初に参照したときに get_settings() で設定を読み込むプロキシ
+
+    モジュールの読み込みだけでは環境変数を必要としないよう、読み込みを実行時まで遅らせる。
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
 
-settings = Settings()
+settings: Settings = _LazySettings()  # type: ignore[assignment]
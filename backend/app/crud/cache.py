@@ -0,0 +1,141 @@
+from functools import lru_cache
+from typing import Any, Optional, Sequence, Type, TypeVar
+
+from sqlalchemy import any_, bindparam, inspect, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.cache import EntityCache
+from app.core.config import settings
+
+ModelT = TypeVar("ModelT")
+
+
+def _create_entity_cache(name: str) -> EntityCache[dict[str, Any]]:
+    return EntityCache(
+        name,
+        max_size=settings.ENTITY_CACHE_MAX_SIZE,
+        ttl_seconds=settings.ENTITY_CACHE_TTL_SECONDS,
+        enabled=settings.ENTITY_CACHE_ENABLED,
+    )
+
+
+@lru_cache
+def get_user_cache() -> EntityCache[dict[str, Any]]:
+    """ユーザーのキャッシュを返す（設定は最初の呼び出しで読み込む）"""
+    return _create_entity_cache("user")
+
+
+@lru_cache
+def get_post_cache() -> EntityCache[dict[str, Any]]:
+    """投稿のキャッシュを返す（設定は最初の呼び出しで読み込む）"""
+    return _create_entity_cache("post")
+
+
+async def get_cached_by_id(
+    db: AsyncSession,
+    cache: EntityCache,
+    model: Type[ModelT],
+    entity_id: str,
+    use_cache: bool = True,
+) -> Optional[ModelT]:
+    """キャッシュを経由して主キーでエンティティを取得する
+
+    キャッシュにはセッションに依存しないカラム値の辞書を保存し、ヒットした場合は
+    merge(load=False) でSQLを発行せずに現在のセッションへ結び付ける。
+    レプリカから読んだ値や、読んでいる間に無効化された値は、古い値を再び
+    キャッシュしないよう保存しない。
+
+    Args:
+        db (AsyncSession): DBセッション
+        cache (EntityCache): 使用するキャッシュ
+        model (Type[ModelT]): 取得するモデル
+        entity_id (str): 主キー
+        use_cache (bool): Falseの場合はキャッシュを読まずにDBから取得する
+
+    Returns:
+        Optional[ModelT]: 取得されたエンティティ。存在しない場合はNone
+    """
+    values = cache.get(entity_id) if use_cache else None
+    if values is not None:
+        instance = model(**values)
+        make_transient_to_detached(instance)
+        return await db.merge(instance, load=False)
+
+    generation = cache.generation()
+    instance = await db.scalar(select(model).where(model.id == entity_id))
+    if instance is not None:
+        _store(db, cache, model, instance, generation)
+    return instance
+
+
+async def get_many_cached_by_ids(
+    db: AsyncSession, cache: EntityCache, model: Type[ModelT], ids: Sequence[str]
+) -> tuple[list[ModelT], list[str]]:
+    """キャッシュを経由して複数の主キーでエンティティをまとめて取得する
+
+    キャッシュにないIDは配列を1つのパラメータとして渡す `id = ANY(:ids)` の
+    1回のクエリで取得する。IN句と異なり件数によってSQLの形が変わらないため、
+    プリペアドステートメントを使い回せる。
+
+    Args:
+        db (AsyncSession): DBセッション
+        cache (EntityCache): 使用するキャッシュ
+        model (Type[ModelT]): 取得するモデル
+        ids (Sequence[str]): 主キーの一覧
+
+    Returns:
+        tuple[list[ModelT], list[str]]: idsの順序に並べたエンティティ（重複したIDは最初の1件）と、
+            存在しなかったIDの一覧
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    found: dict[str, ModelT] = {}
+    misses: list[str] = []
+    for entity_id in unique_ids:
+        values = cache.get(entity_id)
+        if values is None:
+            misses.append(entity_id)
+            continue
+        instance = model(**values)
+        make_transient_to_detached(instance)
+        found[entity_id] = await db.merge(instance, load=False)
+
+    if misses:
+        generation = cache.generation()
+        result = await db.scalars(
+            select(model).where(
+                model.id == any_(bindparam("ids", misses, type_=ARRAY(model.id.type)))
+            )
+        )
+        for instance in result.all():
+            _store(db, cache, model, instance, generation)
+            found[instance.id] = instance
+
+    return (
+        [found[entity_id] for entity_id in unique_ids if entity_id in found],
+        [entity_id for entity_id in unique_ids if entity_id not in found],
+    )
+
+
+def _store(
+    db: AsyncSession,
+    cache: EntityCache,
+    model: Type[ModelT],
+    instance: Any,
+    generation: int,
+) -> None:
+    # レプリカの値は遅延している可能性があるため、キャッシュには保存しない
+    if db.info.get("replica"):
+        return
+    # 遅延読み込みのカラムは読み込むとSQLが発行されるため、読み込み済みの値だけを保存する
+    unloaded = inspect(instance).unloaded
+    cache.set(
+        instance.id,
+        {
+            attr.key: getattr(instance, attr.key)
+            for attr in inspect(model).column_attrs
+            if attr.key not in unloaded
+        },
+        generation,
+    )
@@ -1,90 +1,394 @@
-from sqlalchemy.orm import Session
+import logging
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Row, delete, insert, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
+from app.crud.cache import get_post_cache
+from app.core.config import settings
+from app.crud.post import adjust_comment_count
+from app.db.ids import new_id
+from app.db.pagination import Cursor, keyset_paginate, split_page
+from app.db.session import get_async_session_local
+from app.db.write_behind import JsonLinesSpill, WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# エクスポートで出力するカラム
+COMMENT_EXPORT_COLUMNS = (
+    "id",
+    "user_id",
+    "post_id",
+    "content",
+    "created_at",
+    "updated_at",
+    "user_name",
+)
+
+# 一覧で返すフィールドと取得する列の対応
+COMMENT_LIST_COLUMNS = {
+    "id": models.Comment.id,
+    "user_id": models.Comment.user_id,
+    "post_id": models.Comment.post_id,
+    "content": models.Comment.content,
+    "user_name": models.User.name.label("user_name"),
+}
 
 
-def create_comment_for_post(
-    db: Session, comment: schemas.CommentCreate, post_id: str
+async def create_comment_for_post(
+    db: AsyncSession, comment: schemas.CommentCreate, post_id: str
 ) -> models.Comment:
     """投稿にコメントを作成する関数
 
+    投稿のコメント数も同じトランザクションで増やす。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         comment (schemas.CommentCreate): 作成するコメントの情報
         post_id (str): コメントを作成する投稿のID
 
     Returns:
         models.Comment: 作成されたコメントの情報
     """
-    db_comment = models.Comment(**comment.dict(), post_id=post_id)
+    db_comment = models.Comment(**comment.model_dump(), post_id=post_id)
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    await adjust_comment_count(db, post_id, 1)
+    await db.commit()
+    get_post_cache().invalidate(post_id)
+    await db.refresh(db_comment)
     return db_comment
 
 
-def get_comments_for_post(db: Session, post_id: str) -> list[models.Comment]:
-    """投稿に対するコメントの一覧を取得する関数
+async def create_comments_bulk(
+    db: AsyncSession, comments: List[schemas.CommentCreate], post_id: str
+) -> Optional[Tuple[list[models.Comment], list[schemas.BulkItemError]]]:
+    """投稿に複数のコメントを1トランザクションで作成する関数
+
+    投稿の存在とコメント投稿者の存在を1回のクエリでまとめて確認し、存在しない
+    ユーザーを参照する要素はエラーとして除外する。残りは1回の
+    INSERT ... RETURNINGで作成し、投稿のコメント数も同じトランザクションで増やす。
 
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
+        comments (List[schemas.CommentCreate]): 作成するコメントの情報の一覧
+        post_id (str): コメントを作成する投稿のID
+
+    Returns:
+        Optional[Tuple[list[models.Comment], list[schemas.BulkItemError]]]: 作成されたコメントの一覧と作成できなかった要素のエラー。投稿が存在しない場合はNone
+    """
+    user_ids = {comment.user_id for comment in comments}
+    users = select(models.User.id).where(models.User.id.in_(user_ids)).subquery()
+    # 投稿を起点に外部結合するため、投稿が存在しなければ行が返らない
+    rows = (
+        await db.execute(
+            select(users.c.id)
+            .select_from(models.Post)
+            .outerjoin(users, true())
+            .where(models.Post.id == post_id)
+        )
+    ).all()
+    if not rows:
+        return None
+    existing_user_ids = {row.id for row in rows if row.id is not None}
+
+    valid: list[dict] = []
+    errors: list[schemas.BulkItemError] = []
+    for index, comment in enumerate(comments):
+        if comment.user_id in existing_user_ids:
+            valid.append({**comment.model_dump(), "post_id": post_id})
+        else:
+            errors.append(schemas.BulkItemError(index=index, detail="User not found"))
+
+    created: list[models.Comment] = []
+    if valid:
+        result = await db.scalars(
+            insert(models.Comment).returning(
+                models.Comment, sort_by_parameter_order=True
+            ),
+            valid,
+        )
+        created = list(result.all())
+        await adjust_comment_count(db, post_id, len(created))
+        await db.commit()
+        get_post_cache().invalidate(post_id)
+    return created, errors
+
+
+async def insert_comments_batch(db: AsyncSession, rows: List[dict]) -> int:
+    """受け付け済みのコメントを1回の複数行INSERTでまとめて作成する関数
+
+    受け付けてから書き込むまでの間に削除された投稿・ユーザーを参照する行は作成せず、
+    ログに記録して破棄する。投稿のコメント数も同じトランザクションで増やす。
+    作成済みのIDの行は飛ばすため、書き込み直しで同じ行を渡しても重複しない。
+
+    Args:
+        db (AsyncSession): DBセッション
+        rows (List[dict]): IDと作成日時を割り当て済みのコメントの列の値
+
+    Returns:
+        int: 作成したコメントの件数
+    """
+    post_ids = {row["post_id"] for row in rows}
+    user_ids = {row["user_id"] for row in rows}
+    existing_post_ids = set(
+        await db.scalars(select(models.Post.id).where(models.Post.id.in_(post_ids)))
+    )
+    existing_user_ids = set(
+        await db.scalars(select(models.User.id).where(models.User.id.in_(user_ids)))
+    )
+    valid = [
+        row
+        for row in rows
+        if row["post_id"] in existing_post_ids and row["user_id"] in existing_user_ids
+    ]
+    if len(valid) < len(rows):
+        logger.warning(
+            "Dropped %d queued comments referencing missing posts or users",
+            len(rows) - len(valid),
+        )
+    if not valid:
+        return 0
+
+    # 書き込み直しで同じ行が2回書き込まれても重複しないよう、既に作成済みのIDは飛ばし、
+    # 実際に作成した行だけをコメント数に数える
+    created_post_ids = await db.scalars(
+        pg_insert(models.Comment)
+        .values(valid)
+        .on_conflict_do_nothing(index_elements=[models.Comment.id])
+        .returning(models.Comment.post_id)
+    )
+    counts = Counter(created_post_ids.all())
+    # 複数のワーカーが同じ投稿を更新してもデッドロックしないよう、ID順に行ロックを取る
+    for post_id in sorted(counts):
+        await adjust_comment_count(db, post_id, counts[post_id])
+    await db.commit()
+    for post_id in counts:
+        get_post_cache().invalidate(post_id)
+    return sum(counts.values())
+
+
+async def _flush_comments(rows: List[dict]) -> None:
+    async with get_async_session_local()() as db:
+        await insert_comments_batch(db, rows)
+
+
+def _decode_comment_row(values: dict) -> dict:
+    # 退避したファイルでは文字列になっている日時を戻す
+    return {
+        **values,
+        "created_at": datetime.fromisoformat(values["created_at"]),
+        "updated_at": datetime.fromisoformat(values["updated_at"]),
+    }
+
+
+@lru_cache
+def get_comment_writer() -> WriteBehindBuffer[dict]:
+    """非同期で受け付けたコメントを溜めて書き込むバッファを返す
+
+    アプリのlifespanで開始・停止する。設定は最初の呼び出しで読み込む。
+    """
+    return WriteBehindBuffer(
+        "comments",
+        _flush_comments,
+        max_batch=settings.COMMENT_WRITE_BEHIND_BATCH_SIZE,
+        flush_interval_seconds=settings.COMMENT_WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000,
+        max_queue=settings.COMMENT_WRITE_BEHIND_QUEUE_SIZE,
+        enqueue_timeout_seconds=settings.COMMENT_WRITE_BEHIND_ENQUEUE_TIMEOUT_MS / 1000,
+        max_attempts=settings.COMMENT_WRITE_BEHIND_MAX_ATTEMPTS,
+        retry_backoff_seconds=settings.COMMENT_WRITE_BEHIND_RETRY_BACKOFF_MS / 1000,
+        spill=(
+            JsonLinesSpill(
+                settings.COMMENT_WRITE_BEHIND_SPILL_PATH, _decode_comment_row
+            )
+            if settings.COMMENT_WRITE_BEHIND_SPILL_PATH
+            else None
+        ),
+    )
+
+
+async def enqueue_comment_for_post(
+    comment: schemas.CommentCreate, post_id: str
+) -> Optional[dict]:
+    """投稿へのコメントを書き込みバッファに入れる関数
+
+    IDと作成日時は受け付けた時点で割り当てるため、書き込みを待たずに返せる。
+
+    Args:
+        comment (schemas.CommentCreate): 作成するコメントの情報
+        post_id (str): コメントを作成する投稿のID
+
+    Returns:
+        Optional[dict]: 受け付けたコメントの列の値。バッファが満杯で受け付けられなかった場合はNone
+    """
+    now = datetime.utcnow()
+    row = {
+        **comment.model_dump(),
+        "id": new_id(),
+        "post_id": post_id,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if not await get_comment_writer().put(row):
+        return None
+    return row
+
+
+async def get_comments_for_post(
+    db: AsyncSession,
+    post_id: str,
+    limit: int,
+    after: Optional[Cursor] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Optional[Tuple[list[Row], Optional[str]]]:
+    """投稿に対するコメントの一覧を投稿者名付きで1ページ分取得する関数
+
+    投稿を起点にコメントとユーザーをLATERAL結合した1本のクエリで取得するため、
+    コメント件数に関わらずSQLは1回だけ発行される。Userのエンティティは読み込まず、
+    必要なカラムだけを射影する。ユーザーは1ページ分のコメントに絞り込んだ後に結合するため、
+    コメントの多い投稿でも読むのはページの行数分だけになる。
+    投稿が存在しない場合は行が返らず、コメントが0件の場合はコメント列がNULLの
+    1行が返るため、投稿の存在確認も同じクエリで行える。
+    fieldsを指定した場合はその列だけを射影し、user_nameを含まなければユーザーを結合しない。
+
+    Args:
+        db (AsyncSession): DBセッション
         post_id (str): 取得するコメントの投稿のID
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろのコメントを取得する
+        fields (Optional[Sequence[str]]): 取得するフィールド。Noneの場合は全てのフィールドを取得する
 
     Returns:
-        list[models.Comment]: 取得されたコメントの一覧
+        Optional[Tuple[list[Row], Optional[str]]]: 取得されたコメントの一覧と次ページのカーソル。投稿が存在しない場合はNone
     """
-    return db.query(models.Comment).filter(models.Comment.post_id == post_id).all()
+    names = COMMENT_LIST_COLUMNS if fields is None else fields
+    with_user = "user_name" in names
+    # idとcreated_atは次ページのカーソルに使うため常に取得する
+    columns = [models.Comment.id, models.Comment.created_at] + [
+        COMMENT_LIST_COLUMNS[name] for name in names if name not in ("id", "user_name")
+    ]
+    if with_user and "user_id" not in names:
+        columns.append(models.Comment.user_id)
+    # インデックス順に1ページ分のコメントへ絞り込んでから、その行だけにユーザーを結合する
+    page = keyset_paginate(
+        select(*columns).where(models.Comment.post_id == post_id),
+        models.Comment,
+        limit,
+        after,
+    ).lateral()
+    stmt = select(page).select_from(models.Post).outerjoin(page, true())
+    if with_user:
+        stmt = stmt.add_columns(COMMENT_LIST_COLUMNS["user_name"]).outerjoin(
+            models.User, models.User.id == page.c.user_id
+        )
+    stmt = stmt.where(models.Post.id == post_id).order_by(page.c.created_at, page.c.id)
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return None
+    return split_page([row for row in rows if row.id is not None], limit)
+
+
+async def stream_comments_for_post(
+    db: AsyncSession, post_id: str, batch_size: int = 1000
+) -> AsyncIterator[Sequence[Row]]:
+    """投稿に対するコメントの全件を投稿者名付きでバッチ単位に取得する関数
 
+    サーバーサイドカーソルを使うため、件数に関わらず一度に読み込むのは
+    batch_size件だけになる。
 
-def get_comment_by_id(db: Session, comment_id: str) -> models.Comment:
+    Args:
+        db (AsyncSession): DBセッション
+        post_id (str): 取得するコメントの投稿のID
+        batch_size (int, optional): 1回に取得する件数. Defaults to 1000.
+
+    Yields:
+        Sequence[Row]: (created_at, id) 順のコメントのバッチ
+    """
+    stmt = (
+        select(
+            models.Comment.id,
+            models.Comment.user_id,
+            models.Comment.post_id,
+            models.Comment.content,
+            models.Comment.created_at,
+            models.Comment.updated_at,
+            models.User.name.label("user_name"),
+        )
+        .join(models.User, models.User.id == models.Comment.user_id)
+        .where(models.Comment.post_id == post_id)
+        .order_by(models.Comment.created_at, models.Comment.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_comment_by_id(db: AsyncSession, comment_id: str) -> models.Comment:
     """コメントの詳細を取得する関数
 
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         comment_id (str): 取得するコメントのID
 
     Returns:
         models.Comment: 取得されたコメント
     """
-    return db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    return await db.scalar(
+        select(models.Comment).where(models.Comment.id == comment_id)
+    )
 
 
-def update_comment(
-    db: Session, comment_id: str, comment: schemas.CommentUpdate
-) -> models.Comment:
+async def update_comment(
+    db: AsyncSession, comment_id: str, comment: schemas.CommentUpdate
+) -> Optional[models.Comment]:
     """コメントを更新する関数
 
+    UPDATE ... RETURNINGで更新と更新後の行の取得を1回のクエリで行う。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         comment_id (str): 更新するコメントのID
         comment (schemas.CommentUpdate): 更新するコメントの情報
 
     Returns:
-        models.Comment: 更新されたコメント
+        Optional[models.Comment]: 更新されたコメント。コメントが存在しない場合はNone
     """
-    db_comment = (
-        db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    db_comment = await db.scalar(
+        update(models.Comment)
+        .where(models.Comment.id == comment_id)
+        .values(**comment.model_dump(exclude_unset=True))
+        .returning(models.Comment)
     )
-    for key, value in comment.model_dump(exclude_unset=True).items():
-        setattr(db_comment, key, value)
-    db.commit()
-    db.refresh(db_comment)
+    await db.commit()
     return db_comment
 
 
-def delete_comment(db: Session, comment_id: str) -> models.Comment:
+async def delete_comment(db: AsyncSession, comment_id: str) -> Optional[models.Comment]:
     """コメントを削除する関数
 
+    DELETE ... RETURNINGで削除と削除した行の取得を1回のクエリで行い、
+    投稿のコメント数も同じトランザクションで減らす。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         comment_id (str): 削除するコメントのID
 
     Returns:
-        models.Comment: 削除されたコメント
+        Optional[models.Comment]: 削除されたコメント。コメントが存在しない場合はNone
     """
-    db_comment = (
-        db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    db_comment = await db.scalar(
+        delete(models.Comment)
+        .where(models.Comment.id == comment_id)
+        .returning(models.Comment)
     )
-    db.delete(db_comment)
-    db.commit()
+    if db_comment is not None:
+        await adjust_comment_count(db, db_comment.post_id, -1)
+    await db.commit()
+    if db_comment is not None:
+        get_post_cache().invalidate(db_comment.post_id)
     return db_comment
@@ -1,13 +1,40 @@
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import REAL, Row, delete, func, insert, select, true, update
+from sqlalchemy.dialects.postgresql import websearch_to_tsquery
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from app import models, schemas
+from app.crud.cache import get_cached_by_id, get_many_cached_by_ids, get_post_cache
+from app.db.pagination import (
+    Cursor,
+    SearchCursor,
+    keyset_paginate,
+    project_page,
+    rank_paginate,
+    split_page,
+    split_search_page,
+)
+from app.models.post import SEARCH_CONFIG
+
+# エクスポートで出力するカラム
+POST_EXPORT_COLUMNS = (
+    "id",
+    "user_id",
+    "title",
+    "content",
+    "comment_count",
+    "created_at",
+    "updated_at",
+)
 
 
-def create_post(db: Session, post: schemas.PostCreate) -> models.Post:
+async def create_post(db: AsyncSession, post: schemas.PostCreate) -> models.Post:
     """投稿を作成する関数
 
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         post (PostCreate): 作成する投稿の情報
 
     Returns:
@@ -15,79 +42,450 @@ def create_post(db: Session, post: schemas.PostCreate) -> models.Post:
     """
     db_post = models.Post(**post.model_dump())
     db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
+    await db.commit()
+    await db.refresh(db_post)
     return db_post
 
 
-def get_posts(db: Session) -> list[models.Post]:
-    """投稿の一覧を取得する関数
+async def create_posts_bulk(
+    db: AsyncSession, posts: List[schemas.PostCreate]
+) -> Tuple[list[models.Post], list[schemas.BulkItemError]]:
+    """複数の投稿を1トランザクションで作成する関数
+
+    投稿者の存在確認は全要素分をまとめて1回のクエリで行い、存在しないユーザーを
+    参照する要素はエラーとして除外する。残りは1回のINSERT ... RETURNINGで作成する。
+
+    Args:
+        db (AsyncSession): DBセッション
+        posts (List[schemas.PostCreate]): 作成する投稿の情報の一覧
+
+    Returns:
+        Tuple[list[models.Post], list[schemas.BulkItemError]]: 作成された投稿の一覧と作成できなかった要素のエラー
+    """
+    user_ids = {post.user_id for post in posts}
+    existing_user_ids = set(
+        await db.scalars(select(models.User.id).where(models.User.id.in_(user_ids)))
+    )
+
+    valid: list[dict] = []
+    errors: list[schemas.BulkItemError] = []
+    for index, post in enumerate(posts):
+        if post.user_id in existing_user_ids:
+            valid.append(post.model_dump())
+        else:
+            errors.append(schemas.BulkItemError(index=index, detail="User not found"))
+
+    created: list[models.Post] = []
+    if valid:
+        result = await db.scalars(
+            insert(models.Post).returning(models.Post, sort_by_parameter_order=True),
+            valid,
+        )
+        created = list(result.all())
+        await db.commit()
+    return created, errors
+
+
+async def get_posts(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[Cursor] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple[list[models.Post], Optional[str]]:
+    """投稿の一覧を (created_at, id) 順に1ページ分取得する関数
+
+    Args:
+        db (AsyncSession): DBセッション
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろの投稿を取得する
+        fields (Optional[Sequence[str]]): 読み込むフィールド。Noneの場合は全ての列を読み込む
+
+    Returns:
+        Tuple[list[models.Post], Optional[str]]: 取得された投稿の一覧と次ページのカーソル
+    """
+    stmt = keyset_paginate(
+        project_page(select(models.Post), models.Post, fields),
+        models.Post,
+        limit,
+        after,
+    )
+    result = await db.scalars(stmt)
+    return split_page(result.all(), limit)
+
+
+async def get_post_versions(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[Cursor] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[list[Row], Optional[str]]:
+    """get_posts / get_posts_by_user_id と同じページの (id, created_at, updated_at) だけを取得する関数
+
+    条件付きGETでETagを比較するために使い、contentを含む一覧本体の取得を省略できるようにする。
 
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろの投稿を取得する
+        user_id (Optional[str]): 指定した場合はこのユーザーの投稿に絞り込む
 
     Returns:
-        list[models.Post]: 取得された投稿の一覧
+        Tuple[list[Row], Optional[str]]: 取得された行の一覧と次ページのカーソル
     """
-    return db.query(models.Post).all()
+    stmt = select(models.Post.id, models.Post.created_at, models.Post.updated_at)
+    if user_id is not None:
+        stmt = stmt.where(models.Post.user_id == user_id)
+    result = await db.execute(keyset_paginate(stmt, models.Post, limit, after))
+    return split_page(result.all(), limit)
+
 
+async def stream_posts(
+    db: AsyncSession, batch_size: int = 1000
+) -> AsyncIterator[Sequence[Row]]:
+    """投稿の全件をサーバーサイドカーソルでバッチ単位に取得する関数
+
+    Args:
+        db (AsyncSession): DBセッション
+        batch_size (int, optional): 1回に取得する件数. Defaults to 1000.
 
-def get_post_by_id(db: Session, post_id: str) -> models.Post:
+    Yields:
+        Sequence[Row]: (created_at, id) 順の投稿のバッチ
+    """
+    stmt = (
+        select(*[getattr(models.Post, column) for column in POST_EXPORT_COLUMNS])
+        .order_by(models.Post.created_at, models.Post.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_post_by_id(
+    db: AsyncSession, post_id: str, use_cache: bool = True
+) -> models.Post:
     """投稿の詳細を取得する関数
 
+    主キー検索はほぼ全てのリクエストで行われるため、プロセス内キャッシュを経由する。
+    キャッシュはワーカーごとのため、他のワーカーで書き込んだクライアントには古い値を
+    返しうる。その場合は use_cache=False でDBから取得する。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         post_id (str): 取得する投稿のID
+        use_cache (bool, optional): Falseの場合はキャッシュを読まずにDBから取得する. Defaults to True.
 
     Returns:
         models.Post: 取得された投稿
     """
-    return db.query(models.Post).filter(models.Post.id == post_id).first()
+    return await get_cached_by_id(
+        db, get_post_cache(), models.Post, post_id, use_cache=use_cache
+    )
 
 
-def update_post(db: Session, post_id: str, post: schemas.PostCreate) -> models.Post:
+async def get_posts_by_ids(
+    db: AsyncSession, post_ids: List[str]
+) -> Tuple[list[models.Post], list[str]]:
+    """複数の投稿をIDで1回のクエリでまとめて取得する関数
+
+    Args:
+        db (AsyncSession): DBセッション
+        post_ids (List[str]): 取得する投稿のIDの一覧
+
+    Returns:
+        Tuple[list[models.Post], list[str]]: post_idsの順序に並べた投稿の一覧と、存在しなかったIDの一覧
+    """
+    return await get_many_cached_by_ids(db, get_post_cache(), models.Post, post_ids)
+
+
+async def update_post(
+    db: AsyncSession, post_id: str, post: schemas.PostUpdate
+) -> Optional[models.Post]:
     """投稿を更新する関数
 
+    UPDATE ... RETURNINGで更新と更新後の行の取得を1回のクエリで行う。
+    リクエストで指定された項目だけを更新する。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         post_id (str): 更新する投稿のID
-        post (PostCreate): 更新する投稿の情報
+        post (PostUpdate): 更新する投稿の情報
 
     Returns:
-        models.Post: 更新された投稿
+        Optional[models.Post]: 更新された投稿。投稿が存在しない場合はNone
     """
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    for key, value in post.model_dump().items():
-        setattr(db_post, key, value)
-    db.commit()
-    db.refresh(db_post)
+    db_post = await db.scalar(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(**post.model_dump(exclude_unset=True))
+        .returning(models.Post)
+    )
+    await db.commit()
+    get_post_cache().invalidate(post_id)
     return db_post
 
 
-def delete_post(db: Session, post_id: str) -> models.Post:
+async def delete_post(db: AsyncSession, post_id: str) -> Optional[models.Post]:
     """投稿を削除する関数
 
+    DELETE ... RETURNINGで削除と削除した行の取得を1回のクエリで行う。
+
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         post_id (str): 削除する投稿のID
 
     Returns:
-        models.Post: 削除された投稿
+        Optional[models.Post]: 削除された投稿。投稿が存在しない場合はNone
     """
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    db.delete(db_post)
-    db.commit()
+    db_post = await db.scalar(
+        delete(models.Post).where(models.Post.id == post_id).returning(models.Post)
+    )
+    await db.commit()
+    get_post_cache().invalidate(post_id)
     return db_post
 
 
-def get_posts_by_user_id(db: Session, user_id: str) -> list[models.Post]:
-    """ユーザーの投稿一覧を取得する関数
+async def get_posts_by_user_id(
+    db: AsyncSession,
+    user_id: str,
+    limit: int,
+    after: Optional[Cursor] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple[list[models.Post], Optional[str]]:
+    """ユーザーの投稿一覧を (created_at, id) 順に1ページ分取得する関数
 
     Args:
-        db (Session): DBセッション
+        db (AsyncSession): DBセッション
         user_id (str): 取得するユーザーのID
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろの投稿を取得する
+        fields (Optional[Sequence[str]]): 読み込むフィールド。Noneの場合は全ての列を読み込む
+
+    Returns:
+        Tuple[list[models.Post], Optional[str]]: 取得された投稿の一覧と次ページのカーソル
+    """
+    stmt = keyset_paginate(
+        project_page(
+            select(models.Post).where(models.Post.user_id == user_id),
+            models.Post,
+            fields,
+        ),
+        models.Post,
+        limit,
+        after,
+    )
+    result = await db.scalars(stmt)
+    return split_page(result.all(), limit)
+
+
+async def get_user_feed(
+    db: AsyncSession,
+    user_id: str,
+    limit: int,
+    after: Optional[Cursor] = None,
+    comments_per_post: int = 3,
+) -> Optional[Tuple[list[dict], Optional[str]]]:
+    """ユーザーの投稿を1ページ分、各投稿の新しい順のコメントN件と投稿者名付きで取得する関数
+
+    ユーザーを起点に、投稿のページと投稿ごとの最新のコメントをそれぞれLATERAL結合した
+    1本のクエリで取得する。コメントは (post_id, created_at, id) のインデックスを
+    逆順に読むため、投稿ごとにN件だけを読む。
+    ユーザーが存在しない場合は行が返らず、投稿が0件の場合は投稿の列がNULLの
+    1行が返るため、ユーザーの存在確認も同じクエリで行える。
+
+    Args:
+        db (AsyncSession): DBセッション
+        user_id (str): 取得するユーザーのID
+        limit (int): 1ページの投稿の件数
+        after (Optional[Cursor]): このカーソルより後ろの投稿を取得する
+        comments_per_post (int, optional): 投稿ごとに取得するコメントの件数. Defaults to 3.
+
+    Returns:
+        Optional[Tuple[list[dict], Optional[str]]]: schemas.FeedPostResponse の形の投稿の一覧と
+            次ページのカーソル。ユーザーが存在しない場合はNone
+    """
+    posts = keyset_paginate(
+        select(
+            models.Post.id,
+            models.Post.user_id,
+            models.Post.title,
+            models.Post.content,
+            models.Post.comment_count,
+            models.Post.created_at,
+        ).where(models.Post.user_id == models.User.id),
+        models.Post,
+        limit,
+        after,
+    ).lateral("feed_posts")
+    stmt = (
+        select(posts)
+        .select_from(models.User)
+        .outerjoin(posts, true())
+        .where(models.User.id == user_id)
+        .order_by(posts.c.created_at, posts.c.id)
+    )
+
+    if comments_per_post > 0:
+        author = aliased(models.User)
+        comments = (
+            select(
+                models.Comment.id.label("comment_id"),
+                models.Comment.user_id.label("comment_user_id"),
+                models.Comment.content.label("comment_content"),
+                models.Comment.created_at.label("comment_created_at"),
+                author.name.label("comment_user_name"),
+            )
+            .join(models.Comment.user.of_type(author))
+            .where(models.Comment.post_id == posts.c.id)
+            .order_by(models.Comment.created_at.desc(), models.Comment.id.desc())
+            .limit(comments_per_post)
+            .lateral("latest_comments")
+        )
+        stmt = (
+            stmt.add_columns(comments)
+            .outerjoin(comments, true())
+            .order_by(
+                comments.c.comment_created_at.desc(), comments.c.comment_id.desc()
+            )
+        )
+
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return None
+
+    # 1行が (投稿, コメント) の組のため、投稿ごとにまとめる
+    heads: list[Row] = []
+    feed_comments: dict[str, list[dict]] = {}
+    for row in rows:
+        if row.id is None:
+            continue
+        if row.id not in feed_comments:
+            heads.append(row)
+            feed_comments[row.id] = []
+        if comments_per_post > 0 and row.comment_id is not None:
+            feed_comments[row.id].append(
+                {
+                    "id": row.comment_id,
+                    "user_id": row.comment_user_id,
+                    "post_id": row.id,
+                    "content": row.comment_content,
+                    "user_name": row.comment_user_name,
+                }
+            )
+
+    page, next_cursor = split_page(heads, limit)
+    return [
+        {
+            "id": post.id,
+            "user_id": post.user_id,
+            "title": post.title,
+            "content": post.content,
+            "comment_count": post.comment_count,
+            "comments": feed_comments[post.id],
+        }
+        for post in page
+    ], next_cursor
+
+
+async def adjust_comment_count(db: AsyncSession, post_id: str, delta: int) -> None:
+    """投稿のコメント数を増減させる関数
+
+    コメントの作成・削除と同じトランザクションで呼び出し、コミットは呼び出し側で行う。
+    表現が変わるためupdated_atも更新され、ETagとLast-Modifiedにも反映される。
+    コミット後に呼び出し側でキャッシュを無効化する。
+
+    Args:
+        db (AsyncSession): DBセッション
+        post_id (str): 対象の投稿のID
+        delta (int): 増減させる件数
+    """
+    await db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(comment_count=models.Post.comment_count + delta)
+    )
+
+
+async def reconcile_comment_counts(db: AsyncSession, batch_size: int = 1000) -> int:
+    """投稿のコメント数を実際のコメントの件数に合わせて修正する関数
+
+    投稿をid順に batch_size 件ずつ区切って数え直し、区間ごとにコミットするため、
+    行ロックを長時間保持しない。
+
+    Args:
+        db (AsyncSession): DBセッション
+        batch_size (int, optional): 1回に数え直す投稿の件数. Defaults to 1000.
+
+    Returns:
+        int: コメント数を修正した投稿の件数
+    """
+    actual = (
+        select(func.count(models.Comment.id))
+        .where(models.Comment.post_id == models.Post.id)
+        .scalar_subquery()
+    )
+    fixed = 0
+    after: Optional[str] = None
+    while True:
+        stmt = select(models.Post.id).order_by(models.Post.id).limit(batch_size)
+        if after is not None:
+            stmt = stmt.where(models.Post.id > after)
+        ids = (await db.scalars(stmt)).all()
+        if not ids:
+            return fixed
+
+        result = await db.scalars(
+            update(models.Post)
+            .where(
+                models.Post.id.between(ids[0], ids[-1]),
+                models.Post.comment_count != actual,
+            )
+            .values(comment_count=actual)
+            .returning(models.Post.id)
+            .execution_options(synchronize_session=False)
+        )
+        fixed_ids = result.all()
+        await db.commit()
+        for post_id in fixed_ids:
+            get_post_cache().invalidate(post_id)
+        fixed += len(fixed_ids)
+        after = ids[-1]
+
+
+async def search_posts(
+    db: AsyncSession,
+    query: str,
+    limit: int,
+    after: Optional[SearchCursor] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[list[Row], Optional[str]]:
+    """投稿を全文検索し、関連度順に1ページ分取得する関数
+
+    search_vector のGINインデックスで一致する投稿を絞り込み、一致した投稿だけを
+    ts_rank で順位付けする。クエリはWeb検索の構文（"語句"、or、-除外）で解釈する。
+
+    Args:
+        db (AsyncSession): DBセッション
+        query (str): 検索語
+        limit (int): 1ページの件数
+        after (Optional[SearchCursor]): このカーソルより後ろの投稿を取得する
+        user_id (Optional[str]): 指定した場合はこのユーザーの投稿だけを検索する
 
     Returns:
-        list[models.Post]: 取得された投稿の一覧
+        Tuple[list[Row], Optional[str]]: 関連度付きの投稿の一覧と次ページのカーソル
     """
-    return db.query(models.Post).filter(models.Post.user_id == user_id).all()
+    tsquery = websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank(models.Post.search_vector, tsquery, type_=REAL).label("rank")
+    stmt = select(
+        models.Post.id,
+        models.Post.user_id,
+        models.Post.title,
+        models.Post.content,
+        models.Post.comment_count,
+        rank,
+    ).where(models.Post.search_vector.op("@@")(tsquery))
+    if user_id is not None:
+        stmt = stmt.where(models.Post.user_id == user_id)
+    stmt = rank_paginate(stmt, rank, models.Post.id, limit, after)
+    result = await db.execute(stmt)
+    return split_search_page(result.all(), limit)
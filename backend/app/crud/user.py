@@ -1,18 +1,21 @@
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
     models,  # データベースモデルをインポート
     schemas,  # 作成したPydanticモデルをインポート
 )
+from app.crud.cache import get_cached_by_id, get_many_cached_by_ids, get_user_cache
+from app.db.pagination import Cursor, keyset_paginate, project_page, split_page
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
+async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
     """ユーザーを作成するCRUD操作
 
     Args:
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         user (schemas.UserCreate): 作成するユーザーの情報
 
     Returns:
@@ -22,66 +25,162 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
         **user.model_dump()
     )  # Pydanticモデルからデータベースモデルを作成
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def get_users(db: Session) -> List[models.User]:
-    """ユーザーの一覧を取得するCRUD操作
+async def create_users_bulk(
+    db: AsyncSession, users: List[schemas.UserCreate]
+) -> List[models.User]:
+    """複数のユーザーを1回のINSERT ... RETURNINGで作成するCRUD操作
 
     Args:
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
+        users (List[schemas.UserCreate]): 作成するユーザーの情報の一覧
 
     Returns:
-        List[models.User]: 取得されたユーザーの一覧
+        List[models.User]: 作成されたユーザーの一覧（入力と同じ順序）
     """
-    return db.query(models.User).all()
+    result = await db.scalars(
+        insert(models.User).returning(models.User, sort_by_parameter_order=True),
+        [user.model_dump() for user in users],
+    )
+    created = list(result.all())
+    await db.commit()
+    return created
+
+
+async def get_users(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[Cursor] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Tuple[List[models.User], Optional[str]]:
+    """ユーザーの一覧を (created_at, id) 順に1ページ分取得するCRUD操作
 
+    Args:
+        db (AsyncSession): データベースセッション
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろのユーザーを取得する
+        fields (Optional[Sequence[str]]): 読み込むフィールド。Noneの場合は全ての列を読み込む
+
+    Returns:
+        Tuple[List[models.User], Optional[str]]: 取得されたユーザーの一覧と次ページのカーソル
+    """
+    stmt = keyset_paginate(
+        project_page(select(models.User), models.User, fields),
+        models.User,
+        limit,
+        after,
+    )
+    result = await db.scalars(stmt)
+    return split_page(result.all(), limit)
+
+
+async def get_user_versions(
+    db: AsyncSession, limit: int, after: Optional[Cursor] = None
+) -> Tuple[List[Row], Optional[str]]:
+    """get_usersと同じページの (id, created_at, updated_at) だけを取得するCRUD操作
 
-def get_user_by_uid(db: Session, user_id: str) -> models.User:
+    条件付きGETでETagを比較するために使い、一覧本体の取得を省略できるようにする。
+
+    Args:
+        db (AsyncSession): データベースセッション
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろのユーザーを取得する
+
+    Returns:
+        Tuple[List[Row], Optional[str]]: 取得された行の一覧と次ページのカーソル
+    """
+    stmt = keyset_paginate(
+        select(models.User.id, models.User.created_at, models.User.updated_at),
+        models.User,
+        limit,
+        after,
+    )
+    result = await db.execute(stmt)
+    return split_page(result.all(), limit)
+
+
+async def get_user_by_uid(
+    db: AsyncSession, user_id: str, use_cache: bool = True
+) -> models.User:
     """ユーザーの詳細を取得するCRUD操作
 
+    主キー検索はほぼ全てのリクエストで行われるため、プロセス内キャッシュを経由する。
+    キャッシュはワーカーごとのため、他のワーカーで書き込んだクライアントには古い値を
+    返しうる。その場合は use_cache=False でDBから取得する。
+
     Args:
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         user_id (str): 取得するユーザーのID
+        use_cache (bool, optional): Falseの場合はキャッシュを読まずにDBから取得する. Defaults to True.
 
     Returns:
         models.User: 取得されたユーザーの情報
     """
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return await get_cached_by_id(
+        db, get_user_cache(), models.User, user_id, use_cache=use_cache
+    )
+
+
+async def get_users_by_ids(
+    db: AsyncSession, user_ids: List[str]
+) -> Tuple[List[models.User], List[str]]:
+    """複数のユーザーをIDで1回のクエリでまとめて取得するCRUD操作
 
+    Args:
+        db (AsyncSession): データベースセッション
+        user_ids (List[str]): 取得するユーザーのIDの一覧
 
-def update_user(db: Session, user_id: str, user: schemas.UserUpdate) -> models.User:
+    Returns:
+        Tuple[List[models.User], List[str]]: user_idsの順序に並べたユーザーの一覧と、存在しなかったIDの一覧
+    """
+    return await get_many_cached_by_ids(db, get_user_cache(), models.User, user_ids)
+
+
+async def update_user(
+    db: AsyncSession, user_id: str, user: schemas.UserUpdate
+) -> Optional[models.User]:
     """ユーザーを更新するCRUD操作
 
+    UPDATE ... RETURNINGで更新と更新後の行の取得を1回のクエリで行う。
+
     Args:
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         user_id (str): 更新するユーザーのID
         user (schemas.UserUpdate): 更新するユーザーの情報
 
     Returns:
-        models.User: 更新されたユーザーの情報
+        Optional[models.User]: 更新されたユーザーの情報。ユーザーが存在しない場合はNone
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    for key, value in user.model_dump().items():
-        setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
+    db_user = await db.scalar(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(**user.model_dump())
+        .returning(models.User)
+    )
+    await db.commit()
+    get_user_cache().invalidate(user_id)
     return db_user
 
 
-def delete_user(db: Session, user_id: str) -> models.User:
+async def delete_user(db: AsyncSession, user_id: str) -> Optional[models.User]:
     """ユーザーを削除するCRUD操作
 
+    DELETE ... RETURNINGで削除と削除した行の取得を1回のクエリで行う。
+
     Args:
-        db (Session): データベースセッション
+        db (AsyncSession): データベースセッション
         user_id (str): 削除するユーザーのID
 
     Returns:
-        models.User: 削除されたユーザーの情報
+        Optional[models.User]: 削除されたユーザーの情報。ユーザーが存在しない場合はNone
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    db.delete(db_user)
-    db.commit()
-    return db_user
\ No newline at end of file
+    db_user = await db.scalar(
+        delete(models.User).where(models.User.id == user_id).returning(models.User)
+    )
+    await db.commit()
+    get_user_cache().invalidate(user_id)
+    return db_user
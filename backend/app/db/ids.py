@@ -0,0 +1,34 @@
+import os
+import time
+import uuid
+
+
+def uuid7() -> uuid.UUID:
+    """時刻順に並ぶUUID (RFC 9562 のバージョン7) を生成する
+
+    先頭48bitにUNIXミリ秒を置くため、主キーとして挿入するとB-treeの右端に
+    追記される形になり、UUIDv4のようにインデックス全体へ書き込みが散らばらない。
+
+    Returns:
+        uuid.UUID: 生成されたUUID
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = int.from_bytes(os.urandom(10), "big")
+    rand_a = value >> 68  # 12bit
+    rand_b = value & ((1 << 62) - 1)  # 62bit
+    return uuid.UUID(
+        int=(timestamp_ms & ((1 << 48) - 1)) << 80
+        | 0x7 << 76
+        | rand_a << 64
+        | 0b10 << 62
+        | rand_b
+    )
+
+
+def new_id() -> str:
+    """モデルの主キーに使う新しいIDを文字列で返す
+
+    Returns:
+        str: UUIDv7の文字列表現
+    """
+    return str(uuid7())
@@ -0,0 +1,241 @@
+import base64
+import binascii
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from sqlalchemy import REAL, ColumnElement, Select, and_, literal, or_, tuple_
+from sqlalchemy.orm import load_only
+
+# フィールドを絞り込んでも常に読み込む列（次ページのカーソルと一覧のETagに使う）
+PAGE_COLUMNS = ("id", "created_at", "updated_at")
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """キーセットページネーションの位置を表すカーソル
+
+    直前のページの最後の行の (created_at, id) を保持する。
+    """
+
+    created_at: datetime
+    id: str
+
+
+@dataclass(frozen=True)
+class SearchCursor:
+    """検索結果のキーセットページネーションの位置を表すカーソル
+
+    直前のページの最後の行の (rank, id) を保持する。
+    """
+
+    rank: float
+    id: str
+
+
+def _encode(values: list) -> str:
+    payload = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode(value: str) -> Any:
+    padded = value + "=" * (-len(value) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+
+# 復号時に不正なカーソルとして扱う例外
+_DECODE_ERRORS = (
+    binascii.Error,
+    UnicodeDecodeError,
+    AttributeError,
+    TypeError,
+    ValueError,
+)
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    """カーソルをクライアントに渡す不透明な文字列に変換する
+
+    Args:
+        cursor (Cursor): 変換するカーソル
+
+    Returns:
+        str: URLセーフなbase64文字列
+    """
+    return _encode([cursor.created_at.isoformat(), cursor.id])
+
+
+def decode_cursor(value: str) -> Cursor:
+    """クライアントから受け取ったカーソル文字列を復元する
+
+    Args:
+        value (str): encode_cursorで作成された文字列
+
+    Raises:
+        ValueError: カーソルの形式が不正な場合に発生
+
+    Returns:
+        Cursor: 復元されたカーソル
+    """
+    try:
+        created_at, id_ = _decode(value)
+        created_at = datetime.fromisoformat(created_at)
+        # created_at はタイムゾーンなしの列のため、タイムゾーン付きの値とは比較できない
+        if created_at.tzinfo is not None:
+            raise ValueError("created_at must not have a timezone")
+        return Cursor(created_at=created_at, id=str(uuid.UUID(id_)))
+    except _DECODE_ERRORS as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def encode_search_cursor(cursor: SearchCursor) -> str:
+    """検索結果のカーソルをクライアントに渡す不透明な文字列に変換する
+
+    Args:
+        cursor (SearchCursor): 変換するカーソル
+
+    Returns:
+        str: URLセーフなbase64文字列
+    """
+    return _encode([cursor.rank, cursor.id])
+
+
+def decode_search_cursor(value: str) -> SearchCursor:
+    """クライアントから受け取った検索結果のカーソル文字列を復元する
+
+    Args:
+        value (str): encode_search_cursorで作成された文字列
+
+    Raises:
+        ValueError: カーソルの形式が不正な場合に発生
+
+    Returns:
+        SearchCursor: 復元されたカーソル
+    """
+    try:
+        rank, id_ = _decode(value)
+        if isinstance(rank, bool) or not isinstance(rank, (int, float)):
+            raise ValueError("rank must be a number")
+        return SearchCursor(rank=float(rank), id=str(uuid.UUID(id_)))
+    except _DECODE_ERRORS as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_paginate(
+    stmt: Select, model: Any, limit: int, after: Optional[Cursor] = None
+) -> Select:
+    """SELECT文に (created_at, id) 順のキーセットページネーションを適用する
+
+    OFFSETを使わず、前ページの最後の行より後ろの行だけを読むため、
+    どれだけ深いページでもインデックス上の範囲走査で済む。
+    次ページの有無を判定するため limit + 1 行を取得する。
+
+    Args:
+        stmt (Select): 対象のSELECT文
+        model (Any): created_at と id を持つモデル
+        limit (int): 1ページの件数
+        after (Optional[Cursor]): このカーソルより後ろの行を取得する
+
+    Returns:
+        Select: ページネーションを適用したSELECT文
+    """
+    if after is not None:
+        stmt = stmt.where(
+            tuple_(model.created_at, model.id)
+            > tuple_(
+                literal(after.created_at, model.created_at.type),
+                literal(after.id, model.id.type),
+            )
+        )
+    return stmt.order_by(model.created_at, model.id).limit(limit + 1)
+
+
+def project_page(
+    stmt: Select, model: Any, fields: Optional[Sequence[str]] = None
+) -> Select:
+    """エンティティを取得するSELECT文で、読み込む列を指定したフィールドに絞り込む
+
+    指定しなかった列はSQLで取得しない。ページングとETagに必要な列は常に読み込む。
+
+    Args:
+        stmt (Select): エンティティを取得するSELECT文
+        model (Any): 対象のモデル
+        fields (Optional[Sequence[str]]): 読み込むフィールド。Noneの場合は絞り込まない
+
+    Returns:
+        Select: 読み込む列を絞り込んだSELECT文
+    """
+    if fields is None:
+        return stmt
+    names = dict.fromkeys([*fields, *PAGE_COLUMNS])
+    return stmt.options(load_only(*[getattr(model, name) for name in names]))
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[list, Optional[str]]:
+    """limit + 1 行の取得結果をページ本体と次ページのカーソルに分ける
+
+    Args:
+        rows (Sequence[Any]): keyset_paginateを適用した文の取得結果
+        limit (int): 1ページの件数
+
+    Returns:
+        Tuple[list, Optional[str]]: ページ本体と次ページのカーソル（最終ページではNone）
+    """
+    items = list(rows[:limit])
+    if len(rows) <= limit:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(Cursor(created_at=last.created_at, id=last.id))
+
+
+def rank_paginate(
+    stmt: Select,
+    rank: ColumnElement,
+    id_column: Any,
+    limit: int,
+    after: Optional[SearchCursor] = None,
+) -> Select:
+    """SELECT文に (rank DESC, id) 順のキーセットページネーションを適用する
+
+    順序の向きが列ごとに異なるため、行値の比較ではなく
+    rank < :rank OR (rank = :rank AND id > :id) で前ページより後ろの行を絞り込む。
+    次ページの有無を判定するため limit + 1 行を取得する。
+
+    Args:
+        stmt (Select): 対象のSELECT文
+        rank (ColumnElement): 並び替えに使う関連度の式（REAL）
+        id_column (Any): 同じ関連度の行の順序を決める主キーのカラム
+        limit (int): 1ページの件数
+        after (Optional[SearchCursor]): このカーソルより後ろの行を取得する
+
+    Returns:
+        Select: ページネーションを適用したSELECT文
+    """
+    if after is not None:
+        after_rank = literal(after.rank, REAL())
+        stmt = stmt.where(
+            or_(
+                rank < after_rank,
+                and_(rank == after_rank, id_column > literal(after.id, id_column.type)),
+            )
+        )
+    return stmt.order_by(rank.desc(), id_column).limit(limit + 1)
+
+
+def split_search_page(rows: Sequence[Any], limit: int) -> Tuple[list, Optional[str]]:
+    """limit + 1 行の検索結果をページ本体と次ページのカーソルに分ける
+
+    Args:
+        rows (Sequence[Any]): rank_paginateを適用した文の取得結果（rank と id を持つ行）
+        limit (int): 1ページの件数
+
+    Returns:
+        Tuple[list, Optional[str]]: ページ本体と次ページのカーソル（最終ページではNone）
+    """
+    items = list(rows[:limit])
+    if len(rows) <= limit:
+        return items, None
+    last = items[-1]
+    return items, encode_search_cursor(SearchCursor(rank=last.rank, id=last.id))
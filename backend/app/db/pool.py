@@ -0,0 +1,104 @@
+import bisect
+import time
+from typing import Any
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+# チェックアウト待ち時間のヒストグラムの上限値（秒）
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolStats:
+    """コネクションプールの利用状況の累計値"""
+
+    def __init__(self) -> None:
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        # 最後の要素は上限なし (+Inf) のバケット
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe_wait(self, seconds: float) -> None:
+        """チェックアウトにかかった時間を記録する"""
+        self.wait_count += 1
+        self.wait_sum += seconds
+        self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """チェックアウトの待ち時間を計測するAsyncAdaptedQueuePool
+
+    接続の空きを待つ時間と、新規接続の確立にかかった時間の合計を記録する。
+    件数の集計はプールイベントで行う。
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        event.listen(self, "connect", self._on_connect)
+        event.listen(self, "checkout", self._on_checkout)
+        event.listen(self, "checkin", self._on_checkin)
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.observe_wait(time.perf_counter() - started)
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self.stats.connects += 1
+
+    def _on_checkout(
+        self, dbapi_connection: Any, connection_record: Any, connection_proxy: Any
+    ) -> None:
+        self.stats.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection: Any, connection_record: Any) -> None:
+        self.stats.checkins += 1
+
+
+def pool_status(pool: Pool) -> dict[str, Any]:
+    """プールの現在の状態と累計の統計情報を返す
+
+    Args:
+        pool (Pool): 対象のコネクションプール
+
+    Returns:
+        dict[str, Any]: プールの状態。待ち時間のヒストグラムは累積件数で表す
+    """
+    status: dict[str, Any] = {"pool": pool.status()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout(),
+        )
+    stats = getattr(pool, "stats", None)
+    if isinstance(stats, PoolStats):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip((*WAIT_BUCKETS, float("inf")), stats.wait_buckets):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        status.update(
+            connects=stats.connects,
+            checkouts=stats.checkouts,
+            checkins=stats.checkins,
+            timeouts=stats.timeouts,
+            checkout_wait_seconds={
+                "count": stats.wait_count,
+                "sum": stats.wait_sum,
+                "buckets": buckets,
+            },
+        )
+    return status
@@ -0,0 +1,144 @@
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, TypeVar
+
+from app.db.query_stats import QueryStats, track_queries
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable)
+
+# エンドポイント関数に宣言した予算を保持する属性名
+BUDGET_ATTRIBUTE = "__query_budget__"
+
+
+@dataclass
+class QueryBudgetViolation:
+    """SQL文の件数が予算を超えたことを表す情報"""
+
+    scope: str
+    budget: int
+    statements: int
+    repeated_statement: Optional[str] = None
+    repeated_count: int = 0
+
+    def __str__(self) -> str:
+        message = (
+            f"{self.scope} executed {self.statements} SQL statements "
+            f"(budget: {self.budget})"
+        )
+        if self.repeated_statement is not None:
+            message += (
+                f"; most repeated ({self.repeated_count}x): {self.repeated_statement}"
+            )
+        return message
+
+
+class QueryBudgetExceeded(AssertionError):
+    """SQL文の件数が予算を超えた場合に発生する例外"""
+
+    def __init__(self, violation: QueryBudgetViolation) -> None:
+        super().__init__(str(violation))
+        self.violation = violation
+
+
+# 予算超過を受け取る関数（pytestのフィクスチャがテストを失敗させるために登録する）
+_violation_handlers: list[Callable[[QueryBudgetViolation], None]] = []
+
+
+def query_budget(max_statements: int) -> Callable[[F], F]:
+    """エンドポイントが1リクエストで実行してよいSQL文の件数を宣言するデコレーター
+
+    ルーターのデコレーターより内側（下）に付ける。
+
+    Args:
+        max_statements (int): 1リクエストで実行してよいSQL文の件数
+
+    Returns:
+        Callable[[F], F]: エンドポイント関数をそのまま返すデコレーター
+    """
+
+    def decorator(endpoint: F) -> F:
+        setattr(endpoint, BUDGET_ATTRIBUTE, max_statements)
+        return endpoint
+
+    return decorator
+
+
+def get_query_budget(endpoint: Callable) -> Optional[int]:
+    """エンドポイント関数に宣言された予算を返す（未宣言の場合はNone）"""
+    return getattr(endpoint, BUDGET_ATTRIBUTE, None)
+
+
+def find_violation(
+    scope: str, budget: int, stats: QueryStats
+) -> Optional[QueryBudgetViolation]:
+    """集計結果が予算を超えていれば、その内容を返す
+
+    Args:
+        scope (str): 計測した範囲の名前（エンドポイントなど）
+        budget (int): SQL文の件数の上限
+        stats (QueryStats): SQL文の集計結果
+
+    Returns:
+        Optional[QueryBudgetViolation]: 予算を超えた場合はその内容、超えていない場合はNone
+    """
+    if stats.statements <= budget:
+        return None
+    violation = QueryBudgetViolation(scope, budget, stats.statements)
+    repeated = stats.most_repeated()
+    if repeated is not None and repeated[1] > 1:
+        violation.repeated_statement, violation.repeated_count = repeated
+    return violation
+
+
+def report_violation(violation: QueryBudgetViolation, warn: bool) -> None:
+    """予算超過を登録済みの関数に通知し、必要であれば警告を記録する
+
+    Args:
+        violation (QueryBudgetViolation): 予算超過の内容
+        warn (bool): 警告をログに記録するかどうか
+    """
+    if warn:
+        logger.warning("SQL query budget exceeded: %s", violation)
+    for handler in list(_violation_handlers):
+        handler(violation)
+
+
+@contextmanager
+def collect_violations() -> Iterator[list[QueryBudgetViolation]]:
+    """ブロック内でリクエストが起こした予算超過を集める
+
+    Yields:
+        list[QueryBudgetViolation]: 予算超過の一覧（ブロックの実行中も追加される）
+    """
+    violations: list[QueryBudgetViolation] = []
+    _violation_handlers.append(violations.append)
+    try:
+        yield violations
+    finally:
+        _violation_handlers.remove(violations.append)
+
+
+@contextmanager
+def assert_max_queries(
+    max_statements: int, scope: str = "block"
+) -> Iterator[QueryStats]:
+    """ブロック内で実行されたSQL文の件数が上限を超えた場合に例外を発生させる
+
+    Args:
+        max_statements (int): SQL文の件数の上限
+        scope (str, optional): 例外のメッセージに含める名前. Defaults to "block".
+
+    Raises:
+        QueryBudgetExceeded: SQL文の件数が上限を超えた場合に発生
+
+    Yields:
+        QueryStats: ブロック内の集計結果
+    """
+    with track_queries() as stats:
+        yield stats
+    violation = find_violation(scope, max_statements, stats)
+    if violation is not None:
+        raise QueryBudgetExceeded(violation)
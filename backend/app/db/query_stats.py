@@ -0,0 +1,104 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_START_TIMES_KEY = "query_stats_start_times"
+
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|\?|(?<![:\w]):\w+")
+_PLACEHOLDER_LIST = re.compile(r"\(\?(?:, \?)+\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """バインドパラメータの違いを除いたSQL文の形を返す
+
+    IN句のパラメータ数の違いも同じ形として扱う。
+
+    Args:
+        statement (str): SQL文
+
+    Returns:
+        str: 正規化したSQL文
+    """
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PLACEHOLDER.sub("?", shape)
+    return _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+
+
+@dataclass
+class QueryStats:
+    """1つのスコープ内で実行されたSQL文の件数と実行時間（秒）"""
+
+    statements: int = 0
+    duration: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+
+    def most_repeated(self) -> Optional[tuple[str, int]]:
+        """最も多く実行されたSQL文の形と回数を返す"""
+        most_common = self.shapes.most_common(1)
+        return most_common[0] if most_common else None
+
+
+# 入れ子のスコープでも外側の集計に含めるため、有効な集計をすべて保持する
+_active_stats: ContextVar[tuple[QueryStats, ...]] = ContextVar(
+    "query_stats", default=()
+)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """ブロック内で実行されたSQL文を数える
+
+    非同期セッションのSQLもgreenlet経由で同じコンテキストで実行されるため、
+    リクエスト単位で集計できる。
+
+    Yields:
+        QueryStats: ブロック内の集計結果（ブロックの実行中も更新される）
+    """
+    stats = QueryStats()
+    token = _active_stats.set((*_active_stats.get(), stats))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    if _active_stats.get():
+        conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    active = _active_stats.get()
+    start_times = conn.info.get(_START_TIMES_KEY)
+    if not active or not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    shape = statement_shape(statement)
+    for stats in active:
+        stats.statements += 1
+        stats.duration += elapsed
+        stats.shapes[shape] += 1
@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.core.config import ReplicaRouting
+
+logger = logging.getLogger(__name__)
+
+# プライマリではラグを0とし、レプリカではWALの再生が追いついていない場合のみ
+# 最後に再生したトランザクションからの経過時間をラグとみなす
+# （更新のないプライマリに追従しているレプリカのラグが増え続けないようにする）
+REPLICATION_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """)
+
+# ヘルスチェック1回あたりの上限時間（秒）
+HEALTH_CHECK_TIMEOUT = 2.0
+
+
+@dataclass
+class Replica:
+    """読み取り専用レプリカの接続先と状態"""
+
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker[AsyncSession]
+    # 最初の確認が終わるまではプライマリから読む
+    healthy: bool = False
+    lag_seconds: Optional[float] = None
+
+
+class ReplicaSet:
+    """GETリクエストの読み取り先をレプリカに振り分ける
+
+    レプリカのラグと死活は start で開始するバックグラウンドのタスクが一定間隔で確認し、
+    停止しているものや遅延が大きいものは振り分け対象から外す。choose は確認済みの
+    結果を読むだけのため、リクエストが確認を待つことはない。
+    使えるレプリカがない場合や、確認を開始していない場合はプライマリを返す。
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        engines: Sequence[AsyncEngine],
+        routing: ReplicaRouting,
+        max_lag_seconds: float,
+        check_interval_seconds: float,
+    ) -> None:
+        self.primary = primary
+        self.replicas = [
+            Replica(
+                engine=engine,
+                sessionmaker=async_sessionmaker(
+                    bind=engine,
+                    autoflush=False,
+                    expire_on_commit=False,
+                    info={"replica": True},
+                ),
+            )
+            for engine in engines
+        ]
+        self.routing = routing
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._counter = itertools.count()
+
+    def start(self) -> None:
+        """ラグと死活を一定間隔で確認するタスクを開始する"""
+        if not self.replicas or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="replica-health-check")
+
+    async def stop(self) -> None:
+        """確認のタスクを止める"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def choose(self) -> async_sessionmaker[AsyncSession]:
+        """読み取りに使うセッションファクトリを選ぶ
+
+        Returns:
+            async_sessionmaker[AsyncSession]: 選ばれたレプリカ、またはプライマリのセッションファクトリ
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return self.primary
+
+        if self.routing == ReplicaRouting.LEAST_CONNECTIONS:
+            replica = min(healthy, key=lambda r: r.engine.pool.checkedout())
+        else:
+            replica = healthy[next(self._counter) % len(healthy)]
+        return replica.sessionmaker
+
+    async def refresh(self) -> None:
+        """全レプリカのラグと死活を確認する"""
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                # 確認に失敗してもタスクは止めず、次の間隔でもう一度確認する
+                logger.exception("Failed to check read replicas")
+            await asyncio.sleep(self.check_interval_seconds)
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            async with asyncio.timeout(HEALTH_CHECK_TIMEOUT):
+                async with replica.engine.connect() as connection:
+                    lag = await connection.scalar(REPLICATION_LAG_QUERY)
+        except Exception:
+            replica.healthy = False
+            replica.lag_seconds = None
+            return
+
+        replica.lag_seconds = float(lag)
+        replica.healthy = replica.lag_seconds <= self.max_lag_seconds
+
+    def status(self) -> list[dict]:
+        """各レプリカの状態を返す
+
+        Returns:
+            list[dict]: 接続先、死活、ラグ、チェックアウト中の接続数
+        """
+        return [
+            {
+                "url": replica.engine.url.render_as_string(hide_password=True),
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag_seconds,
+                "checked_out": replica.engine.pool.checkedout(),
+            }
+            for replica in self.replicas
+        ]
@@ -1,18 +1,217 @@
-from app.core.config import settings
-from sqlalchemy import create_engine
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import scoped_session, sessionmaker
 
-if settings.SQLALCHEMY_DATABASE_URI:
-    engine = create_engine(
+from app.core.config import settings
+from app.db.pool import InstrumentedAsyncQueuePool
+from app.db.replicas import ReplicaSet
+
+logger = logging.getLogger(__name__)
+
+# エンジンはモジュールの読み込み時には作成せず、最初に使われたときに作成する。
+# 読み込みだけでは環境変数やDBへの接続を必要としないため、起動やテストの収集が速くなる
+
+
+def _server_settings() -> dict[str, str]:
+    # 接続ごとに設定するPostgreSQLのパラメータ（0の場合はサーバーの設定に従う）
+    return {
+        name: str(value)
+        for name, value in {
+            "statement_timeout": settings.DB_STATEMENT_TIMEOUT_MS,
+            "idle_in_transaction_session_timeout": (
+                settings.DB_IDLE_IN_TRANSACTION_SESSION_TIMEOUT_MS
+            ),
+        }.items()
+        if value
+    }
+
+
+def _pool_options() -> dict[str, Any]:
+    return {
+        "pool_pre_ping": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def _create_async_engine(uri: str) -> AsyncEngine:
+    return create_async_engine(
+        uri,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args={"server_settings": _server_settings()},
+        **_pool_options(),
+    )
+
+
+@lru_cache
+def get_engine() -> Engine:
+    """同期エンジンを返す（Alembicや接続確認スクリプトなど、イベントループ外で使用する）
+
+    Raises:
+        ValueError: 接続先が設定されていない場合に発生
+
+    Returns:
+        Engine: 同期エンジン
+    """
+    if not settings.SQLALCHEMY_DATABASE_URI:
+        raise ValueError("SQLALCHEMY_DATABASE_URI is not set")
+    server_settings = _server_settings()
+    return create_engine(
         settings.SQLALCHEMY_DATABASE_URI,
-        pool_pre_ping=True,
+        connect_args=(
+            {
+                "options": " ".join(
+                    f"-c {name}={value}" for name, value in server_settings.items()
+                )
+            }
+            if server_settings
+            else {}
+        ),
+        **_pool_options(),
     )
-    SessionLocal = scoped_session(
-        sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@lru_cache
+def get_session_local() -> scoped_session:
+    """同期エンジンのスレッドローカルなセッションを返す"""
+    return scoped_session(
+        sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
     )
 
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    """非同期エンジンを返す（APIのエンドポイントから使用する）
+
+    Raises:
+        ValueError: 接続先が設定されていない場合に発生
+
+    Returns:
+        AsyncEngine: 非同期エンジン
+    """
+    if not settings.SQLALCHEMY_ASYNC_DATABASE_URI:
+        raise ValueError("SQLALCHEMY_DATABASE_URI is not set")
+    engine = _create_async_engine(settings.SQLALCHEMY_ASYNC_DATABASE_URI)
     if settings.ENVIRONMENT == "development":
-        db_info = f"Using database at {settings.SQLALCHEMY_DATABASE_URI}"
-        print(db_info)
-else:
-    raise ValueError("SQLALCHEMY_DATABASE_URI is not set")
+        logger.info(
+            "Using database at %s", engine.url.render_as_string(hide_password=True)
+        )
+    return engine
+
+
+@lru_cache
+def get_async_session_local() -> async_sessionmaker[AsyncSession]:
+    """非同期エンジンのセッションファクトリを返す"""
+    # commit後も属性をレスポンスに使えるよう expire_on_commit=False にする
+    return async_sessionmaker(
+        bind=get_async_engine(), autoflush=False, expire_on_commit=False
+    )
+
+
+@lru_cache
+def get_read_replicas() -> ReplicaSet:
+    """GETリクエスト用の読み取り先を返す（レプリカが未設定の場合は常にプライマリ）"""
+    return ReplicaSet(
+        primary=get_async_session_local(),
+        engines=[_create_async_engine(uri) for uri in settings.SQLALCHEMY_REPLICA_URIS],
+        routing=settings.REPLICA_ROUTING,
+        max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+        check_interval_seconds=settings.REPLICA_HEALTH_CHECK_INTERVAL_SECONDS,
+    )
+
+
+async def warm_up_pool(engine: AsyncEngine, connections: int) -> int:
+    """プールに検証済みのコネクションを作成しておく
+
+    同時に connections 本の接続を開いて SELECT 1 で検証し、プールに返す。
+    プールの常駐数 (pool_size) 以内であれば閉じられずに残るため、
+    起動直後のリクエストが接続の確立を待たずに済む。
+
+    Args:
+        engine (AsyncEngine): 対象のエンジン
+        connections (int): 作成するコネクション数（pool_sizeを上限とする）
+
+    Returns:
+        int: 作成したコネクション数
+    """
+    count = min(connections, engine.pool.size())
+    if count <= 0:
+        return 0
+    results = await asyncio.gather(
+        *(engine.connect() for _ in range(count)), return_exceptions=True
+    )
+    opened = [result for result in results if not isinstance(result, BaseException)]
+    try:
+        # 一部の接続に失敗した場合も、開けた接続はプールに返してから失敗させる
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        await asyncio.gather(
+            *(connection.exec_driver_sql("SELECT 1") for connection in opened)
+        )
+    finally:
+        await asyncio.gather(*(connection.close() for connection in opened))
+    return count
+
+
+async def warm_up_pools(connections: int, timeout_seconds: float) -> None:
+    """プライマリと全てのレプリカのプールを温める
+
+    DBに接続できなくてもワーカーの起動は止めず、最初のリクエストで接続させる。
+
+    Args:
+        connections (int): エンジンごとに作成するコネクション数
+        timeout_seconds (float): 1つのエンジンの温めを待つ最大の秒数
+    """
+    engines = [get_async_engine()] + [
+        replica.engine for replica in get_read_replicas().replicas
+    ]
+    for engine in engines:
+        url = engine.url.render_as_string(hide_password=True)
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                count = await warm_up_pool(engine, connections)
+        except Exception:
+            logger.warning(
+                "Failed to warm up connection pool for %s", url, exc_info=True
+            )
+            continue
+        logger.info("Warmed up %d connections for %s", count, url)
+
+
+async def dispose_engines() -> None:
+    """作成済みの非同期エンジンのコネクションを全て閉じる"""
+    if get_read_replicas.cache_info().currsize:
+        for replica in get_read_replicas().replicas:
+            await replica.engine.dispose()
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+
+
+# 従来のモジュール変数名（スクリプトやベンチマークから参照される）
+_LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "SessionLocal": get_session_local,
+    "async_engine": get_async_engine,
+    "AsyncSessionLocal": get_async_session_local,
+    "read_replicas": get_read_replicas,
+}
+
+
+def __getattr__(name: str) -> Any:
+    # 参照された時点でエンジンを作成する
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
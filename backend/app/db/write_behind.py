@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# キューに入れて flusher に停止を伝える目印
+_STOP = object()
+
+
+@dataclass
+class WriteBehindStats:
+    """書き込みバッファの受け付け・書き込みの件数の累計値"""
+
+    enqueued: int = 0
+    rejected: int = 0
+    flushed: int = 0
+    retried: int = 0
+    spilled: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class JsonLinesSpill(Generic[T]):
+    """書き込めなかった行を JSON Lines のファイルに退避する
+
+    退避した行は次に flusher を開始したときに読み込み、もう一度書き込む。
+    読み込み中のファイルは書き込みに成功するまで削除しないため、その途中で
+    プロセスが終了しても次の開始時に再び読み込まれる。
+
+    Args:
+        path (Path): 退避先のファイル
+        decode (Callable[[dict], T]): ファイルから読み込んだ値を行に戻す関数
+    """
+
+    def __init__(
+        self, path: Path, decode: Callable[[dict[str, Any]], T] = lambda value: value
+    ) -> None:
+        self.path = Path(path)
+        self.decode = decode
+        self._replaying = self.path.with_name(self.path.name + ".replay")
+
+    def write(self, batch: list[T]) -> None:
+        """行をファイルの末尾に追記し、ディスクに書き出してから戻る"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = "".join(
+            json.dumps(item, default=_encode_json, ensure_ascii=False) + "\n"
+            for item in batch
+        )
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def take(self) -> list[T]:
+        """退避された行を読み込む（前回の読み込み中に終了した行も含む）"""
+        if not self._replaying.exists():
+            if not self.path.exists():
+                return []
+            os.replace(self.path, self._replaying)
+        with self._replaying.open(encoding="utf-8") as file:
+            return [self.decode(json.loads(line)) for line in file if line.strip()]
+
+    def commit(self) -> None:
+        """読み込んだ行を書き込めたので、読み込み中のファイルを削除する"""
+        self._replaying.unlink(missing_ok=True)
+
+
+def _encode_json(value: Any) -> Any:
+    # 日時などJSONにない型は isoformat() の文字列で保存する
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class WriteBehindBuffer(Generic[T]):
+    """行をキューに溜め、バックグラウンドでまとめて書き込むバッファ
+
+    最初の行を受け取ってから flush_interval_seconds が経過するか、max_batch 行が
+    溜まった時点で flush を1回呼ぶ。キューの長さには上限があり、満杯の間は
+    put が enqueue_timeout_seconds まで待ち、それでも空かなければ受け付けない。
+    キューと flusher のタスクはイベントループ上で start したときに作成する。
+
+    flush が失敗した場合は retry_backoff_seconds から倍々に間隔を空けて、
+    合計 max_attempts 回まで同じバッチを書き込み直す。それでも失敗した場合、
+    spill があればファイルに退避し、なければ次の行より先に書き込み直し続ける
+    （その間はキューが空かないため、put は受け付けずに呼び出し元へ知らせる）。
+
+    配信の保証は at-least-once で、flush は同じ行を2回書き込んでも結果が
+    変わらないようにする必要がある。受け付けた行が失われるのは、メモリ上にある
+    間にプロセスが強制終了された場合と、spill がない状態で stop までに
+    書き込めなかった場合（failed として記録する）だけである。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[list[T]], Awaitable[None]],
+        max_batch: int,
+        flush_interval_seconds: float,
+        max_queue: int,
+        enqueue_timeout_seconds: float,
+        max_attempts: int = 1,
+        retry_backoff_seconds: float = 0.0,
+        spill: Optional[JsonLinesSpill[T]] = None,
+    ) -> None:
+        self.name = name
+        self.flush = flush
+        self.max_batch = max_batch
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue = max_queue
+        self.enqueue_timeout_seconds = enqueue_timeout_seconds
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.spill = spill
+        self.stats = WriteBehindStats()
+        self._queue: Optional[asyncio.Queue] = None
+        # キューの空き枠。停止の目印は枠を使わずに入れられるよう、キュー自体には上限を設けない
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        """行を受け付けているかどうか"""
+        return self._accepting
+
+    def depth(self) -> int:
+        """キューに溜まっている行数を返す"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """キューを作成し、flusher のタスクを開始する"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_queue)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name=f"write-behind-{self.name}")
+        self._accepting = True
+
+    async def stop(self) -> None:
+        """新しい行の受け付けを止め、キューに残っている行を全て書き込んでから終了する"""
+        if self._task is None:
+            return
+        # 目印より後ろに行が入らないよう、先に受け付けを止めてから目印を入れる
+        self._accepting = False
+        self._stopping = True
+        self._queue.put_nowait(_STOP)
+        await self._task
+        # flusher の終了後に残っている行も書き込む
+        await self._drain()
+        self._task = None
+        self._queue = None
+
+    async def put(self, item: T) -> bool:
+        """行をキューに入れる
+
+        Args:
+            item (T): 書き込む行
+
+        Returns:
+            bool: 受け付けた場合はTrue。停止中、またはキューが空かなかった場合はFalse
+        """
+        if not self._accepting:
+            return False
+        slots = self._slots
+        try:
+            await asyncio.wait_for(
+                slots.acquire(), timeout=self.enqueue_timeout_seconds
+            )
+        except TimeoutError:
+            self.stats.rejected += 1
+            return False
+        # 空きを待っている間に stop された場合は、目印の後ろに入れずに断る
+        if not self._accepting:
+            slots.release()
+            return False
+        self._queue.put_nowait(item)
+        self.stats.enqueued += 1
+        return True
+
+    def snapshot(self) -> dict:
+        """メトリクス用に現在の状態を返す"""
+        return {"depth": self.depth(), **asdict(self.stats)}
+
+    def _take(self, item: Any) -> Any:
+        # キューから取り出した行の枠を空ける
+        if item is not _STOP:
+            self._slots.release()
+        return item
+
+    async def _run(self) -> None:
+        await self._replay()
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = self._take(await self._queue.get())
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._take(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._take(
+                            await asyncio.wait_for(self._queue.get(), timeout)
+                        )
+                    except TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _drain(self) -> None:
+        batch = []
+        while not self._queue.empty():
+            item = self._take(self._queue.get_nowait())
+            if item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.max_batch:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _replay(self) -> None:
+        # 前回退避した行を、新しく受け付けた行より先に書き込む
+        if self.spill is None:
+            return
+        try:
+            items = await asyncio.to_thread(self.spill.take)
+        except Exception:
+            logger.exception("Failed to read spilled rows for %s", self.name)
+            return
+        for start in range(0, len(items), self.max_batch):
+            if not await self._write(items[start : start + self.max_batch]):
+                # 読み込み中のファイルは残るため、次の開始時にもう一度書き込む
+                logger.error(
+                    "Replaying spilled rows for %s failed; keeping them", self.name
+                )
+                return
+        await asyncio.to_thread(self.spill.commit)
+        if items:
+            logger.info("Replayed %d spilled rows for %s", len(items), self.name)
+
+    async def _write(self, batch: list[T]) -> bool:
+        # 失敗した場合は間隔を倍々に空けて書き込み直し、成功したかどうかを返す
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.stats.retried += 1
+                await asyncio.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+            self.stats.batches += 1
+            try:
+                await self.flush(batch)
+            except Exception:
+                logger.warning(
+                    "Write-behind flush failed for %s (attempt %d/%d, %d rows)",
+                    self.name,
+                    attempt + 1,
+                    self.max_attempts,
+                    len(batch),
+                    exc_info=True,
+                )
+                continue
+            self.stats.flushed += len(batch)
+            return True
+        return False
+
+    async def _flush(self, batch: list[T]) -> None:
+        while not await self._write(batch):
+            if self.spill is not None:
+                try:
+                    await asyncio.to_thread(self.spill.write, batch)
+                except Exception:
+                    logger.exception("Failed to spill rows for %s", self.name)
+                else:
+                    self.stats.spilled += len(batch)
+                    logger.error(
+                        "Spilled %d rows for %s to %s",
+                        len(batch),
+                        self.name,
+                        self.spill.path,
+                    )
+                    return
+            if self._stopping:
+                # 退避もできず終了するため、破棄した行数を記録する
+                self.stats.failed += len(batch)
+                logger.error(
+                    "Write-behind flush failed for %s (%d rows dropped)",
+                    self.name,
+                    len(batch),
+                )
+                return
+            # 稼働中は破棄せず、最後の間隔以上を空けてから次の行より先に書き込み直す
+            await asyncio.sleep(
+                max(
+                    self.retry_backoff_seconds * 2 ** (self.max_attempts - 1),
+                    self.flush_interval_seconds,
+                )
+            )
@@ -1,10 +1,99 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
+from fastapi import Depends, FastAPI
+
+from app import crud
+from app.api import deps, metrics
 from app.api.api_v1.api_router import router
+from app.api.api_v1.endpoints import internal
 from app.core.config import settings
-
-app = FastAPI(
-    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
+from app.db.session import (
+    dispose_engines,
+    get_async_engine,
+    get_read_replicas,
+    warm_up_pools,
 )
+from app.middleware.load_shedding import LoadSheddingMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.query_budget import QueryBudgetMiddleware
+from app.middleware.read_your_writes import ReadYourWritesMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """アプリの起動時と終了時の処理
+
+    起動時にコネクションプールを温め、レプリカの確認を開始してから、
+    リクエストの受け付けを始める。
+    """
+    warmup_connections = (
+        settings.DB_POOL_SIZE
+        if settings.DB_POOL_WARMUP_CONNECTIONS is None
+        else settings.DB_POOL_WARMUP_CONNECTIONS
+    )
+    if warmup_connections > 0:
+        await warm_up_pools(warmup_connections, settings.DB_POOL_WARMUP_TIMEOUT_SECONDS)
+    replicas = get_read_replicas()
+    replicas.start()
+    writer = crud.get_comment_writer()
+    if settings.COMMENT_WRITE_BEHIND_ENABLED:
+        writer.start()
+    try:
+        yield
+    finally:
+        # 受け付け済みで書き込み待ちのコメントを全て書き込んでから終了する
+        await writer.stop()
+        await replicas.stop()
+        await dispose_engines()
+
+
+def create_app() -> FastAPI:
+    """アプリを作成する
+
+    設定の読み込みやミドルウェアの構築はこの関数の呼び出し時に行い、
+    DBへの接続は lifespan の開始時に行う。
+
+    使い方:
+        uvicorn app.main:create_app --factory
+
+    Returns:
+        FastAPI: アプリ
+    """
+    app = FastAPI(
+        title=settings.PROJECT_NAME,
+        openapi_url=f"{settings.API_V1_STR}/openapi.json",
+        lifespan=lifespan,
+    )
+
+    app.add_middleware(
+        ReadYourWritesMiddleware, sticky_seconds=settings.READ_YOUR_WRITES_SECONDS
+    )
+    app.add_middleware(
+        QueryBudgetMiddleware, warn=settings.ENVIRONMENT == "development"
+    )
+    if settings.LOAD_SHEDDING_ENABLED:
+        # 上限を超えたリクエストはDBのセッションを作る前に返す。503もメトリクスに記録されるよう
+        # MetricsMiddleware の内側に置く
+        app.add_middleware(
+            LoadSheddingMiddleware,
+            read_latency_target_ms=settings.LOAD_SHEDDING_READ_LATENCY_TARGET_MS,
+            write_latency_target_ms=settings.LOAD_SHEDDING_WRITE_LATENCY_TARGET_MS,
+            pool_wait_target_ms=settings.LOAD_SHEDDING_POOL_WAIT_TARGET_MS,
+            pool_stats=lambda: getattr(get_async_engine().pool, "stats", None),
+        )
+    # 最も外側で計測するため最後に追加する
+    app.add_middleware(MetricsMiddleware)
 
-app.include_router(router, prefix=settings.API_V1_STR)
+    app.include_router(router, prefix=settings.API_V1_STR)
+    if settings.INTERNAL_ENDPOINTS_ENABLED:
+        # プロセスの内部状態を返すため、有効にした場合だけ公開する
+        dependencies = [Depends(deps.verify_internal_token)]
+        app.include_router(metrics.router, dependencies=dependencies)
+        app.include_router(
+            internal.router,
+            prefix=f"{settings.API_V1_STR}/internal",
+            tags=["internal"],
+            dependencies=dependencies,
+        )
+    return app
@@ -0,0 +1,144 @@
+import json
+import time
+from functools import lru_cache
+from typing import Callable, Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.concurrency import AIMDLimiter
+from app.core.config import settings
+from app.db.pool import PoolStats
+from app.middleware.read_your_writes import is_write_request
+
+# 過負荷のクライアントに再試行までの待ち時間として返す秒数
+RETRY_AFTER_SECONDS = 1
+
+_REJECTED_BODY = json.dumps({"detail": "Server is overloaded"}).encode()
+
+
+def _connections() -> int:
+    # 1ワーカーが同時に使えるプライマリのコネクション数
+    return settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+
+
+# 読み取りはレプリカにも振り分けられ、キャッシュで済むものもあるため、
+# コネクション数の2倍から始める。書き込みはコネクション数から始める
+@lru_cache
+def get_read_limiter() -> AIMDLimiter:
+    """読み取りの同時実行数の上限を返す（設定は最初の呼び出しで読み込む）"""
+    return AIMDLimiter(
+        "read",
+        initial_limit=_connections() * 2,
+        min_limit=settings.LOAD_SHEDDING_MIN_LIMIT,
+        max_limit=settings.LOAD_SHEDDING_MAX_LIMIT,
+        backoff_ratio=settings.LOAD_SHEDDING_BACKOFF_RATIO,
+        cooldown_seconds=settings.LOAD_SHEDDING_READ_LATENCY_TARGET_MS / 1000,
+    )
+
+
+@lru_cache
+def get_write_limiter() -> AIMDLimiter:
+    """書き込みの同時実行数の上限を返す（設定は最初の呼び出しで読み込む）"""
+    return AIMDLimiter(
+        "write",
+        initial_limit=_connections(),
+        min_limit=settings.LOAD_SHEDDING_MIN_LIMIT,
+        max_limit=settings.LOAD_SHEDDING_MAX_LIMIT,
+        backoff_ratio=settings.LOAD_SHEDDING_BACKOFF_RATIO,
+        cooldown_seconds=settings.LOAD_SHEDDING_WRITE_LATENCY_TARGET_MS / 1000,
+    )
+
+
+class LoadSheddingMiddleware:
+    """読み取りと書き込みで別々の適応的な同時実行数の上限を設け、超えた分を即座に503で返すミドルウェア
+
+    上限は AIMDLimiter で調整し、次のいずれかを過負荷の兆候として減らす。
+
+    - 応答の開始までの時間が目標を超えた
+    - 前回の応答以降のコネクションのチェックアウト待ちの平均が目標を超えた
+    - 前回の応答以降にチェックアウトがタイムアウトした
+
+    応答の開始までの時間で判定するため、ストリーミングの長さは影響しない。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        read_latency_target_ms: float,
+        write_latency_target_ms: float,
+        pool_wait_target_ms: float,
+        pool_stats: Callable[[], Optional[PoolStats]],
+        read_limiter: Optional[AIMDLimiter] = None,
+        write_limiter: Optional[AIMDLimiter] = None,
+        exempt_paths: Iterable[str] = ("/metrics",),
+    ) -> None:
+        self.app = app
+        self.read_limiter = read_limiter or get_read_limiter()
+        self.write_limiter = write_limiter or get_write_limiter()
+        self.read_latency_target_seconds = read_latency_target_ms / 1000
+        self.write_latency_target_seconds = write_latency_target_ms / 1000
+        self.pool_wait_target_seconds = pool_wait_target_ms / 1000
+        self.pool_stats = pool_stats
+        self.exempt_paths = frozenset(exempt_paths)
+        self._pool_sample = (0, 0.0, 0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if is_write_request(scope):
+            limiter = self.write_limiter
+            latency_target = self.write_latency_target_seconds
+        else:
+            limiter = self.read_limiter
+            latency_target = self.read_latency_target_seconds
+
+        if not limiter.try_acquire():
+            await self._reject(send)
+            return
+
+        started = time.perf_counter()
+        latency: Optional[float] = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal latency
+            if message["type"] == "http.response.start":
+                latency = time.perf_counter() - started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if latency is None:
+                latency = time.perf_counter() - started
+            limiter.release(latency > latency_target or self._pool_congested())
+
+    def _pool_congested(self) -> bool:
+        # 累計値の前回からの差分で、直近のチェックアウトの状況を判定する
+        stats = self.pool_stats()
+        if stats is None:
+            return False
+        count, total, timeouts = stats.wait_count, stats.wait_sum, stats.timeouts
+        last_count, last_total, last_timeouts = self._pool_sample
+        self._pool_sample = (count, total, timeouts)
+        if timeouts > last_timeouts:
+            return True
+        waits = count - last_count
+        return (
+            waits > 0 and (total - last_total) / waits > self.pool_wait_target_seconds
+        )
+
+    async def _reject(self, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_REJECTED_BODY)).encode()),
+                    (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": _REJECTED_BODY})
@@ -0,0 +1,102 @@
+import time
+
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import Counter, Gauge, Histogram, registry
+from app.db.query_stats import track_queries
+
+# ルーティングに一致しなかったリクエストのラベル（パスをそのまま使うとラベルが際限なく増えるため）
+UNMATCHED_ROUTE = "<unmatched>"
+
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUESTS = registry.register(
+    Counter(
+        "http_requests_total",
+        "処理したHTTPリクエストの件数",
+        ("method", "route", "status"),
+    )
+)
+REQUEST_DURATION = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTPリクエストの処理時間",
+        ("method", "route"),
+    )
+)
+IN_PROGRESS = registry.register(
+    Gauge(
+        "http_requests_in_progress",
+        "処理中のHTTPリクエストの件数",
+        ("method",),
+    )
+)
+DB_STATEMENTS = registry.register(
+    Histogram(
+        "http_request_db_statements",
+        "1リクエストで実行したSQL文の件数",
+        ("method", "route"),
+        buckets=STATEMENT_BUCKETS,
+    )
+)
+DB_DURATION = registry.register(
+    Histogram(
+        "http_request_db_duration_seconds",
+        "1リクエストでSQLの実行に費やした時間",
+        ("method", "route"),
+    )
+)
+
+
+def route_label(scope: Scope) -> str:
+    """リクエストが一致したルートのパステンプレートを返す
+
+    ルーティング後のscopeにはFastAPIが一致したルートを設定するため、
+    アプリの呼び出しが終わってから参照する。
+
+    Args:
+        scope (Scope): ASGIのscope
+
+    Returns:
+        str: ルートのパス（例: /api/v1/posts/{post_id}）
+    """
+    route = scope.get("route")
+    if isinstance(route, BaseRoute) and hasattr(route, "path"):
+        return route.path
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ルートごとのレイテンシ、ステータスコード、SQLの件数と時間を記録するミドルウェア"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc(method)
+        started = time.perf_counter()
+        try:
+            with track_queries() as stats:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec(method)
+            route = route_label(scope)
+            REQUESTS.inc(method, route, str(status))
+            REQUEST_DURATION.observe(method, route, value=elapsed)
+            DB_STATEMENTS.observe(method, route, value=stats.statements)
+            DB_DURATION.observe(method, route, value=stats.duration)
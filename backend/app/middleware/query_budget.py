@@ -0,0 +1,33 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.db.query_budget import find_violation, get_query_budget, report_violation
+from app.db.query_stats import track_queries
+
+
+class QueryBudgetMiddleware:
+    """エンドポイントに宣言されたSQL文の件数の予算を超えたリクエストを検出するミドルウェア
+
+    N+1や重複した存在確認のクエリを検出するためのもので、レスポンスは変更しない。
+    予算超過はpytestのフィクスチャに通知され、warnがTrueの場合は警告をログに記録する。
+    """
+
+    def __init__(self, app: ASGIApp, warn: bool) -> None:
+        self.app = app
+        self.warn = warn
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+
+        # ルーティング後のscopeから一致したエンドポイントの予算を取得する
+        route = scope.get("route")
+        budget = get_query_budget(scope.get("endpoint"))
+        if route is None or budget is None:
+            return
+        violation = find_violation(f"{scope['method']} {route.path}", budget, stats)
+        if violation is not None:
+            report_violation(violation, warn=self.warn)
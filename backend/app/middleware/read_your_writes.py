@@ -0,0 +1,82 @@
+import time
+from http.cookies import SimpleCookie
+
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 書き込み後にプライマリから読む期限（UNIX時刻）を保持するクッキー名
+COOKIE_NAME = "read_primary_until"
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# 本文でIDの一覧を受け取るためにPOSTを使う、読み取りだけのカスタムメソッド
+READ_ONLY_CUSTOM_METHODS = (":batchGet",)
+
+
+def is_write_request(scope: Scope) -> bool:
+    """データを変更するリクエストかどうかをメソッドとパスから判定する
+
+    ミドルウェアではルーティング前のため、エンドポイントではなくパスで判定する。
+
+    Args:
+        scope (Scope): リクエストのスコープ
+
+    Returns:
+        bool: 書き込みのリクエストの場合はTrue
+    """
+    return scope["method"] in WRITE_METHODS and not scope["path"].endswith(
+        READ_ONLY_CUSTOM_METHODS
+    )
+
+
+def reads_from_primary(connection: HTTPConnection) -> bool:
+    """直前に書き込みを行ったクライアントのリクエストかどうかを判定する
+
+    Args:
+        connection (HTTPConnection): リクエスト
+
+    Returns:
+        bool: プライマリから読むべき場合はTrue
+    """
+    try:
+        until = float(connection.cookies.get(COOKIE_NAME, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+class ReadYourWritesMiddleware:
+    """書き込みに成功したクライアントにプライマリ固定のクッキーを付与するミドルウェア
+
+    レプリカの遅延があっても、書き込んだクライアントが直後のGETで
+    自分の変更を読めるようにする。クッキーを保持しないクライアントには効果がない。
+    """
+
+    def __init__(self, app: ASGIApp, sticky_seconds: float) -> None:
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not is_write_request(scope)
+            or self.sticky_seconds <= 0
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = SimpleCookie()
+                cookie[COOKIE_NAME] = str(time.time() + self.sticky_seconds)
+                cookie[COOKIE_NAME]["max-age"] = int(self.sticky_seconds) + 1
+                cookie[COOKIE_NAME]["path"] = "/"
+                cookie[COOKIE_NAME]["httponly"] = True
+                cookie[COOKIE_NAME]["samesite"] = "lax"
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"set-cookie", cookie.output(header="").strip().encode("latin-1")),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,19 +1,40 @@
-import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 
 from app.db.base_class import Base
+from app.db.ids import new_id
+
+# 全文検索に使うテキスト検索設定（言語に依存しない分かち書きのみを行う）
+SEARCH_CONFIG = "simple"
+
+# タイトルの一致を本文の一致より高く評価するため、重みを分けて連結する
+SEARCH_VECTOR_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')"
+)
 
 
 class Post(Base):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    id = Column(UUID(as_uuid=False), primary_key=True, default=new_id)
+    user_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
     title = Column(String(100), nullable=False)
     content = Column(String(1000), nullable=False)
+    # コメントの作成・削除と同じトランザクションで増減させる非正規化したコメント数
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # 検索専用のため、投稿の読み込み時には取得しない
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True))
+    )
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
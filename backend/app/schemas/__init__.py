@@ -1,3 +1,7 @@
+from app.schemas.common import * # noqa
 from app.schemas.user import * # noqa
 from app.schemas.post import * # noqa
-from app.schemas.comment import * # noqa
\ No newline at end of file
+from app.schemas.comment import * # noqa
+from app.schemas.pagination import * # noqa
+from app.schemas.bulk import * # noqa
+from app.schemas.batch import * # noqa
\ No newline at end of file
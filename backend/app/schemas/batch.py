@@ -0,0 +1,26 @@
+from typing import Generic, List, TypeVar
+
+from pydantic import BaseModel, Field
+
+from app.schemas.common import UUIDStr
+
+T = TypeVar("T")
+
+# ID指定の一括取得で1回に受け付ける最大件数
+BATCH_GET_MAX_IDS = 100
+
+
+class BatchGetRequest(BaseModel):
+    """ID指定の一括取得のリクエストモデル"""
+
+    ids: List[UUIDStr] = Field(..., min_length=1, max_length=BATCH_GET_MAX_IDS)
+
+
+class BatchGetResponse(BaseModel, Generic[T]):
+    """ID指定の一括取得のレスポンスモデル
+
+    itemsはリクエストのIDの順序で並べ、重複したIDは最初の1件だけを返す。
+    """
+
+    items: List[T]
+    missing: List[str] = []
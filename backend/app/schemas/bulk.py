@@ -0,0 +1,22 @@
+from typing import Generic, List, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+# 一括作成エンドポイントで1回に受け付ける最大件数
+BULK_MAX_ITEMS = 1000
+
+
+class BulkItemError(BaseModel):
+    """一括作成で作成できなかった要素のエラー"""
+
+    index: int
+    detail: str
+
+
+class BulkCreateResponse(BaseModel, Generic[T]):
+    """一括作成のレスポンスモデル"""
+
+    created: List[T]
+    errors: List[BulkItemError] = []
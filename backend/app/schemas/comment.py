@@ -2,6 +2,8 @@ from typing import Optional
 
 from pydantic import BaseModel
 
+from app.schemas.common import UUIDStr
+
 
 class CommentBase(BaseModel):
     """コメントのベースモデル"""
@@ -12,7 +14,7 @@ class CommentBase(BaseModel):
 class CommentCreate(CommentBase):
     """コメントの作成モデル"""
 
-    user_id: str
+    user_id: UUIDStr
 
 
 class CommentResponse(CommentBase):
@@ -0,0 +1,13 @@
+import uuid
+from typing import Annotated
+
+from pydantic import AfterValidator
+
+
+def _normalize_uuid(value: str) -> str:
+    """UUIDとして解釈できる文字列を正規化された表現に揃える"""
+    return str(uuid.UUID(value))
+
+
+# 主キー・外部キーに使うIDの型（APIでは文字列として扱い、UUIDとして検証する）
+UUIDStr = Annotated[str, AfterValidator(_normalize_uuid)]
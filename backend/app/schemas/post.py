@@ -1,7 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
+from app.schemas.comment import CommentWithUserResponse
+from app.schemas.common import UUIDStr
+
 
 class PostBase(BaseModel):
     """投稿のベースモデル"""
@@ -13,7 +16,7 @@ class PostBase(BaseModel):
 class PostCreate(PostBase):
     """投稿の作成モデル"""
 
-    user_id: str
+    user_id: UUIDStr
 
 
 class PostResponse(PostBase):
@@ -21,10 +24,23 @@ class PostResponse(PostBase):
 
     id: str
     user_id: str
+    comment_count: int = 0
 
     model_config = {"from_attributes": True}
 
 
+class PostSearchResult(PostResponse):
+    """投稿の検索結果のレスポンスモデル"""
+
+    rank: float
+
+
+class FeedPostResponse(PostResponse):
+    """フィードの投稿のレスポンスモデル（新しい順のコメント付き）"""
+
+    comments: List[CommentWithUserResponse] = []
+
+
 class PostUpdate(PostBase):
     """投稿の更新モデル"""
 
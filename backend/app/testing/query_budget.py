@@ -0,0 +1,40 @@
+"""SQL文の件数の予算を超えたテストを失敗させるpytestプラグイン
+
+conftest.py に ``pytest_plugins = ["app.testing.query_budget"]`` を書いて有効にする。
+"""
+
+from typing import Iterator
+
+import pytest
+
+from app.db.query_budget import (
+    QueryBudgetViolation,
+    assert_max_queries,
+    collect_violations,
+)
+
+
+@pytest.fixture(autouse=True)
+def query_budget_violations() -> Iterator[list[QueryBudgetViolation]]:
+    """テスト中のリクエストがエンドポイントの予算を超えた場合にテストを失敗させる
+
+    Yields:
+        list[QueryBudgetViolation]: テスト中に発生した予算超過の一覧
+    """
+    with collect_violations() as violations:
+        yield violations
+    if violations:
+        pytest.fail(
+            "SQL query budget exceeded:\n"
+            + "\n".join(f"  {violation}" for violation in violations),
+            pytrace=False,
+        )
+
+
+@pytest.fixture
+def max_queries():
+    """テスト内の任意のブロックにSQL文の件数の上限を設けるコンテキストマネージャー
+
+    例: ``with max_queries(2): ...``
+    """
+    return assert_max_queries
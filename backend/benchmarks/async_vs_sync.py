@@ -0,0 +1,119 @@
+"""同期DBパスと非同期DBパスのスループットを比較するベンチマーク
+
+`async def` のハンドラ内で同期セッションを使う旧来の実装と、
+AsyncSession を使う現在の実装に同じ負荷をかけ、秒間リクエスト数を比較する。
+
+使い方:
+    pipenv run python -m benchmarks.async_vs_sync --requests 2000 --concurrency 200
+
+`--sleep-ms` を指定すると各リクエストで `pg_sleep` を実行し、遅いクエリが
+イベントループ全体を止める様子を再現できる。
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.api import deps
+from app.db.session import SessionLocal
+
+
+def get_sync_db():
+    """旧来の同期セッションを返す依存性"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def build_sync_app(sleep_seconds: float) -> FastAPI:
+    """同期セッションをasyncハンドラから呼ぶ（イベントループをブロックする）アプリ"""
+    app = FastAPI()
+
+    @app.get("/users/")
+    async def read_users(db: Session = Depends(get_sync_db)):
+        if sleep_seconds:
+            db.execute(text("SELECT pg_sleep(:s)"), {"s": sleep_seconds})
+        return [
+            {"id": u.id, "name": u.name}
+            for u in db.scalars(select(models.User).limit(20))
+        ]
+
+    return app
+
+
+def build_async_app(sleep_seconds: float) -> FastAPI:
+    """AsyncSessionを使うアプリ"""
+    app = FastAPI()
+
+    @app.get("/users/")
+    async def read_users(db: AsyncSession = Depends(deps.get_db)):
+        if sleep_seconds:
+            await db.execute(text("SELECT pg_sleep(:s)"), {"s": sleep_seconds})
+        result = await db.scalars(select(models.User).limit(20))
+        return [{"id": u.id, "name": u.name} for u in result]
+
+    return app
+
+
+async def run_load(app: FastAPI, total: int, concurrency: int) -> dict:
+    """指定した並列数でリクエストを送り、スループットとレイテンシを計測する"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one() -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/users/")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--sleep-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    sleep_seconds = args.sleep_ms / 1000
+    builders: dict[str, Callable[[float], FastAPI]] = {
+        "sync": build_sync_app,
+        "async": build_async_app,
+    }
+    for name, build in builders.items():
+        result = asyncio.run(
+            run_load(build(sleep_seconds), args.requests, args.concurrency)
+        )
+        print(name, result)
+
+
+if __name__ == "__main__":
+    main()
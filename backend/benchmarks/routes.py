@@ -0,0 +1,452 @@
+"""api_router の全ルートのレイテンシとスループットを計測するベンチマーク
+
+benchmarks.seed で投入したデータからIDを抽出し、ルートごとに指定した並列数で
+リクエストを送る。結果はJSONで出力し、--baseline に以前の結果を渡すと
+ルート・並列数ごとの差分を表示するため、コミット間で比較できる。
+
+既定ではアプリをプロセス内で動かす（httpx.ASGITransport）ため、ローカルの
+PostgreSQL以外のサービスは不要。--base-url を指定すると起動済みのサーバーに送る。
+書き込み系のルートはデータを変更するため、厳密に比較する場合は計測の前に
+benchmarks.seed --truncate でデータを入れ直す。
+同時実行数の上限は既定で無効のため、上限なしで比較される。LOAD_SHEDDING_ENABLED=true で
+実行すると、並列数が上限を超えた分は503になり、その件数も結果に含まれる。
+
+使い方:
+    pipenv run python -m benchmarks.seed --truncate
+    pipenv run python -m benchmarks.routes --concurrency 1 10 50 --output after.json --baseline before.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import httpx
+from sqlalchemy import text
+
+from app.api.api_v1.api_router import router
+from app.core.config import settings
+from app.db.session import engine
+from app.main import create_app
+from benchmarks.seed import WORDS
+
+# 一括作成のルートで1リクエストに含める件数
+BULK_SIZE = 20
+
+# ID指定の一括取得のルートで1リクエストに含める件数
+BATCH_GET_SIZE = 20
+
+
+@dataclass
+class Fixtures:
+    """リクエストのパスや本文に使うID"""
+
+    user_ids: list[str]
+    hot_user_ids: list[str]
+    post_ids: list[str]
+    hot_post_ids: list[str]
+    comment_ids: list[str]
+    # DELETEのルートで1件ずつ消費する、計測用に作成したID
+    disposable: dict[str, deque] = field(default_factory=dict)
+
+    def user_id(self, rng: random.Random) -> str:
+        """投稿数の多いユーザーを2割の確率で選ぶ"""
+        pool = self.hot_user_ids if rng.random() < 0.2 else self.user_ids
+        return rng.choice(pool)
+
+    def post_id(self, rng: random.Random) -> str:
+        """コメント数の多い投稿を2割の確率で選ぶ"""
+        pool = self.hot_post_ids if rng.random() < 0.2 else self.post_ids
+        return rng.choice(pool)
+
+
+Request = tuple[str, Optional[Any]]
+
+
+@dataclass
+class Scenario:
+    """1つのルートに送るリクエストの作り方"""
+
+    method: str
+    path: str
+    build: Callable[[Fixtures, random.Random], Request]
+
+
+def _post_body(fixtures: Fixtures, rng: random.Random) -> dict:
+    return {
+        "title": "benchmark",
+        "content": "benchmark " * rng.randint(5, 50),
+        "user_id": fixtures.user_id(rng),
+    }
+
+
+def _comment_body(fixtures: Fixtures, rng: random.Random) -> dict:
+    return {"content": "benchmark comment", "user_id": fixtures.user_id(rng)}
+
+
+SCENARIOS = [
+    Scenario("POST", "/users/", lambda f, r: ("/users/", {"name": "bench"})),
+    Scenario(
+        "POST",
+        "/users/bulk",
+        lambda f, r: ("/users/bulk", [{"name": "bench"}] * BULK_SIZE),
+    ),
+    Scenario("GET", "/users/", lambda f, r: ("/users/", None)),
+    Scenario(
+        "GET",
+        "/users",
+        lambda f, r: (
+            f"/users?ids={','.join(f.user_id(r) for _ in range(BATCH_GET_SIZE))}",
+            None,
+        ),
+    ),
+    Scenario("GET", "/users/{user_id}", lambda f, r: (f"/users/{f.user_id(r)}", None)),
+    Scenario(
+        "PATCH",
+        "/users/{user_id}",
+        lambda f, r: (f"/users/{f.user_id(r)}", {"name": "renamed"}),
+    ),
+    Scenario(
+        "DELETE",
+        "/users/{user_id}",
+        lambda f, r: (f"/users/{f.disposable['users'].popleft()}", None),
+    ),
+    Scenario(
+        "GET",
+        "/users/{user_id}/posts",
+        lambda f, r: (f"/users/{f.user_id(r)}/posts", None),
+    ),
+    Scenario(
+        "GET",
+        "/users/{user_id}/feed",
+        lambda f, r: (f"/users/{f.user_id(r)}/feed", None),
+    ),
+    Scenario("POST", "/posts/", lambda f, r: ("/posts/", _post_body(f, r))),
+    Scenario(
+        "POST",
+        "/posts/bulk",
+        lambda f, r: ("/posts/bulk", [_post_body(f, r) for _ in range(BULK_SIZE)]),
+    ),
+    Scenario("GET", "/posts/", lambda f, r: ("/posts/", None)),
+    Scenario(
+        "GET",
+        "/posts/search",
+        lambda f, r: (f"/posts/search?q={'+'.join(r.sample(WORDS, 2))}", None),
+    ),
+    Scenario("GET", "/posts/export", lambda f, r: ("/posts/export", None)),
+    Scenario(
+        "POST",
+        "/posts:batchGet",
+        lambda f, r: (
+            "/posts:batchGet",
+            {"ids": [f.post_id(r) for _ in range(BATCH_GET_SIZE)]},
+        ),
+    ),
+    Scenario("GET", "/posts/{post_id}", lambda f, r: (f"/posts/{f.post_id(r)}", None)),
+    Scenario(
+        "PATCH",
+        "/posts/{post_id}",
+        lambda f, r: (f"/posts/{f.post_id(r)}", {"title": "edited"}),
+    ),
+    Scenario(
+        "DELETE",
+        "/posts/{post_id}",
+        lambda f, r: (f"/posts/{f.disposable['posts'].popleft()}", None),
+    ),
+    Scenario(
+        "POST",
+        "/posts/{post_id}/comments/",
+        lambda f, r: (f"/posts/{f.post_id(r)}/comments/", _comment_body(f, r)),
+    ),
+    Scenario(
+        "POST",
+        "/posts/{post_id}/comments/bulk",
+        lambda f, r: (
+            f"/posts/{f.post_id(r)}/comments/bulk",
+            [_comment_body(f, r) for _ in range(BULK_SIZE)],
+        ),
+    ),
+    Scenario(
+        "GET",
+        "/posts/{post_id}/comments/export",
+        lambda f, r: (f"/posts/{f.post_id(r)}/comments/export", None),
+    ),
+    Scenario(
+        "GET",
+        "/posts/{post_id}/comments/",
+        lambda f, r: (f"/posts/{f.post_id(r)}/comments/", None),
+    ),
+    Scenario(
+        "PATCH",
+        "/comments/{comment_id}",
+        lambda f, r: (
+            f"/comments/{r.choice(f.comment_ids)}",
+            {"content": "edited comment"},
+        ),
+    ),
+    Scenario(
+        "DELETE",
+        "/comments/{comment_id}",
+        lambda f, r: (f"/comments/{f.disposable['comments'].popleft()}", None),
+    ),
+]
+
+
+def uncovered_routes() -> list[str]:
+    """シナリオが定義されていない api_router のルートを返す"""
+    covered = {(scenario.method, scenario.path) for scenario in SCENARIOS}
+    return [
+        f"{method} {route.path}"
+        for route in router.routes
+        for method in sorted(route.methods)
+        if (method, route.path) not in covered
+    ]
+
+
+def load_fixtures(sample_size: int, random_seed: int) -> Fixtures:
+    """投入済みのデータからIDを決定的に抽出する"""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT setseed(:seed)"), {"seed": random_seed / 1000})
+
+        def sample(table: str) -> list[str]:
+            return list(
+                connection.scalars(
+                    text(f"SELECT id::text FROM {table} ORDER BY random() LIMIT :n"),
+                    {"n": sample_size},
+                )
+            )
+
+        def hottest(table: str, column: str) -> list[str]:
+            return list(
+                connection.scalars(
+                    text(
+                        f"SELECT {column}::text FROM {table} GROUP BY {column} "
+                        "ORDER BY count(*) DESC LIMIT 10"
+                    )
+                )
+            )
+
+        fixtures = Fixtures(
+            user_ids=sample("users"),
+            hot_user_ids=hottest("posts", "user_id"),
+            post_ids=sample("posts"),
+            hot_post_ids=hottest("comments", "post_id"),
+            comment_ids=sample("comments"),
+        )
+    if not (fixtures.user_ids and fixtures.post_ids and fixtures.comment_ids):
+        raise SystemExit("データがありません。先に benchmarks.seed を実行してください")
+    return fixtures
+
+
+async def create_disposables(
+    client: httpx.AsyncClient, fixtures: Fixtures, count: int
+) -> None:
+    """DELETEのルートで削除する、関連を持たないユーザー・投稿・コメントを作成する"""
+
+    async def bulk(url: str, body: dict) -> list[str]:
+        ids: list[str] = []
+        for offset in range(0, count, 1000):
+            size = min(1000, count - offset)
+            response = await client.post(url, json=[body] * size)
+            response.raise_for_status()
+            ids.extend(item["id"] for item in response.json()["created"])
+        return ids
+
+    user_id = fixtures.user_ids[0]
+    post_id = fixtures.post_ids[0]
+    fixtures.disposable = {
+        "users": deque(await bulk("/users/bulk", {"name": "disposable"})),
+        "posts": deque(
+            await bulk(
+                "/posts/bulk",
+                {"title": "disposable", "content": "disposable", "user_id": user_id},
+            )
+        ),
+        "comments": deque(
+            await bulk(
+                f"/posts/{post_id}/comments/bulk",
+                {"content": "disposable", "user_id": user_id},
+            )
+        ),
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    fixtures: Fixtures,
+    total: int,
+    concurrency: int,
+    rng: random.Random,
+) -> dict:
+    """1つのルートに指定した並列数でリクエストを送り、レイテンシを計測する"""
+    # リクエストの内容は計測の前に作り、乱数の消費順を並列数に依存させない
+    requests = [scenario.build(fixtures, rng) for _ in range(total)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+
+    async def one(url: str, body: Optional[Any]) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(scenario.method, url, json=body)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(url, body) for url, body in requests))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "route": f"{scenario.method} {scenario.path}",
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(
+            count for status, count in statuses.items() if int(status) >= 400
+        ),
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p90_ms": round(latencies[int(len(latencies) * 0.9) - 1] * 1000, 2),
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def table_counts() -> dict[str, int]:
+    with engine.connect() as connection:
+        return {
+            table: connection.scalar(text(f"SELECT count(*) FROM {table}"))
+            for table in ("users", "posts", "comments")
+        }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    fixtures = load_fixtures(args.sample_size, args.seed)
+    pattern = re.compile(args.routes) if args.routes else None
+    scenarios = [
+        scenario
+        for scenario in SCENARIOS
+        if pattern is None or pattern.search(f"{scenario.method} {scenario.path}")
+    ]
+
+    if args.base_url:
+        lifespan = contextlib.nullcontext()
+        client = httpx.AsyncClient(
+            base_url=args.base_url + settings.API_V1_STR, timeout=None
+        )
+    else:
+        # ASGITransport はlifespanを実行しないため、プールの温めなどはここで行う
+        app = create_app()
+        lifespan = app.router.lifespan_context(app)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://bench" + settings.API_V1_STR,
+            timeout=None,
+        )
+
+    results = []
+    async with lifespan, client:
+        if any(scenario.method == "DELETE" for scenario in scenarios):
+            await create_disposables(
+                client, fixtures, args.requests * len(args.concurrency)
+            )
+        for scenario in scenarios:
+            for concurrency in args.concurrency:
+                result = await measure(
+                    client, scenario, fixtures, args.requests, concurrency, rng
+                )
+                print(
+                    f"{result['route']:<40} c={concurrency:<4} "
+                    f"rps={result['rps']:<8} p50={result['p50_ms']}ms "
+                    f"p99={result['p99_ms']}ms errors={result['errors']}"
+                )
+                results.append(result)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "target": args.base_url or "in-process",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "rows": table_counts(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """ルート・並列数ごとに基準の結果との差分（%）を表示する"""
+    previous = {
+        (result["route"], result["concurrency"]): result
+        for result in baseline["results"]
+    }
+    print(f"\nbaseline: {baseline['meta'].get('commit')}")
+    for result in report["results"]:
+        before = previous.get((result["route"], result["concurrency"]))
+        if before is None:
+            continue
+        deltas = " ".join(
+            f"{metric}={(result[metric] - before[metric]) / before[metric] * 100:+.1f}%"
+            for metric in ("rps", "p50_ms", "p99_ms")
+            if before[metric]
+        )
+        print(f"{result['route']:<40} c={result['concurrency']:<4} {deltas}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--sample-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--routes", help="計測するルートを絞り込む正規表現")
+    parser.add_argument(
+        "--base-url", help="起動済みのサーバーのURL（例: http://localhost:8000）"
+    )
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル")
+    parser.add_argument("--baseline", help="比較する以前の結果のJSONファイル")
+    args = parser.parse_args()
+
+    missing = uncovered_routes()
+    if missing:
+        raise SystemExit(f"シナリオのないルートがあります: {', '.join(missing)}")
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""ベンチマーク用のデータをCOPYで投入する決定的なデータ生成器
+
+同じ --seed からは常に同じ行が生成されるため、コミット間で同じデータに対して
+ベンチマークを比較できる。投稿数とコメント数はZipf分布で偏らせ、
+ごく一部のユーザー・投稿に件数が集中する実データに近い形にする。
+
+使い方:
+    pipenv run python -m benchmarks.seed --users 10000 --posts 200000 --comments 1000000 --truncate
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import text
+
+from app.db.session import engine
+
+# 生成するデータの作成日時の範囲の始点
+EPOCH = datetime(2024, 1, 1)
+
+WORDS = (
+    "fastapi postgres async query index cursor cache replica pool latency "
+    "throughput budget stream export batch keyset uuid vacuum lateral"
+).split()
+
+
+def uuid7_at(moment: datetime, rng: random.Random) -> str:
+    """指定した時刻のUUIDv7を乱数生成器から決定的に生成する
+
+    Args:
+        moment (datetime): UUIDに埋め込む時刻
+        rng (random.Random): 乱数生成器
+
+    Returns:
+        str: UUIDの文字列表現
+    """
+    timestamp_ms = int((moment - datetime(1970, 1, 1)).total_seconds() * 1000)
+    return str(
+        uuid.UUID(
+            int=(timestamp_ms & ((1 << 48) - 1)) << 80
+            | 0x7 << 76
+            | rng.getrandbits(12) << 64
+            | 0b10 << 62
+            | rng.getrandbits(62)
+        )
+    )
+
+
+def zipf_cum_weights(count: int, skew: float) -> list[float]:
+    """順位の skew 乗に反比例する重みの累積和を返す（random.choices用）"""
+    return list(itertools.accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+def timestamps(count: int, span: timedelta, rng: random.Random) -> list[datetime]:
+    """期間内に昇順に並ぶ作成日時を生成する"""
+    seconds = span.total_seconds()
+    return [
+        EPOCH + timedelta(seconds=offset)
+        for offset in sorted(rng.uniform(0, seconds) for _ in range(count))
+    ]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def generate_users(count: int, span: timedelta, rng: random.Random) -> list[tuple]:
+    return [
+        (uuid7_at(created_at, rng), f"user{index}", created_at, created_at)
+        for index, created_at in enumerate(timestamps(count, span, rng))
+    ]
+
+
+def generate_children(
+    count: int,
+    parents: Sequence[tuple],
+    authors: Sequence[tuple],
+    skew: float,
+    span: timedelta,
+    rng: random.Random,
+) -> Iterator[tuple[str, tuple, tuple, datetime]]:
+    """Zipf分布で親を選んで子の行（投稿・コメント）のIDと作成日時を生成する
+
+    シャッフルした親の順位に応じて重みを付けるため、一部の親に子が集中する。
+    子の作成日時は親の作成日時より後にする。
+
+    Yields:
+        tuple[str, tuple, tuple, datetime]: ID、親の行、作成者の行、作成日時
+    """
+    cum_weights = zipf_cum_weights(len(parents), skew)
+    # 作成日時と件数の相関をなくすため、重みの順位はシャッフルした親に割り当てる
+    ranked = list(parents)
+    rng.shuffle(ranked)
+    end = EPOCH + span
+    for created_at in timestamps(count, span, rng):
+        parent = rng.choices(ranked, cum_weights=cum_weights)[0]
+        parent_created_at = parent[-1]
+        if created_at < parent_created_at:
+            created_at = parent_created_at + (end - parent_created_at) * rng.random()
+        yield uuid7_at(created_at, rng), parent, rng.choice(authors), created_at
+
+
+def copy_rows(
+    table: str, columns: Sequence[str], rows: Iterable[tuple], chunk_size: int
+) -> int:
+    """行をCSVに書き出し、COPY FROM STDINで一括投入する
+
+    メモリ使用量を抑えるため、chunk_size 行ごとにCOPYを分けて実行する。
+
+    Args:
+        table (str): 投入先のテーブル名
+        columns (Sequence[str]): 投入するカラム名
+        rows (Iterable[tuple]): 投入する行
+        chunk_size (int): 1回のCOPYで投入する行数
+
+    Returns:
+        int: 投入した行数
+    """
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    iterator = iter(rows)
+    count = 0
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            while chunk := list(itertools.islice(iterator, chunk_size)):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(statement, buffer)
+                count += len(chunk)
+        connection.commit()
+    finally:
+        connection.close()
+    return count
+
+
+def seed(
+    users: int,
+    posts: int,
+    comments: int,
+    skew: float,
+    days: int,
+    random_seed: int,
+    truncate: bool,
+    chunk_size: int = 100_000,
+) -> dict:
+    """ユーザー・投稿・コメントを生成して投入する"""
+    rng = random.Random(random_seed)
+    span = timedelta(days=days)
+    timings: dict[str, float] = {}
+
+    if truncate:
+        with engine.begin() as connection:
+            connection.execute(text("TRUNCATE comments, posts, users"))
+
+    started = time.perf_counter()
+    user_rows = generate_users(users, span, rng)
+    copy_rows(
+        "users", ("id", "name", "created_at", "updated_at"), user_rows, chunk_size
+    )
+    timings["users_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    post_rows = [
+        (post_id, user[0], sentence(rng, 6), sentence(rng, 40), created_at, created_at)
+        for post_id, user, _, created_at in generate_children(
+            posts, user_rows, user_rows, skew, span, rng
+        )
+    ]
+    copy_rows(
+        "posts",
+        ("id", "user_id", "title", "content", "created_at", "updated_at"),
+        post_rows,
+        chunk_size,
+    )
+    timings["posts_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    comment_rows = (
+        (comment_id, author[0], post[0], sentence(rng, 12), created_at, created_at)
+        for comment_id, post, author, created_at in generate_children(
+            comments, post_rows, user_rows, skew, span, rng
+        )
+    )
+    copy_rows(
+        "comments",
+        ("id", "user_id", "post_id", "content", "created_at", "updated_at"),
+        comment_rows,
+        chunk_size,
+    )
+    timings["comments_s"] = time.perf_counter() - started
+
+    # COPYはアプリのコメント数の更新を通らないため、まとめて数え直す
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE posts SET comment_count = counts.comment_count "
+                "FROM (SELECT post_id, count(*) AS comment_count FROM comments "
+                "GROUP BY post_id) AS counts WHERE posts.id = counts.post_id"
+            )
+        )
+
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+            text("ANALYZE users, posts, comments")
+        )
+
+    return {
+        "users": users,
+        "posts": posts,
+        "comments": comments,
+        **{name: round(seconds, 2) for name, seconds in timings.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--posts", type=int, default=20_000)
+    parser.add_argument("--comments", type=int, default=100_000)
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Zipf分布の指数（大きいほど偏る）"
+    )
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--truncate", action="store_true", help="投入前に既存のデータを削除する"
+    )
+    args = parser.parse_args()
+
+    print(
+        seed(
+            args.users,
+            args.posts,
+            args.comments,
+            args.skew,
+            args.days,
+            args.seed,
+            args.truncate,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
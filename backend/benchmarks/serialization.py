@@ -0,0 +1,112 @@
+"""一覧レスポンスのシリアライズ方式を比較するマイクロベンチマーク
+
+ORMオブジェクトの一覧を、従来の経路（Pageモデルの構築、FastAPIのresponse_modelでの
+再検証、jsonable_encoder、json.dumps）と、app.api.serialization の経路
+（TypeAdapterで直接JSONのバイト列に変換）でそれぞれJSONにし、1ページあたりの時間を比較する。
+あわせて、Acceptで選べるMessagePackとArrow IPCストリームの時間とサイズも表示する。
+DBには接続しない。
+
+使い方:
+    pipenv run python -m benchmarks.serialization --page-sizes 50 200 1000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import models, schemas
+from app.api import serialization
+from app.db.ids import new_id
+
+
+def build_posts(count: int) -> list[models.Post]:
+    """DBから読み込んだものと同じ属性を持つ投稿を作成する"""
+    now = datetime(2024, 1, 1)
+    return [
+        models.Post(
+            id=new_id(),
+            user_id=new_id(),
+            title=f"title {index}",
+            content="benchmark " * 50,
+            comment_count=index % 17,
+            created_at=now + timedelta(seconds=index),
+            updated_at=now + timedelta(seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+async def measure(render: Callable[[], Awaitable[bytes]], iterations: int) -> float:
+    """1回あたりの平均時間（ミリ秒）を返す"""
+    await render()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await render()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+async def run(page_sizes: list[int], iterations: int) -> None:
+    field = create_response_field(
+        name="Response_read_posts", type_=schemas.Page[schemas.PostResponse]
+    )
+
+    for page_size in page_sizes:
+        posts = build_posts(page_size)
+
+        async def response_model() -> bytes:
+            content = schemas.Page[schemas.PostResponse](items=posts, next_cursor=None)
+            serialized = await serialize_response(field=field, response_content=content)
+            return JSONResponse(serialized).body
+
+        async def type_adapter() -> bytes:
+            return serialization.posts.dump_page(posts, None)
+
+        # 両方の経路が同じJSONを返すことを確認する
+        assert json.loads(await response_model()) == json.loads(await type_adapter())
+
+        baseline = await measure(response_model, iterations)
+        fast = await measure(type_adapter, iterations)
+        print(
+            f"page_size={page_size:<5} response_model={baseline:.3f}ms "
+            f"type_adapter={fast:.3f}ms speedup={baseline / fast:.1f}x"
+        )
+
+        json_size = len(await type_adapter())
+        for media_type in (
+            serialization.MSGPACK_MEDIA_TYPE,
+            serialization.ARROW_MEDIA_TYPE,
+        ):
+
+            async def binary(media_type: str = media_type) -> bytes:
+                return serialization.posts.render_page(posts, None, media_type).body
+
+            try:
+                elapsed = await measure(binary, iterations)
+            except (AttributeError, TypeError):
+                # ライブラリがインストールされていない形式は飛ばす
+                continue
+            size = len(await binary())
+            print(
+                f"{'':<15} {media_type}={elapsed:.3f}ms "
+                f"size={size / json_size:.0%} of json"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.page_sizes, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""ワーカーの起動にかかる時間と、起動直後のリクエストのレイテンシを計測するベンチマーク
+
+新しいワーカーと同じ状態から計測するため、1回ごとに子プロセスを起動し、次の時間を計る。
+
+- import: app.main の読み込み（設定の読み込みやエンジンの作成を含まないことも確認する）
+- create_app: アプリとミドルウェアの構築
+- startup: lifespan の開始（コネクションプールの温めを含む）
+- first_burst: 起動直後に --burst 件を同時に送ったときの最も遅いレスポンス
+- warm_burst: 続けてもう一度送ったときの最も遅いレスポンス
+
+コネクションプールを温めない場合（DB_POOL_WARMUP_CONNECTIONS=0）と温める場合を比較する。
+アプリはプロセス内で動かす（httpx.ASGITransport）ため、ローカルのPostgreSQLが必要。
+
+使い方:
+    pipenv run python -m benchmarks.startup --runs 5 --burst 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import httpx
+
+# 起動直後に送るリクエスト（読み取りのみ）
+FIRST_REQUEST_PATH = "/users/?limit=1"
+
+# 比較する温めの設定（Noneの場合は環境変数の値を使う）
+WARMUP_MODES: dict[str, Optional[str]] = {"cold": "0", "warm": None}
+
+
+async def send_burst(client: httpx.AsyncClient, burst: int) -> float:
+    """burst 件を同時に送り、最も遅いレスポンスの時間（ミリ秒）を返す"""
+
+    async def send() -> float:
+        started = time.perf_counter()
+        response = await client.get(FIRST_REQUEST_PATH)
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    elapsed = await asyncio.gather(*(send() for _ in range(burst)))
+    return max(elapsed) * 1000
+
+
+async def measure_child(burst: int) -> dict[str, float]:
+    """子プロセスで app.main の読み込みから2回目のリクエストまでを計測する"""
+    started = time.perf_counter()
+    from app.db import session
+    from app.main import create_app
+
+    imported = time.perf_counter()
+    # 読み込みの時点ではエンジンが作成されていないことを確認する
+    assert session.get_async_engine.cache_info().currsize == 0
+
+    from app.core.config import settings
+
+    app = create_app()
+    created = time.perf_counter()
+
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://bench" + settings.API_V1_STR,
+        ) as client:
+            first_burst = await send_burst(client, burst)
+            warm_burst = await send_burst(client, burst)
+
+    return {
+        "import_ms": (imported - started) * 1000,
+        "create_app_ms": (created - imported) * 1000,
+        "startup_ms": (ready - created) * 1000,
+        "first_burst_ms": first_burst,
+        "warm_burst_ms": warm_burst,
+    }
+
+
+def run_child(burst: int, warmup_connections: Optional[str]) -> dict[str, float]:
+    """新しいPythonプロセスで1回計測する"""
+    env = dict(os.environ)
+    if warmup_connections is not None:
+        env["DB_POOL_WARMUP_CONNECTIONS"] = warmup_connections
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", "--burst", str(burst)],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(measure_child(args.burst))))
+        return
+
+    for mode, warmup_connections in WARMUP_MODES.items():
+        runs = [run_child(args.burst, warmup_connections) for _ in range(args.runs)]
+        medians = " ".join(
+            f"{metric}={statistics.median(run[metric] for run in runs):.1f}"
+            for metric in runs[0]
+        )
+        print(f"{mode:<5} {medians}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""add post search vector
+
+Revision ID: 0002f7389735
+Revises: 3e5a81e42f54
+Create Date: 2026-10-17 12:20:51.774306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002f7389735'
+down_revision: Union[str, None] = '3e5a81e42f54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# app.models.post.SEARCH_VECTOR_EXPRESSION と同じ式（モデルの変更に追従させないため複製する）
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(content, '')), 'B')"
+)
+
+# 他のトランザクションがロックを握っている場合は待ち続けずに失敗させ、
+# 後続のクエリがロック待ちの行列に積み上がるのを防ぐ
+LOCK_TIMEOUT = '5s'
+
+
+def upgrade() -> None:
+    # STOREDの生成列の追加はテーブルを書き換えるため、書き換えの間は
+    # 投稿への読み書きが止まる。大きなテーブルではメンテナンス時間に実行する
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.add_column(
+        'posts',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+            nullable=True,
+        ),
+    )
+
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できないため、
+    # autocommitブロックで実行して稼働中のテーブルへの書き込みを止めない
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_posts_search_vector',
+            'posts',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_posts_search_vector',
+            table_name='posts',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('posts', 'search_vector')
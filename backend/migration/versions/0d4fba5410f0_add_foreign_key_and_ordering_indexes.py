@@ -0,0 +1,55 @@
+"""add foreign key and ordering indexes
+
+Revision ID: 0d4fba5410f0
+Revises: d2870d292e35
+Create Date: 2026-10-17 09:12:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d4fba5410f0'
+down_revision: Union[str, None] = 'd2870d292e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (インデックス名, テーブル名, カラム)
+# 外部キー列を先頭にし、一覧取得のキーセット順 (created_at, id) を後ろに付ける
+INDEXES = [
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+    ('ix_posts_created_at_id', 'posts', ['created_at', 'id']),
+    ('ix_posts_user_id_created_at_id', 'posts', ['user_id', 'created_at', 'id']),
+    ('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id']),
+    ('ix_comments_user_id', 'comments', ['user_id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できないため、
+    # autocommitブロックで実行して稼働中のテーブルへの書き込みを止めない
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
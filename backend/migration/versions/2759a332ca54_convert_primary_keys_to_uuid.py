@@ -0,0 +1,236 @@
+"""convert primary keys to uuid
+
+Revision ID: 2759a332ca54
+Revises: 0d4fba5410f0
+Create Date: 2026-10-17 10:03:27.114562
+
+ALTER COLUMN ... TYPE はテーブルと全てのインデックスを書き換え、その間
+ACCESS EXCLUSIVE ロックを保持し続けるため、稼働中のテーブルでは使わない。
+代わりに次の手順で、長いロックを取らずに型を切り替える。
+
+1. 新しい型の影の列を追加し、トリガーで書き込みのたびに同期する
+2. 既存の行の影の列を、区間ごとにコミットしながら埋める
+3. NOT NULL の CHECK 制約を NOT VALID で追加して検証し、主キー・一覧用の
+   インデックスを CREATE INDEX CONCURRENTLY で作成する
+4. 1つの短いトランザクションで、古い列を削除して影の列の名前を入れ替え、
+   作成済みのインデックスで主キーを付け直し、外部キーを NOT VALID で付け直す
+5. 外部キーを VALIDATE CONSTRAINT で検証する（読み書きを止めない）
+
+途中で失敗した場合は、INVALIDなインデックスや影の列を削除してから再実行する。
+既存の行を1度ずつ更新するため、完了後に VACUUM を実行して不要な行を回収する。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2759a332ca54'
+down_revision: Union[str, None] = '0d4fba5410f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# テーブル名と、型を変換するカラム（先頭は主キー）
+COLUMNS = {
+    'users': ['id'],
+    'posts': ['id', 'user_id'],
+    'comments': ['id', 'post_id', 'user_id'],
+}
+
+# (制約名, 参照元テーブル, 参照元カラム, 参照先テーブル)
+FOREIGN_KEYS = [
+    ('posts_user_id_fkey', 'posts', 'user_id', 'users'),
+    ('comments_post_id_fkey', 'comments', 'post_id', 'posts'),
+    ('comments_user_id_fkey', 'comments', 'user_id', 'users'),
+]
+
+# 変換するカラムを含むインデックス（0d4fba5410f0 で作成したもの）
+INDEXES = [
+    ('ix_users_created_at_id', 'users', ['created_at', 'id']),
+    ('ix_posts_created_at_id', 'posts', ['created_at', 'id']),
+    ('ix_posts_user_id_created_at_id', 'posts', ['user_id', 'created_at', 'id']),
+    ('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id']),
+    ('ix_comments_user_id', 'comments', ['user_id']),
+]
+
+# 影の列とその制約・インデックスの名前に付ける接尾辞
+SHADOW_SUFFIX = '_new'
+
+# 1回のUPDATEで影の列を埋める行数
+BACKFILL_BATCH_SIZE = 10000
+
+# 他のトランザクションがロックを握っている場合は待ち続けずに失敗させ、
+# 後続のクエリがロック待ちの行列に積み上がるのを防ぐ
+LOCK_TIMEOUT = '5s'
+
+
+def _shadow(column: str) -> str:
+    return f'{column}{SHADOW_SUFFIX}'
+
+
+def _trigger(table: str) -> str:
+    return f'{table}_sync_key_shadow'
+
+
+def _not_null_check(table: str, column: str) -> str:
+    return f'{table}_{_shadow(column)}_not_null'
+
+
+def _lock_tables() -> None:
+    # 書き込みは参照元、参照先（外部キーの検査）の順にロックを取るため、同じ順で
+    # 先に全てのロックを取り、テーブルごとに取る場合のデッドロックを防ぐ
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.execute(f'LOCK TABLE {", ".join(reversed(COLUMNS))} IN ACCESS EXCLUSIVE MODE')
+
+
+def _add_shadow_columns(new_type: str) -> None:
+    _lock_tables()
+    for table, columns in COLUMNS.items():
+        # デフォルト値のないnull許容の列の追加はテーブルを書き換えない
+        for column in columns:
+            op.execute(f'ALTER TABLE {table} ADD COLUMN {_shadow(column)} {new_type}')
+
+        # 移行中もアプリの書き込みが影の列に反映されるよう、トリガーで同期する
+        assignments = ' '.join(
+            f'NEW.{_shadow(column)} := NEW.{column}::{new_type};' for column in columns
+        )
+        op.execute(
+            f'CREATE FUNCTION {_trigger(table)}() RETURNS trigger AS $$ '
+            f'BEGIN {assignments} RETURN NEW; END $$ LANGUAGE plpgsql'
+        )
+        op.execute(
+            f'CREATE TRIGGER {_trigger(table)} BEFORE INSERT OR UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {_trigger(table)}()'
+        )
+
+
+def _backfill(old_type: str, new_type: str) -> None:
+    # 主キー順に区切り、区間ごとにコミットして行ロックを長時間保持しないようにする。
+    # 区間の最後の主キーを返し、次の区間の始点に使う
+    connection = op.get_bind()
+    for table, columns in COLUMNS.items():
+        assignments = ', '.join(
+            f'{_shadow(column)} = {table}.{column}::{new_type}' for column in columns
+        )
+        backfill = sa.text(
+            f"""
+            WITH batch AS (
+                SELECT id FROM {table}
+                WHERE CAST(:after AS {old_type}) IS NULL
+                    OR id > CAST(:after AS {old_type})
+                ORDER BY id
+                LIMIT :limit
+            ),
+            updated AS (
+                UPDATE {table} SET {assignments}
+                FROM batch
+                WHERE {table}.id = batch.id AND {table}.{_shadow('id')} IS NULL
+            )
+            SELECT id::text FROM batch ORDER BY id DESC LIMIT 1
+            """
+        )
+        after = None
+        while True:
+            after = connection.execute(
+                backfill, {'after': after, 'limit': BACKFILL_BATCH_SIZE}
+            ).scalar()
+            if after is None:
+                break
+
+
+def _prepare_constraints_and_indexes() -> None:
+    # SET NOT NULL は検証済みの CHECK (列 IS NOT NULL) があれば全行の走査を省くため、
+    # 先に NOT VALID で追加し、読み書きを止めない VALIDATE で検証しておく
+    op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {_not_null_check(table, column)} '
+                f'CHECK ({_shadow(column)} IS NOT NULL) NOT VALID'
+            )
+    op.execute('RESET lock_timeout')
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.execute(
+                f'ALTER TABLE {table} VALIDATE CONSTRAINT '
+                f'{_not_null_check(table, column)}'
+            )
+
+    # 主キーにするユニークインデックスと一覧用のインデックスを、書き込みを止めずに作成する
+    for table in COLUMNS:
+        op.create_index(
+            f'{table}_{_shadow("id")}_key',
+            table,
+            [_shadow('id')],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+    for name, table, columns in INDEXES:
+        op.create_index(
+            _shadow(name),
+            table,
+            [_shadow(column) if column in COLUMNS[table] else column for column in columns],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def _swap_columns() -> None:
+    # ここまでに重い処理は全て済ませてあるため、このトランザクションは
+    # カタログの更新だけで終わり、ACCESS EXCLUSIVE ロックはすぐに解放される
+    _lock_tables()
+    for name, table, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+
+    for table, columns in COLUMNS.items():
+        op.execute(f'DROP TRIGGER {_trigger(table)} ON {table}')
+        op.execute(f'DROP FUNCTION {_trigger(table)}()')
+        for column in columns:
+            # 古い列を削除すると、その列の主キーとインデックスも削除される
+            op.drop_column(table, column)
+            op.alter_column(
+                table, _shadow(column), new_column_name=column, nullable=False
+            )
+            op.drop_constraint(_not_null_check(table, column), table, type_='check')
+        op.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey '
+            f'PRIMARY KEY USING INDEX {table}_{_shadow("id")}_key'
+        )
+
+    for name, _, _ in INDEXES:
+        op.execute(f'ALTER INDEX {_shadow(name)} RENAME TO {name}')
+
+    # NOT VALID で付け直すと既存行の検査を行わないため、ロックはすぐに解放される
+    for name, table, column, referent in FOREIGN_KEYS:
+        op.create_foreign_key(
+            name, table, referent, [column], ['id'], postgresql_not_valid=True
+        )
+
+
+def _validate_foreign_keys() -> None:
+    # VALIDATE CONSTRAINT は SHARE UPDATE EXCLUSIVE ロックしか取らないため、
+    # 既存行の検査中も読み書きを止めない
+    for name, table, _, _ in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def _convert(old_type: str, new_type: str) -> None:
+    _add_shadow_columns(new_type)
+    with op.get_context().autocommit_block():
+        _backfill(old_type, new_type)
+        _prepare_constraints_and_indexes()
+    _swap_columns()
+    with op.get_context().autocommit_block():
+        _validate_foreign_keys()
+
+
+def upgrade() -> None:
+    _convert('varchar', 'uuid')
+
+
+def downgrade() -> None:
+    _convert('uuid', 'varchar')
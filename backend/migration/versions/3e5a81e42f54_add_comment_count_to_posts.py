@@ -0,0 +1,69 @@
+"""add comment_count to posts
+
+Revision ID: 3e5a81e42f54
+Revises: 2759a332ca54
+Create Date: 2026-10-17 11:42:08.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e5a81e42f54'
+down_revision: Union[str, None] = '2759a332ca54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# 1回のUPDATEで集計し直す投稿の件数
+BACKFILL_BATCH_SIZE = 10000
+
+# id順に投稿を区切り、区間内の投稿のコメント数を数え直す。
+# 区間の最後のidを返し、次の区間の始点に使う
+BACKFILL = sa.text(
+    """
+    WITH batch AS (
+        SELECT id FROM posts
+        WHERE CAST(:after AS uuid) IS NULL OR id > CAST(:after AS uuid)
+        ORDER BY id
+        LIMIT :limit
+    ),
+    counts AS (
+        SELECT batch.id, count(comments.id) AS comment_count
+        FROM batch LEFT JOIN comments ON comments.post_id = batch.id
+        GROUP BY batch.id
+    ),
+    updated AS (
+        UPDATE posts SET comment_count = counts.comment_count
+        FROM counts
+        WHERE posts.id = counts.id AND posts.comment_count <> counts.comment_count
+    )
+    SELECT id::text FROM batch ORDER BY id DESC LIMIT 1
+    """
+)
+
+
+def upgrade() -> None:
+    # PostgreSQL 11以降では定数のデフォルト値を持つカラムの追加はテーブルを書き換えない
+    op.add_column(
+        'posts',
+        sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False),
+    )
+
+    # 区間ごとにコミットし、投稿の行ロックを長時間保持しないようにする
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        after = None
+        while True:
+            after = connection.execute(
+                BACKFILL, {'after': after, 'limit': BACKFILL_BATCH_SIZE}
+            ).scalar()
+            if after is None:
+                break
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'comment_count')
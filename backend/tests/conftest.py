@@ -0,0 +1,108 @@
+"""テスト全体で使うフィクスチャ
+
+app.testing.query_budget を有効にし、テスト中のリクエストがエンドポイントに
+宣言したSQL文の件数の予算を超えた場合はテストを失敗させる。
+
+DBを使うテストは、設定の接続先のデータベース名に _test を付けたデータベースを
+作り直し、マイグレーションを適用してから実行する。
+"""
+
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.engine import make_url
+
+pytest_plugins = ["app.testing.query_budget", "pytester"]
+
+BACKEND_DIR = Path(__file__).parents[1]
+
+
+def _clear_cached_settings() -> None:
+    from app.core.config import get_settings
+    from app.db import session
+
+    get_settings.cache_clear()
+    for factory in (
+        session.get_engine,
+        session.get_session_local,
+        session.get_async_engine,
+        session.get_async_session_local,
+        session.get_read_replicas,
+    ):
+        factory.cache_clear()
+
+
+@pytest.fixture(scope="session")
+def database() -> Iterator[Engine]:
+    """テスト用のデータベースを作り直してマイグレーションを適用する
+
+    Yields:
+        Engine: テスト用のデータベースの同期エンジン
+    """
+    from app.core.config import Settings
+
+    url = make_url(Settings().SQLALCHEMY_DATABASE_URI)
+    test_url = url.set(database=f"{url.database}_test")
+    maintenance = create_engine(
+        url.set(database="postgres"), isolation_level="AUTOCOMMIT"
+    )
+    with maintenance.connect() as connection:
+        connection.execute(
+            text(f'DROP DATABASE IF EXISTS "{test_url.database}" WITH (FORCE)')
+        )
+        connection.execute(text(f'CREATE DATABASE "{test_url.database}"'))
+    maintenance.dispose()
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv(
+            "SQLALCHEMY_DATABASE_URI", test_url.render_as_string(hide_password=False)
+        )
+        monkeypatch.delenv("SQLALCHEMY_ASYNC_DATABASE_URI", raising=False)
+        monkeypatch.setenv("SQLALCHEMY_REPLICA_URIS", "[]")
+        _clear_cached_settings()
+
+        config = Config()
+        config.set_main_option("script_location", str(BACKEND_DIR / "migration"))
+        config.set_main_option("sqlalchemy.url", "%(DB_URL)s")
+        command.upgrade(config, "head")
+
+        from app.db.session import get_engine
+
+        yield get_engine()
+        get_engine().dispose()
+    _clear_cached_settings()
+
+
+@pytest.fixture(scope="session")
+def seeded(database: Engine) -> Engine:
+    """ベンチマークと同じ生成器で、件数に偏りのあるデータを投入する
+
+    Returns:
+        Engine: テスト用のデータベースの同期エンジン
+    """
+    from benchmarks.seed import seed
+
+    seed(
+        users=20_000,
+        posts=10_000,
+        comments=50_000,
+        skew=1.1,
+        days=365,
+        random_seed=0,
+        truncate=True,
+    )
+    return database
+
+
+@pytest.fixture
+def client(seeded: Engine) -> Iterator[TestClient]:
+    """投入済みのデータベースに接続するアプリのクライアント"""
+    from app.main import create_app
+
+    with TestClient(create_app()) as client:
+        yield client
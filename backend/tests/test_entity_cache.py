@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+from typing import Any
+
+from app import models
+from app.core.cache import EntityCache
+from app.crud.cache import get_cached_by_id
+from app.db.ids import new_id
+
+
+class SlowSession:
+    """SELECTの結果を返す前に、テストが release を呼ぶまで待つセッション"""
+
+    def __init__(self, instance: Any) -> None:
+        self.instance = instance
+        self.info: dict = {}
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def scalar(self, statement: Any) -> Any:
+        self.started.set()
+        await self.release.wait()
+        return self.instance
+
+
+def make_post(post_id: str, title: str) -> models.Post:
+    now = datetime(2024, 1, 1)
+    return models.Post(
+        id=post_id,
+        user_id=new_id(),
+        title=title,
+        content="content",
+        comment_count=0,
+        created_at=now,
+        updated_at=now,
+    )
+
+
+def make_cache() -> EntityCache:
+    return EntityCache("post", max_size=2, ttl_seconds=60)
+
+
+def test_lookup_in_flight_during_invalidation_is_not_cached() -> None:
+    cache = make_cache()
+    post_id = new_id()
+    # 更新前の行を読んでいる途中で、更新がコミットされて invalidate される
+    session = SlowSession(make_post(post_id, "before update"))
+
+    async def run() -> models.Post:
+        lookup = asyncio.create_task(
+            get_cached_by_id(session, cache, models.Post, post_id)
+        )
+        await session.started.wait()
+        cache.invalidate(post_id)
+        session.release.set()
+        return await lookup
+
+    post = asyncio.run(run())
+
+    assert post.title == "before update"
+    assert cache.get(post_id) is None
+
+
+def test_lookup_without_invalidation_is_cached() -> None:
+    cache = make_cache()
+    post_id = new_id()
+    session = SlowSession(make_post(post_id, "title"))
+    session.release.set()
+
+    asyncio.run(get_cached_by_id(session, cache, models.Post, post_id))
+
+    assert cache.get(post_id)["title"] == "title"
+
+
+def test_invalidations_forgotten_beyond_max_size_still_block_stale_values() -> None:
+    # 記録しきれずに追い出した invalidate より前に読み始めた値も保存しない
+    cache = make_cache()
+    post_id = new_id()
+    generation = cache.generation()
+    for key in (post_id, new_id(), new_id()):
+        cache.invalidate(key)
+
+    cache.set(post_id, {"title": "stale"}, generation)
+    assert cache.get(post_id) is None
+
+    cache.set(post_id, {"title": "fresh"}, cache.generation())
+    assert cache.get(post_id) == {"title": "fresh"}
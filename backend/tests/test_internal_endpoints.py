@@ -0,0 +1,53 @@
+from typing import Iterator, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+
+from app.core.config import get_settings
+
+INTERNAL_PATHS = ["/metrics", "/api/v1/internal/pool"]
+
+
+@pytest.fixture
+def internal_client(
+    database: Engine, monkeypatch: pytest.MonkeyPatch, request: pytest.FixtureRequest
+) -> Iterator[TestClient]:
+    """運用向けエンドポイントの設定を変えて作成したアプリのクライアント"""
+    from app.main import create_app
+
+    enabled, token = request.param
+    monkeypatch.setenv("INTERNAL_ENDPOINTS_ENABLED", str(enabled))
+    if token is not None:
+        monkeypatch.setenv("INTERNAL_ENDPOINTS_TOKEN", token)
+    get_settings.cache_clear()
+    try:
+        with TestClient(create_app()) as client:
+            yield client
+    finally:
+        monkeypatch.undo()
+        get_settings.cache_clear()
+
+
+@pytest.mark.parametrize("internal_client", [(False, None)], indirect=True)
+@pytest.mark.parametrize("path", INTERNAL_PATHS)
+def test_internal_endpoints_are_disabled_by_default(
+    internal_client: TestClient, path: str
+) -> None:
+    assert internal_client.get(path).status_code == 404
+
+
+@pytest.mark.parametrize("internal_client", [(True, "secret")], indirect=True)
+@pytest.mark.parametrize("path", INTERNAL_PATHS)
+@pytest.mark.parametrize(
+    ("authorization", "status_code"),
+    [(None, 401), ("Bearer wrong", 401), ("Bearer secret", 200)],
+)
+def test_internal_endpoints_require_token(
+    internal_client: TestClient,
+    path: str,
+    authorization: Optional[str],
+    status_code: int,
+) -> None:
+    headers = {"Authorization": authorization} if authorization else {}
+    assert internal_client.get(path, headers=headers).status_code == status_code
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+import pytest
+
+from app.db.ids import new_id
+from app.db.pagination import Cursor, _encode, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip() -> None:
+    cursor = Cursor(created_at=datetime(2024, 1, 1, 12, 30), id=new_id())
+
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "not-a-cursor",
+        _encode(["2024-01-01T00:00:00", "not-a-uuid"]),
+        _encode(["yesterday", "00000000-0000-0000-0000-000000000000"]),
+        # タイムゾーン付きの日時はタイムゾーンなしの列と比較できないため拒否する
+        _encode(["2024-01-01T00:00:00+09:00", "00000000-0000-0000-0000-000000000000"]),
+    ],
+)
+def test_decode_cursor_rejects_invalid_values(value: str) -> None:
+    with pytest.raises(ValueError):
+        decode_cursor(value)
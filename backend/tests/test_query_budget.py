@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+
+from app.db.query_budget import QueryBudgetExceeded
+
+# 予算を宣言したエンドポイントを持つ小さなアプリ（DBにはSQLiteのメモリ上のDBを使う）
+BUDGETED_APP = """
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.db.query_budget import query_budget
+from app.middleware.query_budget import QueryBudgetMiddleware
+
+engine = create_engine("sqlite://")
+app = FastAPI()
+app.add_middleware(QueryBudgetMiddleware, warn=False)
+
+
+@app.get("/items")
+@query_budget({budget})
+def read_items():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("SELECT 1"))
+    return []
+
+
+def test_read_items():
+    assert TestClient(app).get("/items").status_code == 200
+"""
+
+
+@pytest.fixture
+def budgeted_app(pytester: pytest.Pytester, monkeypatch: pytest.MonkeyPatch):
+    # 予算超過の通知がこのテスト自身のフィクスチャに届かないよう、別プロセスで実行する
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).parents[1]))
+    pytester.makeconftest('pytest_plugins = ["app.testing.query_budget"]')
+
+    def run(budget: int) -> pytest.RunResult:
+        pytester.makepyfile(test_budgeted_app=BUDGETED_APP.format(budget=budget))
+        return pytester.runpytest_subprocess("-p", "no:cacheprovider")
+
+    return run
+
+
+def test_request_over_budget_fails_test(budgeted_app) -> None:
+    result = budgeted_app(budget=1)
+
+    result.assert_outcomes(errors=1, passed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*SQL query budget exceeded:*",
+            "*GET /items executed 2 SQL statements (budget: 1)"
+            "; most repeated (2x): SELECT 1",
+        ]
+    )
+
+
+def test_request_within_budget_passes(budgeted_app) -> None:
+    budgeted_app(budget=2).assert_outcomes(passed=1)
+
+
+def test_max_queries_raises_when_exceeded(max_queries) -> None:
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine("sqlite://")
+    with pytest.raises(QueryBudgetExceeded, match="executed 2 SQL statements"):
+        with max_queries(1), engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 1"))
@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, text
+
+from app.core.config import settings
+
+
+@pytest.fixture(scope="module")
+def hot_ids(seeded: Engine) -> dict[str, str]:
+    """コメント数が最も多い投稿と、投稿数が最も多いユーザーのID"""
+    with seeded.connect() as connection:
+        return {
+            "post_id": connection.scalar(
+                text("SELECT id FROM posts ORDER BY comment_count DESC LIMIT 1")
+            ),
+            "user_id": connection.scalar(
+                text(
+                    "SELECT user_id FROM posts GROUP BY user_id "
+                    "ORDER BY count(*) DESC LIMIT 1"
+                )
+            ),
+        }
+
+
+# (パス, 1リクエストのSQL文の件数)。件数はページの行数によらず一定であること
+LIST_ENDPOINTS = [
+    ("/posts/", 1),
+    # ユーザーの存在確認（キャッシュがなければ1件）と投稿の一覧
+    ("/users/{user_id}/posts", 2),
+    # 作成者の名前は結合して取得するため、コメントごとのSELECTは発生しない
+    ("/posts/{post_id}/comments/", 1),
+]
+
+
+@pytest.mark.parametrize("path, statements", LIST_ENDPOINTS)
+@pytest.mark.parametrize("limit", [1, 100])
+def test_list_endpoint_query_count(
+    client: TestClient,
+    hot_ids: dict[str, str],
+    max_queries,
+    path: str,
+    statements: int,
+    limit: int,
+) -> None:
+    url = settings.API_V1_STR + path.format(**hot_ids)
+
+    with max_queries(statements, scope=f"GET {path}"):
+        response = client.get(url, params={"limit": limit})
+
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == limit
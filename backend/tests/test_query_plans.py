@@ -0,0 +1,120 @@
+"""一覧取得のクエリの実行計画の回帰テスト
+
+crudの関数が組み立てたSQL文をそのまま EXPLAIN (FORMAT JSON) にかけ、
+キーセット順のインデックス (0d4fba5410f0) で読まれ、Seq Scanがないことを確認する。
+"""
+
+import asyncio
+from typing import Any, Callable, Iterator
+
+import pytest
+from sqlalchemy import Engine, Executable, text
+
+from app import crud
+from app.db.pagination import Cursor
+
+
+class _CapturingSession:
+    """実行するSQL文を記録するだけで、空の結果を返すセッション"""
+
+    def __init__(self) -> None:
+        self.statements: list[Executable] = []
+
+    async def scalars(self, stmt: Executable) -> "_CapturingSession":
+        self.statements.append(stmt)
+        return self
+
+    async def execute(self, stmt: Executable) -> "_CapturingSession":
+        self.statements.append(stmt)
+        return self
+
+    def all(self) -> list:
+        return []
+
+
+def capture(query: Callable[..., Any], *args: Any) -> Executable:
+    """crudの関数が実行するSQL文を返す"""
+    session = _CapturingSession()
+    asyncio.run(query(session, *args))
+    (stmt,) = session.statements
+    return stmt
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    """実行計画の全てのノードを返す"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@pytest.fixture(scope="module")
+def sample(seeded: Engine) -> dict[str, Any]:
+    """コメント数が最も多い投稿、投稿数が最も多いユーザーと、途中のページのカーソル"""
+    with seeded.connect() as connection:
+        post_id = connection.scalar(
+            text("SELECT id FROM posts ORDER BY comment_count DESC LIMIT 1")
+        )
+        user_id = connection.scalar(
+            text(
+                "SELECT user_id FROM posts GROUP BY user_id "
+                "ORDER BY count(*) DESC LIMIT 1"
+            )
+        )
+        middle = connection.execute(
+            text(
+                "SELECT created_at, id FROM comments WHERE post_id = :post_id "
+                "ORDER BY created_at, id OFFSET 10 LIMIT 1"
+            ),
+            {"post_id": post_id},
+        ).one()
+    return {
+        "post_id": post_id,
+        "user_id": user_id,
+        "cursor": Cursor(created_at=middle.created_at, id=str(middle.id)),
+    }
+
+
+# (crudの関数, 引数を作る関数, 使われるべきインデックス)
+QUERIES = {
+    "get_users": (
+        crud.get_users,
+        lambda sample, after: (20, after),
+        "ix_users_created_at_id",
+    ),
+    "get_posts": (
+        crud.get_posts,
+        lambda sample, after: (20, after),
+        "ix_posts_created_at_id",
+    ),
+    "get_posts_by_user_id": (
+        crud.get_posts_by_user_id,
+        lambda sample, after: (sample["user_id"], 20, after),
+        "ix_posts_user_id_created_at_id",
+    ),
+    "get_comments_for_post": (
+        crud.get_comments_for_post,
+        lambda sample, after: (sample["post_id"], 20, after),
+        "ix_comments_post_id_created_at_id",
+    ),
+}
+
+
+@pytest.mark.parametrize("name", QUERIES)
+@pytest.mark.parametrize("page", ["first", "after_cursor"])
+def test_list_query_uses_keyset_index(
+    seeded: Engine, sample: dict[str, Any], name: str, page: str
+) -> None:
+    query, build_args, index_name = QUERIES[name]
+    after = sample["cursor"] if page == "after_cursor" else None
+    stmt = capture(query, *build_args(sample, after))
+
+    with seeded.connect() as connection:
+        compiled = stmt.compile(dialect=connection.dialect)
+        (plan,) = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        ).scalar()
+
+    nodes = list(plan_nodes(plan["Plan"]))
+    scans = [(node["Node Type"], node.get("Relation Name")) for node in nodes]
+    assert not [scan for scan in scans if scan[0] == "Seq Scan"], scans
+    assert index_name in {node.get("Index Name") for node in nodes}, scans
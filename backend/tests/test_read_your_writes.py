@@ -0,0 +1,126 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api import deps
+from app.crud import get_post_cache, get_user_cache
+from app.db.session import get_async_session_local
+from app.middleware.read_your_writes import (
+    COOKIE_NAME,
+    ReadYourWritesMiddleware,
+    is_write_request,
+)
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "expected"),
+    [
+        ("GET", "/api/v1/posts/", False),
+        ("POST", "/api/v1/posts/", True),
+        ("PATCH", "/api/v1/comments/1", True),
+        ("DELETE", "/api/v1/users/1", True),
+        # 本文でIDを受け取るだけの読み取りはPOSTでも書き込みとしない
+        ("POST", "/api/v1/posts:batchGet", False),
+    ],
+)
+def test_is_write_request(method: str, path: str, expected: bool) -> None:
+    assert is_write_request({"method": method, "path": path}) is expected
+
+
+def test_batch_get_does_not_pin_reads_to_primary() -> None:
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware, sticky_seconds=5)
+
+    @app.post("/posts/")
+    def create_post() -> dict:
+        return {}
+
+    @app.post("/posts:batchGet")
+    def batch_get_posts() -> dict:
+        return {}
+
+    with TestClient(app) as client:
+        assert COOKIE_NAME in client.post("/posts/").cookies
+        assert COOKIE_NAME not in client.post("/posts:batchGet").cookies
+
+
+@pytest.mark.parametrize(
+    ("path", "table", "column"),
+    [("/api/v1/posts/{id}", "posts", "title"), ("/api/v1/users/{id}", "users", "name")],
+)
+def test_sticky_reads_bypass_the_entity_cache(
+    client: TestClient, seeded: Engine, path: str, table: str, column: str
+) -> None:
+    with seeded.begin() as connection:
+        entity_id, original = connection.execute(
+            text(f"SELECT id, {column} FROM {table} ORDER BY id LIMIT 1")
+        ).one()
+    url = path.format(id=entity_id)
+    assert client.get(url).json()[column] == original
+
+    # 他のワーカーでの更新を再現するため、このワーカーのキャッシュを無効化せずに更新する
+    with seeded.begin() as connection:
+        connection.execute(
+            text(f"UPDATE {table} SET {column} = 'updated elsewhere' WHERE id = :id"),
+            {"id": entity_id},
+        )
+    try:
+        assert client.get(url).json()[column] == original
+        client.cookies.set(COOKIE_NAME, str(time.time() + 60))
+        assert client.get(url).json()[column] == "updated elsewhere"
+    finally:
+        with seeded.begin() as connection:
+            connection.execute(
+                text(f"UPDATE {table} SET {column} = :value WHERE id = :id"),
+                {"id": entity_id, "value": original},
+            )
+        get_post_cache().clear()
+        get_user_cache().clear()
+
+
+def test_read_session_factory_follows_sticky_cookie(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    replica = async_sessionmaker()
+    monkeypatch.setattr(
+        deps, "get_read_replicas", lambda: SimpleNamespace(choose=lambda: replica)
+    )
+
+    def make_request(cookie: str) -> Request:
+        return Request({"type": "http", "headers": [(b"cookie", cookie.encode())]})
+
+    sticky = make_request(f"{COOKIE_NAME}={time.time() + 60}")
+    assert deps.get_read_session_factory(sticky) is get_async_session_local()
+    assert deps.get_read_session_factory(make_request("")) is replica
+
+
+def test_comment_export_streams_from_the_session_factory_it_checked(
+    client: TestClient, seeded: Engine
+) -> None:
+    with seeded.connect() as connection:
+        post_id = connection.execute(
+            text("SELECT id FROM posts WHERE comment_count > 0 LIMIT 1")
+        ).scalar()
+    opened = []
+
+    def session_factory() -> AsyncSession:
+        opened.append(True)
+        return get_async_session_local()()
+
+    client.app.dependency_overrides[deps.get_read_session_factory] = lambda: (
+        session_factory
+    )
+    try:
+        response = client.get(f"/api/v1/posts/{post_id}/comments/export")
+    finally:
+        client.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.text
+    # 投稿の存在確認と出力の両方が、同じ依存性で選んだ接続先から読む
+    assert len(opened) == 2
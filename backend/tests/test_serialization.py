@@ -0,0 +1,27 @@
+from typing import Optional
+
+import pytest
+from starlette.requests import Request
+
+from app.api.serialization import JSON_MEDIA_TYPE, negotiate_media_type
+
+
+def make_request(accept: Optional[str]) -> Request:
+    headers = [] if accept is None else [(b"accept", accept.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "accept",
+    [
+        None,
+        "*/*",
+        "application/json",
+        # 応答できる形式を含まない場合も406ではなくJSONで返す
+        "text/plain",
+        "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "text/html",
+    ],
+)
+def test_negotiate_media_type_falls_back_to_json(accept: Optional[str]) -> None:
+    assert negotiate_media_type(make_request(accept)) == JSON_MEDIA_TYPE
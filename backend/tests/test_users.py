@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, text
+
+
+def test_users_without_ids_redirects_to_listing(client: TestClient) -> None:
+    # ids のない GET /users は、一括取得の追加前と同じく一覧へリダイレクトする
+    response = client.get("/api/v1/users?limit=2", follow_redirects=False)
+
+    assert response.status_code == 307
+    assert response.headers["location"].endswith("/api/v1/users/?limit=2")
+
+    page = client.get("/api/v1/users?limit=2").json()
+    assert len(page["items"]) == 2
+
+
+def test_users_with_ids_returns_batch(client: TestClient, seeded: Engine) -> None:
+    with seeded.connect() as connection:
+        user_id = connection.execute(text("SELECT id FROM users LIMIT 1")).scalar()
+
+    response = client.get("/api/v1/users", params={"ids": str(user_id)})
+
+    assert response.status_code == 200
+    assert [user["id"] for user in response.json()["items"]] == [str(user_id)]
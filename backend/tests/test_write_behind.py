@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+from app.db.write_behind import JsonLinesSpill, WriteBehindBuffer
+
+
+class FlakyFlush:
+    """最初の failures 回は失敗し、その後は書き込んだ行を記録する flush"""
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.rows: list[dict] = []
+
+    async def __call__(self, batch: list[dict]) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("database is unavailable")
+        self.rows.extend(batch)
+
+
+def make_buffer(flush: FlakyFlush, **options) -> WriteBehindBuffer[dict]:
+    return WriteBehindBuffer(
+        "test",
+        flush,
+        max_batch=10,
+        flush_interval_seconds=0.001,
+        max_queue=options.pop("max_queue", 100),
+        enqueue_timeout_seconds=options.pop("enqueue_timeout_seconds", 1.0),
+        retry_backoff_seconds=0.001,
+        **options,
+    )
+
+
+def test_failed_flush_is_retried() -> None:
+    flush = FlakyFlush(failures=2)
+    buffer = make_buffer(flush, max_attempts=3)
+
+    async def run() -> None:
+        buffer.start()
+        assert await buffer.put({"id": 1})
+        await buffer.stop()
+
+    asyncio.run(run())
+
+    assert flush.rows == [{"id": 1}]
+    assert buffer.stats.retried == 2
+    assert buffer.stats.failed == 0
+
+
+def test_rows_are_kept_until_the_flush_succeeds() -> None:
+    # 退避先がなければ、書き込み直しの回数を使い切っても破棄せずに書き込み直し続ける
+    flush = FlakyFlush(failures=5)
+    buffer = make_buffer(flush, max_attempts=2)
+
+    async def run() -> None:
+        buffer.start()
+        assert await buffer.put({"id": 1})
+        while not flush.rows:
+            await asyncio.sleep(0.001)
+        await buffer.stop()
+
+    asyncio.run(run())
+
+    assert flush.rows == [{"id": 1}]
+    assert buffer.stats.failed == 0
+
+
+def test_spilled_rows_are_replayed_on_next_start(tmp_path: Path) -> None:
+    spill = JsonLinesSpill(
+        tmp_path / "spill.jsonl",
+        lambda row: {**row, "created_at": datetime.fromisoformat(row["created_at"])},
+    )
+    row = {"id": 1, "created_at": datetime(2024, 1, 1, 12, 30)}
+
+    failing = FlakyFlush(failures=100)
+    buffer = make_buffer(failing, max_attempts=2, spill=spill)
+
+    async def put_and_stop() -> None:
+        buffer.start()
+        assert await buffer.put(row)
+        await buffer.stop()
+
+    asyncio.run(put_and_stop())
+    assert buffer.stats.spilled == 1
+    assert failing.rows == []
+
+    recovered = FlakyFlush(failures=0)
+    buffer = make_buffer(recovered, spill=spill)
+
+    async def restart() -> None:
+        buffer.start()
+        await buffer.stop()
+
+    asyncio.run(restart())
+    assert recovered.rows == [row]
+    assert spill.take() == []
+
+
+def test_stop_does_not_lose_rows_from_blocked_putters() -> None:
+    # キューが満杯で待っている put は、stop の後に受け付けられて失われることがない
+    flush = FlakyFlush(failures=0)
+    buffer = make_buffer(flush, max_queue=1)
+
+    async def run() -> list[bool]:
+        buffer.start()
+        puts = [asyncio.create_task(buffer.put({"id": index})) for index in range(20)]
+        await asyncio.sleep(0)
+        await buffer.stop()
+        return await asyncio.gather(*puts)
+
+    accepted = asyncio.run(run())
+
+    assert [row["id"] for row in flush.rows] == [
+        index for index, ok in enumerate(accepted) if ok
+    ]
+    assert not all(accepted)